@@ -0,0 +1,129 @@
+"""Compare the threaded and asyncio bus schedulers.
+
+Reports CPU time, threads, event loop wakeups (callbacks handed to the loop
+from other threads or timers) and switch/input latencies with 8 chips.
+
+Run from the repository root:
+    python -m benchmarks.bench_backend [seconds]
+"""
+
+import asyncio
+import random
+import sys
+import threading
+import time
+
+from custom_components.mcp23017 import MCP23017
+from custom_components.mcp23017.bus import MCP23017AsyncBus, MCP23017Bus
+from custom_components.mcp23017.metrics import Histogram
+
+from .fake_smbus import FakeSMBus
+
+CHIPS = 8
+
+
+class FakeHass:
+    """The parts of HomeAssistant used by the bus schedulers."""
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def async_create_background_task(self, target, name):
+        return self.loop.create_task(target, name=name)
+
+
+def count_wakeups(loop):
+    """Count callbacks scheduled from threads and timers on loop."""
+    counter = {"wakeups": 0}
+    for name in ("call_soon_threadsafe", "call_at"):
+        method = getattr(loop, name)
+
+        def wrapper(*args, _method=method, **kwargs):
+            counter["wakeups"] += 1
+            return _method(*args, **kwargs)
+
+        setattr(loop, name, wrapper)
+    return counter
+
+
+async def bench(backend, seconds):
+    loop = asyncio.get_running_loop()
+    hass = FakeHass(loop)
+    bus = FakeSMBus()
+    if backend == "asyncio":
+        scheduler = MCP23017AsyncBus(hass, 1, smbus=bus)
+    else:
+        scheduler = MCP23017Bus(1, smbus=bus)
+    input_latency = Histogram()
+    changed = {}
+
+    def on_input(state, address):
+        if address in changed:
+            input_latency.add(time.monotonic() - changed.pop(address))
+
+    chips = []
+    for i in range(CHIPS):
+        chip = MCP23017(hass, "/dev/i2c-1@0x%02x" % (0x20 + i), smbus=bus)
+        chip._input_callbacks[15] = lambda state, address=chip.address: on_input(state, address)
+        scheduler.add_device(chip)
+        chips.append(chip)
+    counter = count_wakeups(loop)
+    scheduler.start_polling()
+    # Let the initial configuration settle
+    while any(chip._to_init for chip in chips):
+        await asyncio.sleep(0.1)
+
+    threads = threading.active_count()
+    counter["wakeups"] = 0
+    cpu = time.process_time()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        await asyncio.sleep(random.uniform(0.02, 0.1))
+        chip = random.choice(chips)
+        if random.random() < 0.5:
+            pin = 1 << random.randrange(8)
+            chip.setOutputs(pin, ~chip._new_switches_states[0] & pin)
+        elif chip.address not in changed:
+            bus.registers[chip.address][MCP23017.GPIOB] ^= 0x80
+            changed[chip.address] = time.monotonic()
+    cpu = time.process_time() - cpu
+    wakeups = counter["wakeups"]
+    await loop.run_in_executor(None, scheduler.stop_polling)
+
+    write_latency = Histogram()
+    for chip in chips:
+        for bound, count in zip(Histogram.BOUNDS + (chip.write_latency.max,), chip.write_latency._buckets):
+            for _ in range(count):
+                write_latency.add(bound or 0)
+    return {
+        "cpu": cpu / seconds * 100,
+        "threads": threads,
+        "wakeups": wakeups / seconds,
+        "switch_p50": write_latency.percentile(50) * 1000,
+        "input_p50": input_latency.percentile(50) * 1000,
+    }
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(
+        "%-10s %10s %10s %12s %16s %16s"
+        % ("backend", "cpu (%)", "threads", "wakeups/s", "switch p50 (ms)", "input p50 (ms)")
+    )
+    for backend in ("thread", "asyncio"):
+        result = asyncio.run(bench(backend, seconds))
+        print(
+            "%-10s %10.2f %10d %12.1f %16.2f %16.2f"
+            % (
+                backend,
+                result["cpu"],
+                result["threads"],
+                result["wakeups"],
+                result["switch_p50"],
+                result["input_p50"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
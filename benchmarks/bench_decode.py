@@ -0,0 +1,83 @@
+"""Measure the CPU cost of decoding input changes per poll cycle.
+
+Compares the bit iteration of MCP23017.updateInputs with the former
+string-based decoding, when no input changes and when all inputs change.
+
+Run from the repository root:
+    python -m benchmarks.bench_decode [cycles]
+"""
+
+import sys
+import time
+
+from custom_components.mcp23017 import MCP23017
+
+
+class FakeBinarySensor:
+    """Stand-in for MCP23017BinarySensor in the former decoding."""
+
+    async def async_push_update(self, state):
+        pass
+
+
+FakeBinarySensor.__name__ = "MCP23017BinarySensor"
+
+
+def legacy_decode(entities, last_state, new_state, push):
+    """Former decoding of MCP23017.run, for reference."""
+    for port in range(2):
+        status = new_state[port]
+        changes = last_state[port] ^ status
+        if changes != 0:
+            pin_nb = 0
+            statusStr = bin(status)[2:].rjust(8, "0")[::-1]
+            for s in bin(changes)[2:].rjust(8, "0")[::-1]:
+                if s == "1":
+                    if type(entities[pin_nb + port * 8]).__name__ == "MCP23017BinarySensor":
+                        push(entities[pin_nb + port * 8], statusStr[pin_nb] == "1")
+                pin_nb += 1
+
+
+def bench_legacy(states, cycles):
+    entities = [FakeBinarySensor() for _ in range(16)]
+    pushes = []
+    push = lambda entity, state: pushes.append(state)
+    last = [0, 0]
+    start = time.perf_counter()
+    for i in range(cycles):
+        new = states[i % 2]
+        legacy_decode(entities, last, new, push)
+        last = new
+    return (time.perf_counter() - start) / cycles * 1e6, len(pushes) / cycles
+
+
+def bench_bitmask(states, cycles):
+    chip = MCP23017(None, "/dev/i2c-1@0x20", smbus=object())
+    chip._last_state = [0, 0]
+    chip._io_dir = [0xFF, 0xFF]
+    for pin in range(16):
+        chip._input_callbacks[pin] = FakeBinarySensor().async_push_update
+    pushes = 0
+    start = time.perf_counter()
+    for i in range(cycles):
+        chip.updateInputs(states[i % 2])
+        # Entity updates, without the push latency measure (sent to the event loop by the bus)
+        pushes += len(chip.takePushes()) - 1 if chip._pushes else 0
+    return (time.perf_counter() - start) / cycles * 1e6, pushes / cycles
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    scenarios = (
+        ("no change", ([0, 0], [0, 0])),
+        ("all change", ([0xFF, 0xFF], [0, 0])),
+    )
+    print("%-12s %-10s %14s %14s" % ("scenario", "decoder", "us/cycle", "pushes/cycle"))
+    for name, states in scenarios:
+        for decoder, function in (("string", bench_legacy), ("bitmask", bench_bitmask)):
+            usec, pushes = function(states, cycles)
+            print("%-12s %-10s %14.3f %14.1f" % (name, decoder, usec, pushes))
+
+
+if __name__ == "__main__":
+    main()
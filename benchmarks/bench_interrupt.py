@@ -0,0 +1,69 @@
+"""Compare idle I2C traffic and input latency of polling and interrupt modes.
+
+Run from the repository root:
+    python -m benchmarks.bench_interrupt [edges]
+"""
+
+import statistics
+import sys
+import time
+
+from custom_components.mcp23017 import MCP23017
+from custom_components.mcp23017.bus import MCP23017Bus
+from custom_components.mcp23017.const import DEFAULT_SCAN_RATE
+from custom_components.mcp23017.interrupt import SimulatedEdgeSource
+
+from .fake_smbus import FakeSMBus
+
+
+def idle_traffic(chip, bus, seconds):
+    """Return I2C transactions per second while inputs do not change."""
+    bus.reset_counters()
+    time.sleep(seconds)
+    return bus.transactions / seconds
+
+
+def latency(chip, bus, edge_source, edges):
+    """Return latencies (ms) between an input change and its read on the bus."""
+    samples = []
+    for i in range(edges):
+        time.sleep(0.05)
+        before = bus.transactions
+        start = time.perf_counter()
+        bus.registers[chip.address][MCP23017.GPIOA] ^= 0x01
+        if edge_source is not None:
+            bus.registers[chip.address][MCP23017.INTFA] = 0x01
+            edge_source.trigger()
+        while bus.transactions == before:
+            time.sleep(0.0001)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench(edge_source, edges):
+    bus = FakeSMBus()
+    scheduler = MCP23017Bus(1, smbus=bus)
+    chip = MCP23017(None, "/dev/i2c-1@0x20", smbus=bus)
+    chip.setEdgeSource(edge_source)
+    scheduler.add_device(chip)
+    scheduler.start_polling()
+    try:
+        # Let the initial configuration settle
+        time.sleep(1.5)
+        idle = idle_traffic(chip, bus, 2 * DEFAULT_SCAN_RATE * 5)
+        samples = latency(chip, bus, edge_source, edges)
+    finally:
+        scheduler.stop_polling()
+    return idle, statistics.median(samples), max(samples)
+
+
+def main():
+    edges = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print("%-12s %14s %14s %14s" % ("mode", "idle trans/s", "p50 lat (ms)", "max lat (ms)"))
+    for name, edge_source in (("polling", None), ("interrupt", SimulatedEdgeSource())):
+        idle, p50, worst = bench(edge_source, edges)
+        print("%-12s %14.2f %14.2f %14.2f" % (name, idle, p50, worst))
+
+
+if __name__ == "__main__":
+    main()
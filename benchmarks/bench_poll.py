@@ -0,0 +1,60 @@
+"""Measure I2C transactions and bytes per poll cycle of MCP23017.
+
+Run from the repository root:
+    python -m benchmarks.bench_poll [cycles]
+"""
+
+import sys
+import time
+
+from custom_components.mcp23017 import MCP23017
+from custom_components.mcp23017.bus import MCP23017Bus
+
+from .fake_smbus import FakeSMBus
+
+
+def bench(block_read, cycles):
+    bus = FakeSMBus()
+    chip = MCP23017(None, "/dev/i2c-1@0x20", smbus=bus)
+    chip._block_read = block_read
+    # Initial configuration is not part of the steady state
+    chip.confGPIO()
+    bus.reset_counters()
+
+    start = time.perf_counter()
+    for _ in range(cycles):
+        chip.poll()
+    elapsed = time.perf_counter() - start
+    return bus.transactions / cycles, bus.bytes / cycles, elapsed / cycles * 1e6
+
+
+def bench_bus(chips, cycles):
+    """Tick a bus scheduler driving several chips."""
+    bus = FakeSMBus()
+    scheduler = MCP23017Bus(1, smbus=bus)
+    for i in range(chips):
+        chip = MCP23017(None, "/dev/i2c-1@0x%02x" % (0x20 + i), smbus=bus)
+        chip.confGPIO()
+        scheduler.add_device(chip)
+    bus.reset_counters()
+    for _ in range(cycles):
+        scheduler.tick(scheduler.devices)
+    timing = scheduler.timing
+    return bus.transactions / cycles, timing["tick_duration_avg"] * 1e6, timing["tick_duration_max"] * 1e6
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print("%-12s %14s %14s %14s" % ("mode", "trans/cycle", "bytes/cycle", "us/cycle"))
+    for name, block_read in (("byte", False), ("block", True)):
+        trans, nbytes, usec = bench(block_read, cycles)
+        print("%-12s %14.2f %14.2f %14.2f" % (name, trans, nbytes, usec))
+    print()
+    print("%-12s %14s %14s %14s" % ("bus", "trans/tick", "avg us/tick", "max us/tick"))
+    for chips in (1, 8):
+        trans, avg, worst = bench_bus(chips, cycles)
+        print("%-12s %14.2f %14.2f %14.2f" % ("%d chips" % chips, trans, avg, worst))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""End-to-end benchmark of the bus schedulers against simulated MCP23017 chips.
+
+Each chip has 8 switches (port A) and 8 inputs (port B), 8 chips per bus.
+Scenarios: 1, 8 and 64 chips with idle inputs, flapping inputs (200 changes
+per second) and switch storms (500 commands per second). Reports I2C
+transactions per second, process CPU time per chip poll, event loop wakeups,
+switch (command to OLAT write) and input (pin change to entity update)
+latency percentiles, and input changes still unreported at the end.
+
+Run from the repository root:
+    python -m benchmarks.bench_suite [--seconds 5] [--interrupt] [--latency 0.0002] [--backend thread]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from custom_components.mcp23017 import MCP23017
+from custom_components.mcp23017.bus import MCP23017AsyncBus, MCP23017Bus
+from custom_components.mcp23017.const import DEFAULT_SCAN_CLASS, SCAN_CLASSES
+from custom_components.mcp23017.interrupt import SimulatedEdgeSource
+from custom_components.mcp23017.metrics import Histogram
+
+from .bench_backend import FakeHass, count_wakeups
+from .mcp23017_sim import SimulatedIntLine, SimulatedSMBus
+
+CHIPS_PER_BUS = 8
+SCENARIOS = [
+    (chips, load)
+    for chips in (1, 8, 64)
+    for load in ("idle", "flapping", "switch_storm")
+]
+# Changes and commands per second of the flapping and switch storm loads
+FLAPPING_RATE = 200
+STORM_RATE = 500
+
+
+class EntryInfos:
+    """Options of a stand-in entity."""
+
+    options = {}
+
+
+class MCP23017BinarySensor:
+    """Input entity stand-in (the chip dispatches on the entity class name)."""
+
+    _pullup = "UP"
+    _invert_logic = False
+    _entry_infos = EntryInfos()
+    raw_state = True
+    input_filter = None
+    gesture_detector = None
+    scan_rates = SCAN_CLASSES[DEFAULT_SCAN_CLASS]
+
+    def __init__(self, pin, async_update_state):
+        self.pin = pin
+        self.name = "input %d" % pin
+        self.async_update_state = async_update_state
+
+
+class MCP23017Switch:
+    """Switch entity stand-in."""
+
+    _pullup = "UP"
+    _invert_logic = False
+    _hw_sync = True
+    _hw_follow = False
+    _entry_infos = EntryInfos()
+    device = None
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.name = "switch %d" % pin
+
+    def set_state(self, state):
+        pass
+
+    def async_adopt_state(self, state):
+        pass
+
+
+def count_polls(chip, counter):
+    """Count the polls of chip."""
+    poll = chip.poll
+
+    def wrapper(*args, **kwargs):
+        counter["polls"] += 1
+        return poll(*args, **kwargs)
+
+    chip.poll = wrapper
+
+
+def merge(histograms):
+    """Return the sum of histograms with the same bounds."""
+    total = Histogram()
+    for histogram in histograms:
+        total._buckets = [a + b for a, b in zip(total._buckets, histogram._buckets)]
+        total.count += histogram.count
+        total.total += histogram.total
+        for value in (histogram.min, histogram.max):
+            if value is not None:
+                total.min = value if total.min is None else min(total.min, value)
+                total.max = value if total.max is None else max(total.max, value)
+    return total
+
+
+async def bench(chips_count, load, args):
+    loop = asyncio.get_running_loop()
+    hass = FakeHass(loop)
+    input_latency = Histogram()
+    changed = {}
+    polls = {"polls": 0}
+
+    # Last state reported of each input, unreported changes: (time, level)
+    reported = {}
+
+    def on_input(state, key):
+        reported[key] = state
+        if key in changed and changed[key][1] == state:
+            input_latency.add(time.monotonic() - changed.pop(key)[0])
+
+    schedulers = []
+    sim_buses = []
+    chips = []
+    for bus_number in range((chips_count + CHIPS_PER_BUS - 1) // CHIPS_PER_BUS):
+        sim_bus = SimulatedSMBus(bus_number, latency=args.latency)
+        if args.backend == "asyncio":
+            scheduler = MCP23017AsyncBus(hass, bus_number, sim_bus)
+        else:
+            scheduler = MCP23017Bus(bus_number, sim_bus)
+        edge_source = SimulatedEdgeSource() if args.interrupt else None
+        int_line = SimulatedIntLine(edge_source) if args.interrupt else None
+        for i in range(min(CHIPS_PER_BUS, chips_count - len(chips))):
+            address = 0x20 + i
+            sim_chip = sim_bus.addChip(address)
+            # Inputs driven high, as pulled up
+            sim_chip.setInputs(1, 0xFF)
+            i2c_address = "/dev/i2c-%d@0x%02x" % (bus_number, address)
+            chip = MCP23017(hass, i2c_address, sim_bus)
+            entities = [MCP23017Switch(pin) for pin in range(8)] + [
+                MCP23017BinarySensor(
+                    pin, lambda state, key=(i2c_address, pin): on_input(state, key)
+                )
+                for pin in range(8, 16)
+            ]
+            chip.register_entities(entities)
+            if int_line is not None:
+                int_line.connect(sim_chip)
+                chip.setEdgeSource(edge_source)
+            count_polls(chip, polls)
+            scheduler.add_device(chip)
+            chips.append((i2c_address, chip, sim_chip))
+        schedulers.append(scheduler)
+        sim_buses.append(sim_bus)
+
+    counter = count_wakeups(loop)
+    for scheduler in schedulers:
+        scheduler.start_polling()
+    # Let the initial configuration and the fast scans of the initial states settle
+    while any(chip._to_init for _, chip, _ in chips):
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(SCAN_CLASSES[DEFAULT_SCAN_CLASS][2] + 0.5)
+
+    for sim_bus in sim_buses:
+        sim_bus.reset_counters()
+    changed.clear()
+    counter["wakeups"] = 0
+    polls["polls"] = 0
+    cpu = time.process_time()
+    start = time.monotonic()
+    end = start + args.seconds
+    while time.monotonic() < end:
+        if load == "flapping":
+            await asyncio.sleep(1 / FLAPPING_RATE)
+            i2c_address, _, sim_chip = random.choice(chips)
+            pin = random.randrange(8, 16)
+            key = (i2c_address, pin)
+            level = not sim_chip._levels[1] & (1 << (pin - 8))
+            sim_chip.setInput(pin, level)
+            if reported.get(key) == level:
+                # Back to the level last reported
+                changed.pop(key, None)
+            else:
+                changed[key] = (time.monotonic(), level)
+        elif load == "switch_storm":
+            await asyncio.sleep(1 / STORM_RATE)
+            _, chip, _ = random.choice(chips)
+            pin = 1 << random.randrange(8)
+            chip.setOutputs(pin, ~chip._new_switches_states[0] & pin)
+        else:
+            await asyncio.sleep(0.1)
+    elapsed = time.monotonic() - start
+    cpu = time.process_time() - cpu
+    wakeups = counter["wakeups"]
+    # Let the last changes be read
+    await asyncio.sleep(0.2)
+    unreported = len(changed)
+    for scheduler in schedulers:
+        await loop.run_in_executor(None, scheduler.stop_polling)
+
+    switch_latency = merge(chip.write_latency for _, chip, _ in chips)
+    return {
+        "transactions": sum(sim_bus.transactions for sim_bus in sim_buses) / elapsed,
+        "cpu_poll": cpu / polls["polls"] * 1e6 if polls["polls"] else 0,
+        "wakeups": wakeups / elapsed,
+        "switch": switch_latency,
+        "input": input_latency,
+        "unreported": unreported,
+    }
+
+
+def ms(histogram, percent):
+    value = histogram.percentile(percent)
+    return "%8.2f" % (value * 1000) if value is not None else "%8s" % "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP23017 end-to-end benchmark suite")
+    parser.add_argument("--seconds", type=float, default=5, help="duration of each scenario")
+    parser.add_argument("--interrupt", action="store_true", help="interrupt mode, one INT line per bus")
+    parser.add_argument("--latency", type=float, default=0.0002, help="simulated I2C transaction time (s)")
+    parser.add_argument("--backend", choices=("thread", "asyncio"), default="thread")
+    args = parser.parse_args()
+
+    print(
+        "%-6s %-13s %10s %12s %10s %17s %17s %11s"
+        % ("chips", "load", "trans/s", "cpu/poll us", "wakeups/s", "switch p50/p99 ms", "input p50/p99 ms", "unreported")
+    )
+    for chips_count, load in SCENARIOS:
+        result = asyncio.run(bench(chips_count, load, args))
+        print(
+            "%-6d %-13s %10.1f %12.1f %10.1f %8s %8s %8s %8s %11d"
+            % (
+                chips_count,
+                load,
+                result["transactions"],
+                result["cpu_poll"],
+                result["wakeups"],
+                ms(result["switch"], 50),
+                ms(result["switch"], 99),
+                ms(result["input"], 50),
+                ms(result["input"], 99),
+                result["unreported"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
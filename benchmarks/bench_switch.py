@@ -0,0 +1,57 @@
+"""Measure the delay between a switch command and its OLAT write.
+
+Run from the repository root:
+    python -m benchmarks.bench_switch [commands]
+"""
+
+import random
+import sys
+import time
+
+from custom_components.mcp23017 import MCP23017
+from custom_components.mcp23017.bus import MCP23017Bus
+
+from .fake_smbus import FakeSMBus
+
+
+def bench(event_driven, commands):
+    bus = FakeSMBus()
+    scheduler = MCP23017Bus(1, smbus=bus)
+    chip = MCP23017(None, "/dev/i2c-1@0x20", smbus=bus)
+    scheduler.add_device(chip)
+    if not event_driven:
+        # Commands wait for the next tick, as before event-driven writes
+        chip._wake = None
+    scheduler.start_polling()
+    try:
+        # Let the initial configuration settle
+        time.sleep(1.5)
+        for i in range(commands):
+            time.sleep(random.uniform(0.01, 0.1))
+            pin = 1 << (i % 8)
+            chip.setOutputs(pin, ~chip._new_switches_states[0] & pin)
+        time.sleep(0.5)
+    finally:
+        scheduler.stop_polling()
+    return chip.write_latency
+
+
+def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print("%-12s %10s %12s %12s %12s" % ("mode", "writes", "p50 (ms)", "p90 (ms)", "max (ms)"))
+    for name, event_driven in (("tick", False), ("event", True)):
+        latency = bench(event_driven, commands)
+        print(
+            "%-12s %10d %12.2f %12.2f %12.2f"
+            % (
+                name,
+                latency.count,
+                latency.percentile(50) * 1000,
+                latency.percentile(90) * 1000,
+                latency.max * 1000,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Fake SMBus counting I2C transactions, used by the benchmarks."""
+
+
+class FakeSMBus:
+    """In-memory MCP23017 register file behind an smbus2.SMBus-like interface.
+
+    Every call is one I2C transaction. Bytes are counted as they appear on the
+    wire: address bytes (including the repeated start of a read), register
+    pointer and data.
+    """
+
+    def __init__(self, bus=1):
+        self.bus = bus
+        self.registers = {}
+        self.transactions = 0
+        self.bytes = 0
+
+    def _reg(self, address):
+        return self.registers.setdefault(address, [0x00] * 0x16)
+
+    def _count(self, nbytes):
+        self.transactions += 1
+        self.bytes += nbytes
+
+    def reset_counters(self):
+        """Reset transaction and byte counters."""
+        self.transactions = 0
+        self.bytes = 0
+
+    def read_byte(self, i2c_addr, force=None):
+        self._count(2)
+        return 0
+
+    def read_byte_data(self, i2c_addr, register, force=None):
+        # S addr+W reg Sr addr+R data P
+        self._count(4)
+        return self._reg(i2c_addr)[register]
+
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        # S addr+W reg data P
+        self._count(3)
+        self._reg(i2c_addr)[register] = value & 0xFF
+
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        self._count(3 + length)
+        regs = self._reg(i2c_addr)
+        return [regs[(register + i) % len(regs)] for i in range(length)]
+
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        self._count(2 + len(data))
+        regs = self._reg(i2c_addr)
+        for i, value in enumerate(data):
+            regs[(register + i) % len(regs)] = value & 0xFF
+
+    def close(self):
+        pass
@@ -0,0 +1,323 @@
+"""Register accurate MCP23017 simulator behind an smbus2.SMBus-like interface, used by the benchmarks."""
+
+import errno
+import threading
+import time
+
+# Register functions, in BANK=0 address order (address = 2 * function + port)
+IODIR, IPOL, GPINTEN, DEFVAL, INTCON, IOCON, GPPU, INTF, INTCAP, GPIO, OLAT = range(11)
+REGISTER_COUNT = 0x16
+
+IOCON_BANK = 0x80
+IOCON_MIRROR = 0x40
+IOCON_SEQOP = 0x20
+IOCON_ODR = 0x04
+IOCON_INTPOL = 0x02
+
+# i2c_msg flag of read messages
+I2C_M_RD = 0x0001
+
+
+class SimulatedMCP23017:
+    """Registers 0x00-0x15 of one MCP23017, with its address pointer and INT outputs.
+
+    Input levels are driven with setInput()/setInputs(), undriven inputs read
+    their pull-up. Registers are addressed as set by IOCON.BANK, the address
+    pointer moves as set by IOCON.SEQOP. Interrupts follow GPINTEN, INTCON and
+    DEFVAL: INTF and INTCAP are latched and cleared by a read of GPIO or INTCAP.
+    on_interrupt is called when the INT output of a port becomes active.
+    """
+
+    def __init__(self, address, on_interrupt=None):
+        self.address = address
+        self.on_interrupt = on_interrupt
+        self._lock = threading.RLock()
+        self._regs = [[0x00, 0x00] for _ in range(11)]
+        self._regs[IODIR] = [0xFF, 0xFF]
+        self._iocon = 0x00
+        self._pointer = 0x00
+        # Levels driven on the pins from outside, and which pins are driven
+        self._levels = [0x00, 0x00]
+        self._driven = [0x00, 0x00]
+        self._gpio = [self._read_pins(port) for port in range(2)]
+        self._int_active = [False, False]
+
+    # Register map
+
+    def _decode(self, register):
+        """Return (function, port) of a register address in the current bank mode, None if unimplemented."""
+        if self._iocon & IOCON_BANK:
+            function, port = register & 0x0F, (register >> 4) & 0x01
+            if function > OLAT or register & 0xE0:
+                return None
+            return function, port
+        if register >= REGISTER_COUNT:
+            return None
+        return register >> 1, register & 0x01
+
+    def _advance(self):
+        """Move the address pointer after a byte, as set by IOCON.SEQOP and IOCON.BANK."""
+        pointer = self._pointer
+        if self._iocon & IOCON_SEQOP:
+            # Byte mode: toggles between the A/B pair in BANK=0, stays in BANK=1
+            if not self._iocon & IOCON_BANK:
+                self._pointer = pointer ^ 0x01
+        elif self._iocon & IOCON_BANK:
+            self._pointer = {0x0A: 0x10, 0x1A: 0x00}.get(pointer, pointer + 1)
+        else:
+            self._pointer = (pointer + 1) % REGISTER_COUNT
+
+    def _read_pins(self, port):
+        """Return the value of GPIO: outputs read OLAT, inputs their level with IPOL applied."""
+        iodir = self._regs[IODIR][port]
+        levels = (self._levels[port] & self._driven[port]) | (self._regs[GPPU][port] & ~self._driven[port])
+        inputs = (levels ^ self._regs[IPOL][port]) & iodir
+        return (inputs | (self._regs[OLAT][port] & ~iodir)) & 0xFF
+
+    def read_register(self, register):
+        """Read a register, with its side effects (interrupt clear)."""
+        with self._lock:
+            decoded = self._decode(register)
+            if decoded is None:
+                return 0x00
+            function, port = decoded
+            if function == IOCON:
+                return self._iocon
+            if function == GPIO:
+                value = self._read_pins(port)
+                self._clear_interrupt(port)
+                return value
+            if function == INTCAP:
+                value = self._regs[INTCAP][port]
+                self._clear_interrupt(port)
+                return value
+            return self._regs[function][port]
+
+    def write_register(self, register, value):
+        """Write a register, read-only registers are left unchanged."""
+        with self._lock:
+            decoded = self._decode(register)
+            if decoded is None:
+                return
+            function, port = decoded
+            value &= 0xFF
+            if function == IOCON:
+                # Bit 0 is unimplemented, IOCONA and IOCONB are the same register
+                self._iocon = value & 0xFE
+            elif function in (INTF, INTCAP):
+                return
+            elif function == GPIO:
+                self._regs[OLAT][port] = value
+            else:
+                self._regs[function][port] = value
+            self._update_pins(port)
+
+    def read(self, length):
+        """Read length bytes from the address pointer."""
+        with self._lock:
+            data = []
+            for _ in range(length):
+                data.append(self.read_register(self._pointer))
+                self._advance()
+            return data
+
+    def write(self, data):
+        """Write a register pointer followed by data bytes."""
+        with self._lock:
+            if not data:
+                return
+            self._pointer = data[0]
+            for value in data[1:]:
+                self.write_register(self._pointer, value)
+                self._advance()
+
+    # Pins and interrupts
+
+    def setInput(self, pin, level):
+        """Drive an input pin high or low."""
+        port, bit = pin // 8, 1 << (pin % 8)
+        with self._lock:
+            self._driven[port] |= bit
+            self._levels[port] = self._levels[port] | bit if level else self._levels[port] & ~bit
+            self._update_pins(port)
+
+    def setInputs(self, port, levels, mask=0xFF):
+        """Drive the pins of mask of a port to levels."""
+        with self._lock:
+            self._driven[port] |= mask
+            self._levels[port] = (self._levels[port] & ~mask) | (levels & mask)
+            self._update_pins(port)
+
+    def releaseInput(self, pin):
+        """Stop driving a pin, which then reads its pull-up."""
+        port, bit = pin // 8, 1 << (pin % 8)
+        with self._lock:
+            self._driven[port] &= ~bit
+            self._update_pins(port)
+
+    def outputs(self, port):
+        """Return the levels of the output pins of a port (OLAT masked by IODIR)."""
+        with self._lock:
+            return self._regs[OLAT][port] & ~self._regs[IODIR][port] & 0xFF
+
+    def _update_pins(self, port):
+        """Latch the interrupts raised by the new value of the pins of a port."""
+        previous, self._gpio[port] = self._gpio[port], self._read_pins(port)
+        self._raise_interrupts(port, previous)
+
+    def _raise_interrupts(self, port, previous):
+        value = self._gpio[port]
+        enabled = self._regs[GPINTEN][port] & self._regs[IODIR][port]
+        compare = self._regs[INTCON][port]
+        # Interrupt on change, or on difference with DEFVAL
+        pins = (((value ^ previous) & ~compare) | ((value ^ self._regs[DEFVAL][port]) & compare)) & enabled
+        if not pins:
+            return
+        if not self._regs[INTF][port]:
+            self._regs[INTCAP][port] = value
+        self._regs[INTF][port] |= pins
+        self._update_int()
+
+    def _clear_interrupt(self, port):
+        if not self._regs[INTF][port]:
+            return
+        self._regs[INTF][port] = 0x00
+        # Pins still different from DEFVAL raise the interrupt again
+        self._raise_interrupts(port, self._gpio[port])
+        self._update_int()
+
+    def _update_int(self):
+        flags = [bool(self._regs[INTF][port]) for port in range(2)]
+        if self._iocon & IOCON_MIRROR:
+            flags = [flags[0] or flags[1]] * 2
+        raised = any(flags[port] and not self._int_active[port] for port in range(2))
+        self._int_active = flags
+        if raised and self.on_interrupt is not None:
+            self.on_interrupt(self)
+
+    def int_active(self, port=0):
+        """Return True while the INT output of a port is asserted."""
+        # Lock free: called by the INT line of other chips from their interrupt
+        return self._int_active[port]
+
+    def int_level(self, port=0):
+        """Return the electrical level of the INT output of a port (None when open-drain and released)."""
+        with self._lock:
+            active = self._int_active[port]
+            if self._iocon & IOCON_ODR:
+                return False if active else None
+            return active == bool(self._iocon & IOCON_INTPOL)
+
+
+class SimulatedIntLine:
+    """INT outputs of several chips wired together (open-drain, active low).
+
+    The line falls when a first chip asserts its INT output: trigger() of the
+    edge source is called then, as the kernel would report the edge. The
+    edge source reads the level of the line with active().
+    """
+
+    def __init__(self, edge_source):
+        self._edge_source = edge_source
+        self._chips = []
+        edge_source.line = self
+
+    def connect(self, chip):
+        """Wire the INT output of chip to the line."""
+        self._chips.append(chip)
+        chip.on_interrupt = self._on_interrupt
+
+    def active(self):
+        """Return True while a chip holds the line low."""
+        return any(chip.int_active() for chip in self._chips)
+
+    def _on_interrupt(self, chip):
+        # Falling edge only if no other chip already holds the line low
+        if not any(other.int_active() for other in self._chips if other is not chip):
+            self._edge_source.trigger()
+
+
+class SimulatedSMBus:
+    """Simulated I2C bus of MCP23017 chips, usable where smbus2.SMBus is.
+
+    Every call is one I2C transaction, taking latency seconds (bus clock and
+    adapter overhead). Transactions and wire bytes are counted as FakeSMBus
+    does. An address without chip is not acknowledged (OSError).
+    """
+
+    def __init__(self, bus=1, latency=0):
+        self.bus = bus
+        self.latency = latency
+        self.chips = {}
+        self.transactions = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def addChip(self, address, on_interrupt=None):
+        """Add a chip at address, return it."""
+        chip = SimulatedMCP23017(address, on_interrupt)
+        self.chips[address] = chip
+        return chip
+
+    def reset_counters(self):
+        """Reset transaction and byte counters."""
+        self.transactions = 0
+        self.bytes = 0
+
+    def _transaction(self, i2c_addr, nbytes):
+        """Count a transaction, wait for its latency and return the addressed chip."""
+        with self._lock:
+            self.transactions += 1
+            self.bytes += nbytes
+        if self.latency:
+            time.sleep(self.latency)
+        chip = self.chips.get(i2c_addr)
+        if chip is None:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        return chip
+
+    def read_byte(self, i2c_addr, force=None):
+        # S addr+R data P
+        return self._transaction(i2c_addr, 2).read(1)[0]
+
+    def write_byte(self, i2c_addr, value, force=None):
+        # S addr+W reg P: sets the address pointer
+        self._transaction(i2c_addr, 2).write([value])
+
+    def read_byte_data(self, i2c_addr, register, force=None):
+        # S addr+W reg Sr addr+R data P
+        chip = self._transaction(i2c_addr, 4)
+        with chip._lock:
+            chip.write([register])
+            return chip.read(1)[0]
+
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        # S addr+W reg data P
+        self._transaction(i2c_addr, 3).write([register, value])
+
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        chip = self._transaction(i2c_addr, 3 + length)
+        with chip._lock:
+            chip.write([register])
+            return chip.read(length)
+
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        self._transaction(i2c_addr, 2 + len(data)).write([register] + list(data))
+
+    def i2c_rdwr(self, *messages):
+        """Run combined transactions of smbus2.i2c_msg-like messages (addr, flags, len, buf)."""
+        for message in messages:
+            chip = self._transaction(message.addr, 1 + message.len)
+            if message.flags & I2C_M_RD:
+                for i, value in enumerate(chip.read(message.len)):
+                    try:
+                        message.buf[i] = value
+                    except TypeError:
+                        # ctypes char buffer of smbus2.i2c_msg
+                        message.buf[i] = bytes([value])
+            else:
+                data = [message.buf[i] for i in range(message.len)]
+                chip.write([value if isinstance(value, int) else ord(value) for value in data])
+
+    def close(self):
+        pass
@@ -0,0 +1,165 @@
+"""Replay an I2C capture of the mcp23017.dump_trace service against simulated chips.
+
+The transactions are sent again with their recorded gaps (scaled by --speed),
+one thread per bus, to a SimulatedSMBus with a chip at every traced address.
+Written values are not captured: block writes send zeros of the recorded
+length. Reports, per operation, the recorded and the replayed duration
+percentiles, and how late the replay ran behind the capture.
+
+Run from the repository root:
+    python -m benchmarks.replay_trace mcp23017_trace.bin [--latency 0.0002] [--speed 1] [--no-gaps]
+"""
+
+import argparse
+import threading
+import time
+
+from custom_components.mcp23017.metrics import Histogram
+from custom_components.mcp23017.tracer import (
+    OP_NAMES,
+    OP_RDWR,
+    OP_READ_BLOCK,
+    OP_READ_BYTE,
+    OP_READ_BYTE_DATA,
+    OP_WRITE_BLOCK,
+    OP_WRITE_BYTE_DATA,
+    load_trace,
+)
+
+from .bench_suite import merge
+from .mcp23017_sim import I2C_M_RD, SimulatedSMBus
+
+
+class ReadMessage:
+    """smbus2.i2c_msg-like read message."""
+
+    flags = I2C_M_RD
+
+    def __init__(self, addr, length):
+        self.addr = addr
+        self.len = length
+        self.buf = bytearray(length)
+
+
+def replay_one(sim_bus, op, address, register, nbytes):
+    """Send one recorded transaction again."""
+    if op == OP_READ_BYTE:
+        sim_bus.read_byte(address)
+    elif op == OP_READ_BYTE_DATA:
+        sim_bus.read_byte_data(address, register)
+    elif op == OP_WRITE_BYTE_DATA:
+        sim_bus.write_byte_data(address, register, 0)
+    elif op == OP_READ_BLOCK:
+        sim_bus.read_i2c_block_data(address, register, nbytes - 3)
+    elif op == OP_WRITE_BLOCK:
+        sim_bus.write_i2c_block_data(address, register, [0] * (nbytes - 2))
+    elif op == OP_RDWR:
+        sim_bus.i2c_rdwr(ReadMessage(address, nbytes - 1))
+
+
+def replay_bus(sim_bus, records, start, origin, args, replayed, lateness):
+    """Replay the records of one bus, at their recorded times."""
+    for timestamp, _, _, address, op, register, _, nbytes in records:
+        if not args.no_gaps:
+            due = start + (timestamp - origin) / args.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lateness.add(-delay)
+        begin = time.monotonic()
+        try:
+            replay_one(sim_bus, op, address, register, nbytes)
+        except OSError:
+            pass
+        replayed[op].add(time.monotonic() - begin)
+
+
+def ms(histogram, percent):
+    value = histogram.percentile(percent)
+    return "%8.3f" % (value * 1000) if value is not None else "%8s" % "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an MCP23017 I2C capture")
+    parser.add_argument("trace", help="capture written by mcp23017.dump_trace (binary or CSV)")
+    parser.add_argument("--latency", type=float, default=0.0002, help="simulated I2C transaction time (s)")
+    parser.add_argument("--speed", type=float, default=1, help="replay speed factor of the recorded gaps")
+    parser.add_argument("--no-gaps", action="store_true", help="send the transactions back to back")
+    args = parser.parse_args()
+
+    records = load_trace(args.trace)
+    if not records:
+        print("Empty capture")
+        return
+    origin = records[0][0]
+    span = records[-1][0] + records[-1][1] - origin
+    recorded = {op: Histogram() for op in OP_NAMES}
+    errors = {op: 0 for op in OP_NAMES}
+    by_bus = {}
+    for record in records:
+        _, duration, bus, address, op, _, error, _ = record
+        if op not in OP_NAMES:
+            continue
+        recorded[op].add(duration)
+        errors[op] += bool(error)
+        by_bus.setdefault(bus, []).append(record)
+
+    sim_buses = {}
+    for bus, bus_records in by_bus.items():
+        sim_bus = SimulatedSMBus(bus, latency=args.latency)
+        for address in {record[3] for record in bus_records}:
+            sim_bus.addChip(address)
+        sim_buses[bus] = sim_bus
+
+    # Histograms of each bus thread, merged at the end
+    replayed = {bus: {op: Histogram() for op in OP_NAMES} for bus in by_bus}
+    lateness = {bus: Histogram() for bus in by_bus}
+    start = time.monotonic()
+    threads = [
+        threading.Thread(
+            target=replay_bus,
+            args=(sim_buses[bus], bus_records, start, origin, args, replayed[bus], lateness[bus]),
+        )
+        for bus, bus_records in by_bus.items()
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    replayed = {op: merge(histograms[op] for histograms in replayed.values()) for op in OP_NAMES}
+    lateness = merge(lateness.values())
+
+    print(
+        "%d transactions on %d bus(es), %.1f s recorded, replayed in %.1f s"
+        % (len(records), len(by_bus), span, elapsed)
+    )
+    print(
+        "%-22s %8s %7s %17s %17s"
+        % ("op", "count", "errors", "field p50/p99 ms", "replay p50/p99 ms")
+    )
+    for op, name in OP_NAMES.items():
+        if not recorded[op].count:
+            continue
+        print(
+            "%-22s %8d %7d %8s %8s %8s %8s"
+            % (
+                name,
+                recorded[op].count,
+                errors[op],
+                ms(recorded[op], 50),
+                ms(recorded[op], 99),
+                ms(replayed[op], 50),
+                ms(replayed[op], 99),
+            )
+        )
+    if not args.no_gaps:
+        print(
+            "replay late: %d transactions, p50 %s ms, p99 %s ms"
+            % (lateness.count, ms(lateness, 50).strip(), ms(lateness, 99).strip())
+        )
+
+
+if __name__ == "__main__":
+    main()
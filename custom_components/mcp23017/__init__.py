@@ -1,23 +1,65 @@
 import logging
 import asyncio
+from collections import deque
 import functools
 import threading
 import time
 
-import smbus2
+import voluptuous as vol
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, ServiceCall, callback
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.helpers import device_registry
+from homeassistant.helpers import device_registry, entity_registry
 from homeassistant.const import EVENT_HOMEASSISTANT_START, EVENT_HOMEASSISTANT_STOP
-from .const import DOMAIN, PLATFORMS, DEFAULT_SCAN_RATE, DEVICE_MANUFACTURER,DEFAULT_INVERT_LOGIC,CONF_I2C_ADDRESS, MAX_RETRY
+from .const import DOMAIN, PLATFORMS, DEVICE_MANUFACTURER, CONF_I2C_ADDRESS, MAX_RETRY, DEFAULT_BLOCK_READ, DEFAULT_VERIFY_INTERVAL, CONF_VERIFY_INTERVAL, CONF_INTERRUPT_LINE, DEFAULT_SANITY_SCAN_RATE, SERVICE_SET_OUTPUTS, ATTR_MASK, ATTR_VALUE, CONF_BUS_BACKEND, BUS_BACKEND_ASYNCIO, DEFAULT_BUS_BACKEND, DEFAULT_SCAN_FAST, DEFAULT_SCAN_IDLE, DEFAULT_SCAN_DECAY, SCAN_CLASSES, NO_INPUT_SCAN_CLASS, EVENT_EDGE, EDGE_BUFFER_SIZE, EVENT_BUTTON, CONF_PINS, CONF_FLOW_PIN_NUMBER, CONF_FLOW_PLATFORM, CHIP_OPTIONS, HEALTH_HEALTHY, HEALTH_DEGRADED, HEALTH_OPEN, BACKOFF_MIN, BACKOFF_MAX, SERVICE_START_TRACE, SERVICE_STOP_TRACE, SERVICE_DUMP_TRACE, ATTR_SIZE, ATTR_FILENAME, ATTR_FORMAT, DEFAULT_TRACE_SIZE, MAX_TRACE_SIZE
 
 import traceback
 
+from .bus import MCP23017AsyncBus, MCP23017Bus
+from .discovery import async_get_discovery, i2c_bus_number
+from .smbus_pool import async_get_pool
+from .tracer import I2CTracer, TRACE_FORMAT_BINARY, TRACE_FORMAT_CSV, TRACE_FORMATS
+from .interrupt import acquire_edge_source
+from .metrics import Histogram
+
 _LOGGER = logging.getLogger(__name__)
 MCP23017_DATA_LOCK = asyncio.Lock()
 
-PLATFORMS = ["binary_sensor", "switch"]
+# hass.data key of the bus schedulers, using bus number as a key
+DATA_BUSES = f"{DOMAIN}_buses"
+DATA_BUS_BACKENDS = f"{DOMAIN}_bus_backends"
+
+# (bit, pin) of the bits set in each port value, lowest first, by port
+PORT_PINS = [
+    [tuple((1 << bit, 8*port + bit) for bit in range(8) if value & (1 << bit)) for value in range(256)]
+    for port in range(2)
+]
+
+# Empty port masks, compared against without building a list
+NO_PINS = [0, 0]
+
+SET_OUTPUTS_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_I2C_ADDRESS): cv.string,
+        vol.Required(ATTR_MASK): vol.All(vol.Coerce(int), vol.Range(min=0, max=0xFFFF)),
+        vol.Required(ATTR_VALUE): vol.All(vol.Coerce(int), vol.Range(min=0, max=0xFFFF)),
+    }
+)
+
+START_TRACE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_SIZE, default=DEFAULT_TRACE_SIZE): vol.All(vol.Coerce(int), vol.Range(min=1, max=MAX_TRACE_SIZE)),
+    }
+)
+
+DUMP_TRACE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_FILENAME): cv.string,
+        vol.Optional(ATTR_FORMAT, default=TRACE_FORMAT_BINARY): vol.In(TRACE_FORMATS),
+    }
+)
 
 
 async def async_setup(hass: HomeAssistant, config: dict) -> bool:
@@ -25,25 +67,76 @@ async def async_setup(hass: HomeAssistant, config: dict) -> bool:
     _LOGGER.debug("async_setup")
     # hass.data[DOMAIN] stores one entry for each MCP23017 instance using i2c address as a key
     hass.data.setdefault(DOMAIN, {})
+    # hass.data[DATA_BUSES] stores one polling scheduler for each I2C bus
+    hass.data.setdefault(DATA_BUSES, {})
+    # hass.data[DATA_BUS_BACKENDS] stores the bus_backend option of each chip, by bus number
+    hass.data.setdefault(DATA_BUS_BACKENDS, {})
 
     # Callback function to start polling when HA starts
     def start_polling(event):
-        for component in hass.data[DOMAIN].values():
-            if not component.is_alive():
-                component.start_polling()
+        for bus in hass.data[DATA_BUSES].values():
+            if not bus.is_alive():
+                bus.start_polling()
 
-    # Callback function to stop polling when HA stops
+    # Callback function to stop polling and close the buses when HA stops
     def stop_polling(event):
-        for component in hass.data[DOMAIN].values():
-            if component.is_alive():
-                component.stop_polling()
+        for bus_number in list(hass.data[DATA_BUSES]):
+            stop_bus(hass, hass.data[DATA_BUSES].pop(bus_number))
 
     hass.bus.async_listen_once(EVENT_HOMEASSISTANT_START, start_polling)
     hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, stop_polling)
+
+    async def async_set_outputs(call: ServiceCall):
+        """Set several switches of a device in one I2C transaction."""
+        component = hass.data[DOMAIN].get(call.data[CONF_I2C_ADDRESS])
+        if component is None:
+            raise HomeAssistantError(f"Unknown {DOMAIN} device {call.data[CONF_I2C_ADDRESS]}")
+        component.setSwitches(call.data[ATTR_MASK], call.data[ATTR_VALUE])
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_OUTPUTS, async_set_outputs, schema=SET_OUTPUTS_SCHEMA
+    )
+
+    async def async_start_trace(call: ServiceCall):
+        """Record the I2C transactions of all buses into a new ring buffer."""
+        async_get_pool(hass).setTracer(I2CTracer(call.data[ATTR_SIZE]))
+        _LOGGER.info("I2C trace started (%d transactions)", call.data[ATTR_SIZE])
+
+    async def async_stop_trace(call: ServiceCall):
+        """Stop recording the I2C transactions, the last trace is dropped."""
+        async_get_pool(hass).setTracer(None)
+        _LOGGER.info("I2C trace stopped")
+
+    async def async_dump_trace(call: ServiceCall):
+        """Write the transactions recorded by the running trace to a file."""
+        tracer = async_get_pool(hass).tracer
+        if tracer is None:
+            raise HomeAssistantError("No I2C trace running, call %s.%s first" % (DOMAIN, SERVICE_START_TRACE))
+        trace_format = call.data[ATTR_FORMAT]
+        filename = call.data.get(ATTR_FILENAME)
+        if filename is None:
+            filename = hass.config.path(
+                "%s_trace.%s" % (DOMAIN, "csv" if trace_format == TRACE_FORMAT_CSV else "bin")
+            )
+        elif not hass.config.is_allowed_path(filename):
+            raise HomeAssistantError(f"Cannot write to {filename}, not in allowlist_external_dirs")
+        count = await hass.async_add_executor_job(tracer.dump, filename, trace_format)
+        _LOGGER.info("I2C trace: %d transactions written to %s", count, filename)
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_START_TRACE, async_start_trace, schema=START_TRACE_SCHEMA
+    )
+    hass.services.async_register(DOMAIN, SERVICE_STOP_TRACE, async_stop_trace)
+    hass.services.async_register(
+        DOMAIN, SERVICE_DUMP_TRACE, async_dump_trace, schema=DUMP_TRACE_SCHEMA
+    )
+
+    # Warm the inventory of the config flow
+    async_get_discovery(hass).async_refresh()
     return True
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    """Creation des entités à partir d'une configEntry"""
+    """Creation des entités d'un MCP23017 à partir de sa configEntry"""
 
     _LOGGER.debug(
         "Appel de async_setup_entry entry: entry_id='%s', data='%s'",
@@ -52,24 +145,176 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     )
 
     hass.data.setdefault(DOMAIN, {})
+    hass.data.setdefault(DATA_BUSES, {})
+    hass.data.setdefault(DATA_BUS_BACKENDS, {})
+    component = await async_get_or_create(hass, entry)
+    if component is None:
+        return False
     entry.async_on_unload(entry.add_update_listener(update_listener))
+    # Each platform adds and registers all its entities of the chip at once
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    # Single configuration pass, once all entities are registered
+    component.reInit()
+    async with MCP23017_DATA_LOCK:
+        # One scheduler (thread or asyncio tasks, and SMBus handle) per I2C bus
+        bus = await async_get_or_create_bus(hass, entry, component.bus)
+        bus.add_device(component)
     return True
 
 async def async_unload_entry(hass, config_entry):
-    """Unload MCP23017 switch entry corresponding to config_entry."""
+    """Unload the entities of the MCP23017 corresponding to config_entry."""
+    unload_ok = await hass.config_entries.async_unload_platforms(config_entry, PLATFORMS)
     component = hass.data[DOMAIN][config_entry.data[CONF_I2C_ADDRESS]]
-    component.reInit()
+    async with MCP23017_DATA_LOCK:
+        hass.data[DATA_BUS_BACKENDS].get(component.bus, {}).pop(config_entry.data[CONF_I2C_ADDRESS], None)
+        bus = hass.data[DATA_BUSES].get(component.bus)
+        if bus is not None:
+            bus.remove_device(component)
+            if not bus.devices:
+                # Last chip of the bus: stop its scheduler and close its handle
+                del hass.data[DATA_BUSES][component.bus]
+                await hass.async_add_executor_job(stop_bus, hass, bus)
+    # The device keeps its state (outputs, counters) until the entry is set up again
+    await hass.async_add_executor_job(component.unregister_entities)
+    return unload_ok
 
 async def update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Fonction qui force le rechargement des entités associées à une configEntry"""
-    component = hass.data[DOMAIN][entry.data[CONF_I2C_ADDRESS]]
-    component.reInit()
     await hass.config_entries.async_reload(entry.entry_id)
 
-async def async_get_or_create(hass, entity):
-    """Get or create a MCP23017 component from entity bus and i2c address."""
-    i2c_address = entity.address
+async def async_migrate_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Merge the former per pin config entries (version 1) into one entry per chip."""
+    if entry.version != 1:
+        return True
+    i2c_address = entry.data[CONF_I2C_ADDRESS]
+    chip_unique_id = f"{DOMAIN}.{i2c_address}"
+    for other in hass.config_entries.async_entries(DOMAIN):
+        if other.version > 1 and other.unique_id == chip_unique_id:
+            # Already merged into the chip entry
+            hass.async_create_task(_async_remove_entry(hass, entry.entry_id))
+            return False
+
+    siblings = [
+        other
+        for other in hass.config_entries.async_entries(DOMAIN)
+        if other.version == 1 and other.data.get(CONF_I2C_ADDRESS) == i2c_address
+    ]
+    pins = {}
+    pins_options = {}
+    chip_options = {}
+    entities = entity_registry.async_get(hass)
+    for other in siblings:
+        pin = str(other.data[CONF_FLOW_PIN_NUMBER])
+        pins[pin] = {
+            key: value for key, value in other.data.items() if key not in (CONF_I2C_ADDRESS, CONF_FLOW_PIN_NUMBER)
+        }
+        pins_options[pin] = {key: value for key, value in other.options.items() if key not in CHIP_OPTIONS}
+        for key, reducer in CHIP_OPTIONS.items():
+            if key in other.options:
+                chip_options[key] = reducer(chip_options[key], other.options[key]) if key in chip_options else other.options[key]
+        if other is not entry:
+            # Keep entity ids and customizations
+            for entity in entity_registry.async_entries_for_config_entry(entities, other.entry_id):
+                entities.async_update_entity(entity.entity_id, config_entry_id=entry.entry_id)
+            hass.async_create_task(_async_remove_entry(hass, other.entry_id))
+
+    hass.config_entries.async_update_entry(
+        entry,
+        title=i2c_address,
+        unique_id=chip_unique_id,
+        data={CONF_I2C_ADDRESS: i2c_address, CONF_PINS: pins},
+        options={**chip_options, CONF_PINS: pins_options},
+        version=2,
+    )
+    _LOGGER.info("%s: %d pin entries merged into one chip entry", i2c_address, len(siblings))
+    return True
+
+async def _async_remove_entry(hass, entry_id):
+    """Remove a merged per pin entry, unless already removed."""
+    if hass.config_entries.async_get_entry(entry_id) is not None:
+        await hass.config_entries.async_remove(entry_id)
+
+
+class PinEntry:
+    """Config entry of one pin, as seen by its entity.
+
+    data holds the pin configuration from the chip entry, options the chip
+    options overridden by the options of the pin.
+    """
+
+    def __init__(self, entry, pin):
+        self.entry_id = entry.entry_id
+        self.data = {
+            CONF_I2C_ADDRESS: entry.data[CONF_I2C_ADDRESS],
+            CONF_FLOW_PIN_NUMBER: int(pin),
+            **entry.data[CONF_PINS][pin],
+        }
+        self.options = {key: value for key, value in entry.options.items() if key != CONF_PINS}
+        self.options.update(entry.options.get(CONF_PINS, {}).get(pin, {}))
+
+
+def pin_entries(entry, platform):
+    """Return the PinEntry of the pins of a chip entry using platform."""
+    return [
+        PinEntry(entry, pin)
+        for pin in sorted(entry.data[CONF_PINS], key=int)
+        if entry.data[CONF_PINS][pin][CONF_FLOW_PLATFORM] == platform
+    ]
+
+async def async_register_entities(hass, entry, entities):
+    """Link the entities of a platform to the component of their chip entry."""
+    component = hass.data[DOMAIN][entry.data[CONF_I2C_ADDRESS]]
+    await hass.async_add_executor_job(
+        functools.partial(component.register_entities, entities)
+    )
+
+async def async_get_or_create_bus(hass, entry, bus_number):
+    """Get or create the scheduler of an I2C bus, with a handle borrowed from the SMBus pool.
+
+    The bus_backend option is bus-wide: the option of the chip set up last
+    wins (an options change reloads its chip), a scheduler of another backend
+    is stopped and its devices moved to a new one.
+    """
+    backend = entry.options.get(CONF_BUS_BACKEND, DEFAULT_BUS_BACKEND)
+    backends = hass.data[DATA_BUS_BACKENDS].setdefault(bus_number, {})
+    backends[entry.data[CONF_I2C_ADDRESS]] = backend
+    others = sorted(address for address, other in backends.items() if other != backend)
+    if others:
+        _LOGGER.warning(
+            "%s selects the %s bus scheduler of /dev/i2c-%d, %s another one: the chip set up last wins",
+            entry.data[CONF_I2C_ADDRESS], backend, bus_number, ", ".join(others),
+        )
+    current = hass.data[DATA_BUSES].get(bus_number)
+    if current is not None and current.backend == backend:
+        return current
+    pool = async_get_pool(hass)
+    smbus = await hass.async_add_executor_job(pool.acquire, bus_number)
+    if backend == BUS_BACKEND_ASYNCIO:
+        scheduler = functools.partial(MCP23017AsyncBus, hass, bus_number, smbus)
+    else:
+        scheduler = functools.partial(MCP23017Bus, bus_number, smbus)
+    bus = await hass.async_add_executor_job(scheduler)
+    hass.data[DATA_BUSES][bus_number] = bus
+    if current is not None:
+        _LOGGER.info("%s switched from the %s to the %s bus scheduler", current.unique_id, current.backend, backend)
+        # The handle stays open: the new scheduler holds a reference
+        await hass.async_add_executor_job(stop_bus, hass, current)
+        for device in current.devices:
+            bus.add_device(device)
+
+    # Start polling thread if hass is already running
+    if hass.is_running:
+        bus.start_polling()
+    return bus
+
+def stop_bus(hass, bus):
+    """Stop a bus scheduler and give its handle back to the SMBus pool (blocking)."""
+    bus.stop_polling()
+    async_get_pool(hass).release(bus.smbus)
+
+async def async_get_or_create(hass, entry):
+    """Get or create the MCP23017 component of a chip config entry."""
+    i2c_address = entry.data[CONF_I2C_ADDRESS]
     # DOMAIN data async mutex
     try:
         async with MCP23017_DATA_LOCK:
@@ -78,31 +323,22 @@ async def async_get_or_create(hass, entity):
             else:
                 # Try to create component when it doesn't exist
                 component = await hass.async_add_executor_job(
-                    functools.partial(MCP23017, hass,i2c_address)
+                    functools.partial(MCP23017, hass, i2c_address)
                 )
                 hass.data[DOMAIN][i2c_address] = component
 
-                # Start polling thread if hass is already running
-                if hass.is_running:
-                    component.start_polling()
-
                 # Register a device combining all related entities
                 devices = device_registry.async_get(hass)
                 devices.async_get_or_create(
-                    config_entry_id=entity._entry_infos.entry_id,
+                    config_entry_id=entry.entry_id,
                     identifiers={(DOMAIN, i2c_address)},
                     manufacturer=DEVICE_MANUFACTURER,
                     model=DOMAIN,
                     name=f"{DOMAIN}@{i2c_address}",
                 )
-
-            # Link entity to component
-            await hass.async_add_executor_job(
-                functools.partial(component.register_entity, entity)
-            )
     except ValueError as error:
         component = None
-        await hass.config_entries.async_remove(entity._entry_infos.entry_id)
+        await hass.config_entries.async_remove(entry.entry_id)
 
         hass.components.persistent_notification.create(
             f"Error: Unable to access {DOMAIN}{i2c_address} ({error})",
@@ -114,8 +350,8 @@ async def async_get_or_create(hass, entity):
 
 
 
-class MCP23017(threading.Thread):
-    """MCP23017 component (device)"""
+class MCP23017:
+    """MCP23017 component (device), driven by the MCP23017Bus scheduler of its bus"""
 
     IODIRA  = 0x00 # Pin direction register for port A
     IODIRB  = 0x01 # Pin direction register for port B
@@ -140,33 +376,125 @@ class MCP23017(threading.Thread):
     OLATA   = 0x14 #
     OLATB   = 0x15 #
 
-    def __init__(self, hass,address):
+    # IOCON bits
+    IOCON_BANK   = 0x80 # 1: registers of each port are in separate banks
+    IOCON_MIRROR = 0x40 # 1: INTA and INTB are internally connected
+    IOCON_SEQOP  = 0x20 # 1: sequential operation disabled, address pointer does not increment
+    IOCON_DISSLW = 0x10 # 1: slew rate disabled
+    IOCON_HAEN   = 0x08 # MCP23S17 only
+    IOCON_ODR    = 0x04 # 1: INT pins are open-drain
+    IOCON_INTPOL = 0x02 # 1: INT pins are active-high
+
+    def __init__(self, hass,address,smbus=None):
         # Address is this form /dev/i2c-1@0x48
         self._hass     = hass
-        self._bus      = int(address.split('@')[0][-1])
+        self._bus      = i2c_bus_number(address)
         self._address  = int(address.split('@')[1],16)
         self._full_address = address
         self._entities = [None for i in range(16)]
+        # Input entities callbacks by pin
+        self._input_callbacks = [None for i in range(16)]
+        # (callback, state) waiting to be sent to the event loop
+        self._pushes = []
         self._device_lock = threading.Lock()
-        self._run = False
-        
-        self._smbus = smbus2.SMBus(self._bus)
         
+        # Handle of the bus scheduler, set when the device is added to it (or another bus object, benchmarks)
+        self._smbus = smbus
+        # Read both ports in one sequential transaction (needs IOCON.BANK=0 and IOCON.SEQOP=0)
+        self._block_read = DEFAULT_BLOCK_READ
+        self._iocon      = 0x00
+        self._error_cpt  = 0
+
+        # Health state machine: consecutive errors back off the polls, then open the circuit
+        self._health        = HEALTH_HEALTHY
+        self._retry_at      = 0
+        self._circuit_opens = 0
+
+        # Configuration integrity: registers are verified every _verify_interval seconds
+        # or as soon as possible after a failure
+        self._verify_interval = DEFAULT_VERIFY_INTERVAL
+        self._next_verify     = 0
+        self._verify_pending  = False
+        self._conf_checks     = 0
+        self._conf_drifts     = 0
+
+        # Adaptive scan rate: fast after an input change, decaying to idle
+        self._scan_fast     = DEFAULT_SCAN_FAST
+        self._scan_idle     = DEFAULT_SCAN_IDLE
+        self._scan_decay    = DEFAULT_SCAN_DECAY
+        self._scan_interval = DEFAULT_SCAN_IDLE
+        self._last_change   = None
+        # Next time the bus scheduler has to poll this device
+        self._next_poll     = 0
+
+        # Input filters by pin: filtered pins are pushed when their filter output changes
+        self._filters          = [None for i in range(16)]
+        self._filter_mask      = [0b00000000,0b00000000]
+        self._filtered_state   = [0b00000000,0b00000000]
+        # Filtered pins which need more samples to settle
+        self._filters_pending  = [0b00000000,0b00000000]
+
+        # Pulse counters: edges counted by pin, on the pins of the rising/falling masks
+        self._counts        = [0 for i in range(16)]
+        self._count_rising  = [0b00000000,0b00000000]
+        self._count_falling = [0b00000000,0b00000000]
+
+        # Timestamped input changes (sample_time, pin, level), oldest first
+        self._edges       = deque(maxlen=EDGE_BUFFER_SIZE)
+        # Inputs firing EVENT_EDGE events
+        self._edge_events = [0b00000000,0b00000000]
+
+        # Button gesture detectors by pin
+        self._gestures     = [None for i in range(16)]
+        self._gesture_mask = [0b00000000,0b00000000]
+        # Inputs with an edge event or a gesture detector, visited by hookInput
+        self._hook_mask    = [0b00000000,0b00000000]
+
+        # Interrupt mode: inputs are read on edges of the INT line given by _edge_source
+        self._interrupt_line = ""
+        self._edge_source    = None
+        self._next_sanity    = 0
+
         # GPIO status
         self._to_init = True
-        self._first_init = True
+        # Input pins pushed at the next read whatever their state (new entities)
+        self._push_mask = [0b00000000,0b00000000]
+        # Content of registers IODIRA to GPPUB written to the chip, None if unknown
+        self._chip_registers = None
+        # Switch pins which entity state is taken from the outputs at the next configuration (new entities)
+        self._adopt_mask = [0b00000000,0b00000000]
         self._last_state = None
         self._io_dir     = None 
         self._invert     = None
         self._pullup     = None
-        self._hw_sync    = None
+        # Output pins following the level read back (hw_follow)
+        self._hw_follow  = [0b00000000,0b00000000]
+        # hw_follow pins which level read back differs from the output written, as last pushed
+        self._hw_differ  = [0b00000000,0b00000000]
+        # Outputs written since the last syncOutputs: compare them even if the inputs did not change
+        self._hw_resync  = False
 
         # switch state
         self._switches_states     = [0b00000000,0b00000000]   
         # switch new_state
-        self._new_switches_states = [0b00000000,0b00000000]   
-        
-        threading.Thread.__init__(self, name=self.unique_id)
+        self._new_switches_states = [0b00000000,0b00000000]
+        self._outputs_lock = threading.Lock()
+        # Switch commands wake the bus scheduler up with _wake, set by MCP23017Bus
+        self._wake = None
+        self._write_requested = None
+        self._write_latency = Histogram()
+
+        # Performance metrics (seconds)
+        self._poll_duration = Histogram()
+        self._scan_jitter   = Histogram()
+        # Delay between the sample of an input change and its entity update in the event loop
+        self._push_latency  = Histogram()
+        self._poll_errors   = 0
+        self._last_error    = None
+        # Configuration passes repeated after an I2C error or a drift
+        self._reinits       = 0
+        self._reconfigure   = False
+
         _LOGGER.info("%s device created", self.unique_id)
 
     def __enter__(self):
@@ -181,6 +509,9 @@ class MCP23017(threading.Thread):
 
     def reInit(self):
         self._to_init = True
+        self._next_poll = 0
+        if self._wake is not None:
+            self._wake()
     
     @property
     def unique_id(self):
@@ -192,105 +523,673 @@ class MCP23017(threading.Thread):
         """Return I2C bus number"""
         return self._bus
 
+    @property
+    def smbus(self):
+        """Return the SMBus handle used by the device."""
+        return self._smbus
+
+    @smbus.setter
+    def smbus(self, value):
+        """Set the SMBus handle used by the device."""
+        self._smbus = value
+
     @property
     def address(self):
         """Return I2C address"""
         return self._address
 
-    def start_polling(self):
-        """Start polling thread."""
-        self._run = True
-        self.start()
-
-    def stop_polling(self):
-        """Stop polling thread."""
-        self._run = False
-        self.join()
-
-    def run(self):
-        """Poll all ports once and call corresponding callback if a change is detected."""
-        _LOGGER.info("%s start polling thread", self.unique_id)
-        error_cpt=0
-        while self._run:
-            with self:
-                try:
-                    # Conf has changed
-                    if not self._to_init and not self.checkConf():
-                        self._to_init = True
-                    # Reinitialisation needed
-                    if self._to_init:
-                        self.confGPIO()
-                        reInit = True
-                        time.sleep(1)
-
-                    for port in range (2):
-                            
-                        status  = self._smbus.read_byte_data(self._address, self.GPIOA+port)
-                        self._new_state[port]=status
-                        changes = self._last_state[port]^status
-                        
-                        if reInit:
-                            pin_nb = 0
-                            statusStr=bin(status)[2:].rjust(8,'0')[::-1]
-                            for s in  statusStr:
-                                entity = self._entities[pin_nb+port*8]
-                                if entity != None and type(entity).__name__ == 'MCP23017BinarySensor':
-                                    asyncio.run_coroutine_threadsafe(entity.async_push_update(statusStr[pin_nb]=="1"), self._hass.loop)
-                                    _LOGGER.debug("Pin %d Initial status set to %s"%((pin_nb+port*8),statusStr[pin_nb]))
-                                pin_nb += 1
-                            if port == 1:    
-                                reInit = False
-                        elif changes != 0:
-                            pin_nb=0
-                            statusStr=bin(status)[2:].rjust(8,'0')[::-1]
-                            for s in bin(changes)[2:].rjust(8,'0')[::-1]:
-                                if s == '1': # State changes on this pin
-                                    if type(self._entities[pin_nb+port*8]).__name__ == 'MCP23017BinarySensor':
-                                        asyncio.run_coroutine_threadsafe(self._entities[pin_nb+port*8].async_push_update(statusStr[pin_nb]=="1"), self._hass.loop)
-                                    _LOGGER.debug("Pin %d change to %s"%((pin_nb+port*8),statusStr[pin_nb]))
-                                pin_nb += 1
-                            _LOGGER.debug("[%s] Last Inputs State:%s "%(self.unique_id,self.toBin(self._last_state)))
-                            _LOGGER.debug("[%s] New  Inputs State:%s "%(self.unique_id,self.toBin(self._new_state)))
-                        #write switch commands
-                        if self._new_switches_states[port] != self._switches_states[port]:
-                            _LOGGER.debug("-------------------------------")
-                            _LOGGER.debug("[%s] New "%( self.toBin(self._new_switches_states)))
-                            _LOGGER.debug("[%s] Current "%( self.toBin(self._switches_states)))
-                            self._smbus.write_byte_data(self._address,self.OLATA+port,self._new_switches_states[port])
-                            self._switches_states[port] = self._new_switches_states[port] 
-                    self._last_state = self._new_state.copy()
-                    error_cpt = 0
-                except  Exception as error:
-                    error_cpt += 1
-                    if error_cpt > MAX_RETRY: 
-                        _LOGGER.error(traceback.format_exc())
-                        _LOGGER.error("Error polling device %s"%(self.unique_id))
-                        _LOGGER.error(error)
-                        self.reInit()
-                        error_cpt = 0
-                    
-            time.sleep(DEFAULT_SCAN_RATE)
-            
-    def register_entity(self, entity):
-        """Register entity to this device instance."""
+    @property
+    def loop(self):
+        """Return the event loop running the entities"""
+        return self._hass.loop
+
+    @property
+    def write_latency(self):
+        """Return the histogram of delays between switch commands and OLAT writes"""
+        return self._write_latency
+
+    @property
+    def metrics(self):
+        """Return the performance counters and histograms of the device."""
+        metrics = self._smbus.stats(self._address) if hasattr(self._smbus, "stats") else {}
+        metrics.update({
+            "poll_errors": self._poll_errors,
+            "last_error": self._last_error,
+            "reinits": self._reinits,
+            "health": self._health,
+            "circuit_opens": self._circuit_opens,
+            "conf_checks": self._conf_checks,
+            "conf_drifts": self._conf_drifts,
+            "poll_duration": self._poll_duration.as_dict(),
+            "scan_jitter": self._scan_jitter.as_dict(),
+            "push_latency": self._push_latency.as_dict(),
+            "write_latency": self._write_latency.as_dict(),
+            "scan_budget": self.scan_budget,
+        })
+        return metrics
+
+    @property
+    def health(self):
+        """Return the health state of the device: healthy, degraded or open (not answering)"""
+        return self._health
+
+    @property
+    def available(self):
+        """Return False while the circuit is open"""
+        return self._health != HEALTH_OPEN
+
+    @property
+    def write_pending(self):
+        """Return True if switch commands are waiting to be written"""
+        return self._new_switches_states != self._switches_states
+
+    @property
+    def next_poll(self):
+        """Return the monotonic time of the next poll"""
+        return self._next_poll
+
+    @property
+    def edge_source(self):
+        """Return the INT line edge source, None in polling mode"""
+        return self._edge_source
+
+    def poll(self, edge=False):
+        """Poll all ports once and call corresponding callback if a change is detected.
+
+        In interrupt mode, the inputs are only read after an edge on the INT line
+        or when the sanity poll is due.
+        """
+        now = time.monotonic()
+        if self._health == HEALTH_OPEN:
+            # Edges of a shared INT line do not shorten the backoff
+            if now >= self._retry_at:
+                self.probe(now)
+            return
+        if not edge and self._next_poll:
+            self._scan_jitter.add(max(0, now - self._next_poll))
+        try:
+            # Conf has changed, or the chip may have been reset while failing: check it
+            # before a pending reinitialisation, which only writes what differs
+            if self._chip_registers is not None and (self._verify_pending or (not self._to_init and now >= self._next_verify)):
+                if not self.checkConf():
+                    self._to_init = True
+            # Reinitialisation needed
+            if self._to_init:
+                self.confGPIO()
+
+            if self._gesture_mask != [0, 0] and not edge:
+                # Gestures completed before the inputs are read: a change sampled now starts a new one
+                self.gestureTimeouts(now)
+            if self._edge_source is None or self._push_mask != [0, 0] or now >= self._next_sanity:
+                # Reading GPIO also clears a pending interrupt which edge would have been lost
+                self.updateInputs(self.readGPIO(), now)
+                self._next_sanity = now + DEFAULT_SANITY_SCAN_RATE
+            elif edge:
+                intf, intcap, gpio = self.readInterrupts()
+                # Replay the levels captured when the interrupt fired, so that
+                # pulses shorter than the read latency are not lost
+                captured = [(self._last_state[port] & ~intf[port]) | (intcap[port] & intf[port]) for port in range(2)]
+                if captured != self._last_state:
+                    # Sampled by the chip when the INT line fell
+                    edge_time = self._edge_source.edge_time
+                    self.updateInputs(captured, edge_time if edge_time is not None and edge_time <= now else now)
+                self.updateInputs(gpio, now)
+            elif self._filters_pending != [0, 0]:
+                # Sample the inputs until their filters settle
+                self.updateInputs(self.readGPIO(), now)
+
+            if self._gesture_mask != [0, 0] and edge:
+                # After the changes replayed from INTCAP, sampled before now
+                self.gestureTimeouts(now)
+            self.writeOutputs()
+            if self._error_cpt:
+                self.recovered()
+        except  Exception as error:
+            self.pollError(error)
+        self._poll_duration.add(time.monotonic() - now)
+        if self._health == HEALTH_OPEN:
+            self._next_poll = self._retry_at
+            return
+
+        if self._edge_source is None:
+            self._next_poll = now + self.scanInterval(now)
+        else:
+            # Nothing to read before an edge, the sanity poll or the configuration check
+            self._next_poll = min(self._next_sanity, self._next_verify)
+        if self._filters_pending != [0, 0]:
+            self._next_poll = min(self._next_poll, self.filterDeadline(now))
+        if self._gesture_mask != [0, 0]:
+            self._next_poll = min(self._next_poll, self.gestureDeadline(self._next_poll))
+        if self._health == HEALTH_DEGRADED:
+            self._next_poll = max(self._next_poll, self._retry_at)
+
+    def scanInterval(self, now):
+        """Return the delay before the next poll: fast after an input change, then doubling up to the idle rate."""
+        if self._last_change is not None and now - self._last_change < self._scan_decay:
+            self._scan_interval = self._scan_fast
+        else:
+            self._scan_interval = min(self._scan_interval*2, self._scan_idle)
+        return self._scan_interval
+
+    def flushOutputs(self):
+        """Write pending switch commands without waiting for the next poll."""
+        if self._health != HEALTH_HEALTHY:
+            # Written by the next poll, once the chip answers
+            return
+        try:
+            self.writeOutputs()
+        except  Exception as error:
+            self.pollError(error)
+
+    def pollError(self, error):
+        """Count I2C errors: back off the polls, open the circuit after MAX_RETRY more consecutive errors."""
+        self._error_cpt += 1
+        self._poll_errors += 1
+        self._last_error = str(error)
+        # Check configuration as soon as the chip answers again
+        self._verify_pending = True
+        self._retry_at = time.monotonic() + min(BACKOFF_MIN * 2 ** (self._error_cpt - 1), BACKOFF_MAX)
+        if self._health == HEALTH_HEALTHY:
+            _LOGGER.warning("[%s] I2C error, polls backed off: %s"%(self.unique_id,error))
+            self._health = HEALTH_DEGRADED
+        elif self._health == HEALTH_DEGRADED and self._error_cpt > MAX_RETRY:
+            _LOGGER.error("[%s] Not answering after %d errors, entities unavailable: %s"%(self.unique_id,self._error_cpt,error))
+            _LOGGER.debug(traceback.format_exc())
+            self._health = HEALTH_OPEN
+            self._circuit_opens += 1
+            self._pushInput(self.async_update_availability, False)
+
+    def probe(self, now):
+        """Read IOCON once: close the circuit if the chip answers, back off again otherwise."""
+        try:
+            self._smbus.read_byte_data(self._address, self.IOCONA)
+        except Exception as error:
+            self.pollError(error)
+            self._next_poll = self._retry_at
+            return
+        self.recovered()
+        # Full poll at the next pass, starting with a configuration check
+        self._next_poll = now
+
+    def recovered(self):
+        """Back to healthy after a successful transaction."""
+        if self._health == HEALTH_OPEN:
+            _LOGGER.warning("[%s] Answering again after %d errors"%(self.unique_id,self._error_cpt))
+            self._pushInput(self.async_update_availability, True)
+        else:
+            _LOGGER.info("[%s] Recovered after %d errors"%(self.unique_id,self._error_cpt))
+        self._health = HEALTH_HEALTHY
+        self._error_cpt = 0
+
+    @callback
+    def async_update_availability(self, available):
+        """Write the state of the entities added to Home Assistant, when the circuit opens or closes."""
+        for entity in self._entities:
+            if entity is not None and getattr(entity, "hass", None) is not None:
+                entity.async_write_ha_state()
+
+    def requestWrite(self):
+        """Ask the bus scheduler to write switch commands now (called from the event loop)."""
+        if self._write_requested is None:
+            self._write_requested = time.monotonic()
+        if self._wake is not None:
+            self._wake()
+
+    def updateInputs(self, new_state, now=None):
+        """Push inputs state changes to entities, through the filters of filtered pins.
+
+        Pins of _push_mask (entities registered since the last read) are pushed whatever their state.
+        """
+        if new_state == self._last_state and not self._hw_resync and self._push_mask == NO_PINS and self._filters_pending == NO_PINS:
+            # Nothing changed (most scans)
+            return
+        if self._hw_follow != NO_PINS:
+            self.syncOutputs(new_state)
+        push_mask = self._push_mask
+        if new_state == self._last_state and push_mask == NO_PINS and self._filters_pending == NO_PINS:
+            return
+        if now is None:
+            now = time.monotonic()
+        if new_state != self._last_state and (
+            (new_state[0] ^ self._last_state[0]) & self._io_dir[0] or (new_state[1] ^ self._last_state[1]) & self._io_dir[1]
+        ):
+            # Input change: outputs written or read back do not speed the scan up
+            self._last_change = now
+        self._new_state = list(new_state)
+        callbacks = self._input_callbacks
+        record = self._edges.append
+        pushes = self._pushes
+        queued = len(pushes)
+        for port in range (2):
+            status  = self._new_state[port]
+            pushed  = push_mask[port]
+            # Initial pushes are not changes
+            changes = (self._last_state[port]^status) & ~pushed
+            offset  = 8*port
+            # Count the edges of counter pins, without pushing them
+            counted = changes & ((status & self._count_rising[port]) | (~status & self._count_falling[port]))
+            while counted:
+                bit = counted & -counted
+                counted ^= bit
+                self._counts[offset + bit.bit_length() - 1] += 1
+            if self._filter_mask[port]:
+                status, changes = self.filterPort(port, status, changes, pushed, now)
+            # Timestamped changes of inputs, not the initial pushes
+            inputs  = self._io_dir[port] & ~pushed
+            hooks   = self._hook_mask[port]
+            changes |= pushed
+            # Only visit pins that changed, lowest first: inputs without edge event
+            # nor gesture, then the others
+            plain = changes & inputs & ~hooks
+            for bit, pin in PORT_PINS[port][plain]:
+                level = status & bit != 0
+                record((now, pin, level))
+                callback = callbacks[pin]
+                if callback is not None:
+                    pushes.append((callback, level))
+            for bit, pin in PORT_PINS[port][changes & ~plain]:
+                level = status & bit != 0
+                if bit & inputs:
+                    record((now, pin, level))
+                    self.hookInput(port, bit, pin, level, now)
+                callback = callbacks[pin]
+                if callback is not None:
+                    pushes.append((callback, level))
+        if len(pushes) != queued:
+            # Measure when the updates reach the event loop
+            self._pushInput(self.async_record_push, now)
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("[%s] Last Inputs State:%s ", self.unique_id, self.toBin(self._last_state))
+            _LOGGER.debug("[%s] New  Inputs State:%s ", self.unique_id, self.toBin(self._new_state))
+        self._push_mask = [0b00000000,0b00000000]
+        self._last_state = self._new_state
+
+    def hookInput(self, port, bit, pin, level, now):
+        """Fire the edge event and feed the gesture detector of a changed input."""
+        if self._edge_events[port] & bit:
+            self.queueEdgeEvent(pin, level, now)
+        if self._gesture_mask[port] & bit:
+            gesture = self._gestures[pin].change(level, now)
+            if gesture is not None:
+                self.queueButtonEvent(pin, gesture, now)
+
+    def syncOutputs(self, levels):
+        """Push the levels read back on hw_follow output pins to their switches when they differ from the outputs written.
+
+        levels is the GPIO read of the inputs: no extra transaction. A pin is
+        pushed its level when it starts to differ from the output the chip
+        wrote, and None when they agree again. The outputs are not written.
+        """
+        self._hw_resync = False
+        for port in range(2):
+            written = self._switches_states[port]
+            if written is None:
+                # Outputs being rewritten
+                self._hw_resync = True
+                continue
+            differ = (levels[port] ^ written) & self._hw_follow[port]
+            changed = differ ^ self._hw_differ[port]
+            self._hw_differ[port] = differ
+            while changed:
+                bit = changed & -changed
+                changed ^= bit
+                entity = self._entities[8*port + bit.bit_length() - 1]
+                if entity is not None:
+                    level = bool(levels[port] & bit) != entity._invert_logic if differ & bit else None
+                    self._pushInput(entity.async_push_update, level)
+
+    def filterPort(self, port, status, changes, pushed, now):
+        """Feed the filters of a port with its sample, return (status, changes) with filtered pins replaced by their filter output."""
+        mask     = self._filter_mask[port]
+        filtered = self._filtered_state[port]
+        pending  = 0
+        offset   = 8*port
+        # Sample the filtered pins which changed, are pushed or have not settled yet
+        sampled = (changes | pushed | self._filters_pending[port]) & mask
+        while sampled:
+            bit = sampled & -sampled
+            sampled ^= bit
+            input_filter = self._filters[offset + bit.bit_length() - 1]
+            level = status & bit != 0
+            if pushed & bit:
+                # Filters of new entities start from the current level
+                input_filter.reset(level, now)
+            else:
+                level = input_filter.sample(level, now)
+            filtered = filtered | bit if level else filtered & ~bit
+            if input_filter.pending:
+                pending |= bit
+        self._filters_pending[port] = pending
+        filtered_changes = self._filtered_state[port] ^ filtered
+        self._filtered_state[port] = filtered
+        return (status & ~mask) | filtered, (changes & ~mask) | (filtered_changes & mask)
+
+    def filterDeadline(self, now):
+        """Return the monotonic time at which pending filters have to be sampled again."""
+        deadline = None
+        for port in range(2):
+            pending = self._filters_pending[port]
+            while pending:
+                bit = pending & -pending
+                pending ^= bit
+                pin_deadline = self._filters[8*port + bit.bit_length() - 1].deadline
+                if pin_deadline is None:
+                    # Sample based filter: sample at the fast scan rate
+                    pin_deadline = now + self._scan_fast
+                if deadline is None or pin_deadline < deadline:
+                    deadline = pin_deadline
+        return deadline if deadline is not None else now + self._scan_fast
+
+    def queueEdgeEvent(self, pin, level, now):
+        """Queue an EVENT_EDGE event for a change sampled at now (monotonic time)."""
+        # Wall clock time of the sample, for the event data
+        timestamp = time.time() - (time.monotonic() - now)
+        self._pushInput(self.async_fire_edge, (pin, level, now, timestamp))
+
+    def gestureTimeouts(self, now):
+        """Report the gestures completed by a timeout (long press held, no second press)."""
+        for pin, detector in enumerate(self._gestures):
+            if detector is not None:
+                gesture = detector.timeout(now)
+                if gesture is not None:
+                    self.queueButtonEvent(pin, gesture, now)
+
+    def gestureDeadline(self, deadline):
+        """Return the earliest of deadline and the gesture timeouts."""
+        for detector in self._gestures:
+            if detector is not None and detector.deadline is not None:
+                deadline = min(deadline, detector.deadline)
+        return deadline
+
+    def queueButtonEvent(self, pin, gesture, now):
+        """Queue an EVENT_BUTTON event for a gesture completed at now (monotonic time)."""
+        timestamp = time.time() - (time.monotonic() - now)
+        self._pushInput(self.async_fire_button, (pin, gesture, now, timestamp))
+
+    @callback
+    def async_fire_button(self, button):
+        """Fire an EVENT_BUTTON event, in the event loop."""
+        pin, gesture, sample_time, timestamp = button
+        self._hass.bus.async_fire(
+            EVENT_BUTTON,
+            {
+                CONF_I2C_ADDRESS: self._full_address,
+                "pin": pin,
+                "gesture": gesture,
+                "sample_time": sample_time,
+                "timestamp": timestamp,
+            },
+        )
+
+    @callback
+    def async_fire_edge(self, edge):
+        """Fire an EVENT_EDGE event, in the event loop."""
+        pin, level, sample_time, timestamp = edge
+        self._hass.bus.async_fire(
+            EVENT_EDGE,
+            {
+                CONF_I2C_ADDRESS: self._full_address,
+                "pin": pin,
+                "level": level,
+                "sample_time": sample_time,
+                "timestamp": timestamp,
+            },
+        )
+
+    @callback
+    def async_record_push(self, sample_time):
+        """Record the delay between an input sample and its entity updates, in the event loop."""
+        self._push_latency.add(time.monotonic() - sample_time)
+
+    def recentEdges(self, since=None):
+        """Return the buffered input changes (sample_time, pin, level) sampled after since (monotonic time)."""
+        edges = list(self._edges)
+        if since is None:
+            return edges
+        return [edge for edge in edges if edge[0] > since]
+
+    def counterValue(self, pin):
+        """Return the number of edges counted on pin since the device was created."""
+        return self._counts[pin]
+
+    def _pushInput(self, callback, state):
+        """Queue an input state for its entity callback, sent to the event loop by the bus scheduler."""
+        self._pushes.append((callback, state))
+
+    def takePushes(self):
+        """Return and forget the entity updates queued since the last call."""
+        pushes, self._pushes = self._pushes, []
+        return pushes
+
+    def setOutputs(self, mask, value):
+        """Set the outputs selected by the 16 bits mask (bit n is pin n) to value, written in one transaction."""
+        with self._outputs_lock:
+            for port in range(2):
+                port_mask = (mask >> (8*port)) & 0xFF
+                port_value = (value >> (8*port)) & 0xFF
+                self._new_switches_states[port] = (self._new_switches_states[port] & ~port_mask) | (port_value & port_mask)
+        self.requestWrite()
+
+    def setSwitches(self, mask, value):
+        """Set the switches selected by the 16 bits mask to value (bit n is the state of pin n), from the event loop.
+
+        Invert logic of each switch is applied and all of them are written in one transaction.
+        """
+        outputs_mask = 0
+        outputs = 0
+        switches = []
+        for pin, entity in enumerate(self._entities):
+            if mask & (1 << pin) and type(entity).__name__ == 'MCP23017Switch':
+                state = bool(value & (1 << pin))
+                entity.set_state(state)
+                switches.append(entity)
+                outputs_mask |= 1 << pin
+                if state != entity._invert_logic:
+                    outputs |= 1 << pin
+        self.setOutputs(outputs_mask, outputs)
+        for entity in switches:
+            entity.async_write_ha_state()
+
+    def writeOutputs(self):
+        """Write switch commands, all pins of the chip in the same transaction."""
+        with self._outputs_lock:
+            new_states = list(self._new_switches_states)
+        changed = [port for port in range(2) if new_states[port] != self._switches_states[port]]
+        if changed:
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("[%s] New     Outputs State:%s ", self.unique_id, self.toBin(new_states))
+                _LOGGER.debug("[%s] Current Outputs State:%s ", self.unique_id, self.toBin(self._switches_states))
+            if len(changed) == 2:
+                # OLATA and OLATB in one sequential transaction
+                self._smbus.write_i2c_block_data(self._address,self.OLATA,new_states)
+            else:
+                self._smbus.write_byte_data(self._address,self.OLATA+changed[0],new_states[changed[0]])
+            self._switches_states[:] = new_states
+            self._hw_resync = self._hw_follow != NO_PINS
+        if self._write_requested is not None:
+            self._write_latency.add(time.monotonic() - self._write_requested)
+            self._write_requested = None
+
+    def readGPIO(self):
+        """Read GPIOA and GPIOB, in one sequential transaction when block reads are enabled."""
+        if self._block_read:
+            return list(self._smbus.read_i2c_block_data(self._address, self.GPIOA, 2))
+        return [self._smbus.read_byte_data(self._address, self.GPIOA+port) for port in range(2)]
+
+    def readInterrupts(self):
+        """Read INTF, INTCAP and GPIO of both ports in one sequential transaction.
+
+        Return ([INTFA, INTFB], [INTCAPA, INTCAPB], [GPIOA, GPIOB]).
+        """
+        data = self._smbus.read_i2c_block_data(self._address, self.INTFA, 6)
+        return [data[0], data[1]], [data[2], data[3]], [data[4], data[5]]
+
+    def register_entities(self, entities):
+        """Register the entities of the chip config entry, in one pass.
+
+        The bus scheduler configures the chip once all platforms are set up.
+        """
         with self:
-            if type(entity).__name__ == 'MCP23017Switch':
-                entity.set_register(self._new_switches_states)
-            self._entities[entity.pin] = entity
-            self.reInit()
-            _LOGGER.info(
-                "%s(pin %d:'%s') attached to %s",
-                type(entity).__name__,
-                entity.pin,
-                entity.name,
-                self.unique_id,
-            )
+            for entity in entities:
+                entity.device = self
+                self._entities[entity.pin] = entity
+                # Input dispatch table, used by updateInputs for each changed pin
+                if type(entity).__name__ == 'MCP23017BinarySensor':
+                    # Buttons without raw state are not added to Home Assistant
+                    self._input_callbacks[entity.pin] = entity.async_update_state if entity.raw_state else None
+                    self._filters[entity.pin] = entity.input_filter
+                    self._gestures[entity.pin] = entity.gesture_detector
+                    # Initial state of the new entity, sent with the next read
+                    self._push_mask[entity.pin // 8] |= 1 << (entity.pin % 8)
+                else:
+                    self._input_callbacks[entity.pin] = None
+                    self._filters[entity.pin] = None
+                    self._gestures[entity.pin] = None
+                    if type(entity).__name__ == 'MCP23017Switch':
+                        self._adopt_mask[entity.pin // 8] |= 1 << (entity.pin % 8)
+                    elif type(entity).__name__ == 'MCP23017Counter':
+                        port, bit = entity.pin // 8, 1 << (entity.pin % 8)
+                        if self._io_dir is None or not self._io_dir[port] & bit:
+                            # New input: its first level read is not an edge
+                            self._push_mask[port] |= bit
+                _LOGGER.info(
+                    "%s(pin %d:'%s') attached to %s",
+                    type(entity).__name__,
+                    entity.pin,
+                    entity.name,
+                    self.unique_id,
+                )
+            self.updatePinTables()
         return True
 
+    def unregister_entities(self):
+        """Detach all entities, when the chip config entry is unloaded."""
+        with self:
+            self._entities = [None for i in range(16)]
+            self._input_callbacks = [None for i in range(16)]
+            self._filters = [None for i in range(16)]
+            self._gestures = [None for i in range(16)]
+            self._push_mask = [0b00000000,0b00000000]
+            self._adopt_mask = [0b00000000,0b00000000]
+            self.updatePinTables()
+
+    def updatePinTables(self):
+        """Update masks and chip-wide settings from the attached entities."""
+        self.updateFilterMask()
+        self.updateCounterMasks()
+        self._edge_events = [0b00000000,0b00000000]
+        self._gesture_mask = [0b00000000,0b00000000]
+        for pin, entity in enumerate(self._entities):
+            if getattr(entity, 'edge_events', False):
+                self._edge_events[pin // 8] |= 1 << (pin % 8)
+            if self._gestures[pin] is not None:
+                self._gesture_mask[pin // 8] |= 1 << (pin % 8)
+        self._hook_mask = [self._edge_events[port] | self._gesture_mask[port] for port in range(2)]
+        self._verify_interval = self.chipOption(CONF_VERIFY_INTERVAL, DEFAULT_VERIFY_INTERVAL)
+        self.updateScanRates()
+        # Any INT line set on an entity enables interrupt mode ("" < any line)
+        self.setInterruptLine(self.chipOption(CONF_INTERRUPT_LINE, "", max))
+        self.reInit()
+
+    def updateFilterMask(self):
+        """Set the masks of filtered pins."""
+        for port in range(2):
+            self._filter_mask[port] = sum(
+                1 << pin for pin in range(8) if self._filters[8*port + pin] is not None
+            )
+        self._filters_pending = [0b00000000,0b00000000]
+
+    def updateCounterMasks(self):
+        """Set the masks of the pins counting rising and falling edges."""
+        self._count_rising  = [0b00000000,0b00000000]
+        self._count_falling = [0b00000000,0b00000000]
+        for entity in self._entities:
+            if type(entity).__name__ == 'MCP23017Counter':
+                rising, falling = entity.count_edges
+                port, bit = entity.pin // 8, 1 << (entity.pin % 8)
+                if rising:
+                    self._count_rising[port] |= bit
+                if falling:
+                    self._count_falling[port] |= bit
+
+    def updateScanRates(self):
+        """Set chip scan rates from the scan classes of its inputs: the fastest input sets the pace."""
+        rates = [
+            entity.scan_rates
+            for entity in self._entities
+            if type(entity).__name__ in ('MCP23017BinarySensor', 'MCP23017Counter')
+        ]
+        if not rates:
+            rates = [SCAN_CLASSES[NO_INPUT_SCAN_CLASS]]
+        self._scan_fast  = min(rate[0] for rate in rates)
+        self._scan_idle  = min(rate[1] for rate in rates)
+        self._scan_decay = max(rate[2] for rate in rates)
+        self._scan_interval = min(self._scan_interval, self._scan_idle)
+
+    @property
+    def scan_budget(self):
+        """Return I2C transactions and bytes per second of this chip when idle and during input activity.
+
+        Computed from the configuration: scan rates, interrupt mode and configuration checks.
+        """
+        if self._edge_source is not None:
+            # Sanity polls only, plus one read per edge
+            idle = active = 1 / DEFAULT_SANITY_SCAN_RATE
+        else:
+            idle, active = 1 / self._scan_idle, 1 / self._scan_fast
+        # Wire bytes: S addr reg Sr addr data... (see readGPIO)
+        read_bytes = 5 if self._block_read else 8
+        verify = 1 / self._verify_interval
+        return {
+            "idle_transactions": idle * (1 if self._block_read else 2) + verify,
+            "active_transactions": active * (1 if self._block_read else 2) + verify,
+            "idle_bytes": idle * read_bytes + verify * (3 + self.GPPUB + 1),
+            "active_bytes": active * read_bytes + verify * (3 + self.GPPUB + 1),
+        }
+
+    def setInterruptLine(self, line):
+        """Watch the INT line given as '/dev/gpiochipN:line', polling mode if line is empty."""
+        if line == self._interrupt_line:
+            return
+        self._interrupt_line = line
+        edge_source = None
+        if line:
+            try:
+                # Shared with the other chips wired to the same line
+                edge_source = acquire_edge_source(line)
+            except Exception as error:
+                _LOGGER.error("[%s] Unable to watch INT line %s, fallback to polling: %s"%(self.unique_id,line,error))
+        self.setEdgeSource(edge_source)
+        if edge_source is not None:
+            # Acquired again by setEdgeSource
+            edge_source.release()
+
+    def setEdgeSource(self, edge_source):
+        """Switch to interrupt mode driven by edge_source, or to polling mode if None.
+
+        Several chips can share one edge source, which is closed when the last one releases it.
+        """
+        if edge_source is not None:
+            edge_source.acquire()
+        if self._edge_source is not None:
+            self._edge_source.release()
+        self._edge_source = edge_source
+        # INTA/INTB mirrored on one open-drain active-low line, shareable between chips
+        self._iocon = self.IOCON_MIRROR | self.IOCON_ODR if edge_source is not None else 0x00
+        self.reInit()
+
+    def chipOption(self, key, default, reducer=min):
+        """Return a chip-wide option: the values set in the options of the attached entities reduced by reducer (smallest by default)"""
+        values = [
+            entity._entry_infos.options[key]
+            for entity in self._entities
+            if entity is not None and key in entity._entry_infos.options
+        ]
+        return reducer(values) if values else default
 
     def toBin(self,s):
-        """Display binaries registers"""
-        return  "[ %s , %s ]"%(bin(s[0])[2:].rjust(8,'0'),bin(s[1])[2:].rjust(8,'0'))
+        """Display binaries registers (unknown values as '-')"""
+        return  "[ %s , %s ]"%tuple(bin(v)[2:].rjust(8,'0') if v is not None else '-'*8 for v in s)
     
     def displayStatus(self):
         """Display configuration and states"""
@@ -300,81 +1199,183 @@ class MCP23017(threading.Thread):
         _LOGGER.info('# IO Direct: %s'%self.toBin(self._io_dir))
         _LOGGER.info('#    Invert: %s'%self.toBin(self._invert))
         _LOGGER.info('#    Pullup: %s'%self.toBin(self._pullup))
-        _LOGGER.info('#   Hw sync: %s'%self.toBin(self._hw_sync))
+        _LOGGER.info('# Hw follow: %s'%self.toBin(self._hw_follow))
+        _LOGGER.info('#  Filtered: %s'%self.toBin(self._filter_mask))
+        _LOGGER.info('#  Counters: %s'%self.toBin([self._count_rising[port] | self._count_falling[port] for port in range(2)]))
+        _LOGGER.info('# Conf checks: %d, drifts: %d'%(self._conf_checks,self._conf_drifts))
+        _LOGGER.info('# Scan rates: fast %.3fs, idle %.3fs, decay %.1fs'%(self._scan_fast,self._scan_idle,self._scan_decay))
+        _LOGGER.info('# Bus budget: %s'%(self.scan_budget))
  
-    def checkConf(self):
-        """Check conf has not changed"""
-        try:
+    def confRegisters(self):
+        """Return the expected content of registers IODIRA (0x00) to GPPUB (0x0D)"""
+        regs = [0x00]*(self.GPPUB+1)
+        for port in range(2):
+            regs[self.IODIRA+port] = self._io_dir[port]
+            regs[self.IOPOLA+port] = self._invert[port] & self._io_dir[port]
+            # Interrupt on change (compared to previous value) on every input
+            regs[self.GPINTENA+port] = self._io_dir[port] if self._edge_source is not None else 0x00
+            regs[self.IOCONA+port] = self._iocon
+            regs[self.GPPUA+port]  = self._pullup[port]
+        return regs
+
+    def writeConf(self, registers):
+        """Write the registers IODIRA to GPPUB which differ from the last known content of the chip.
+
+        IOCON is written first, so that the others are addressed with BANK=0,
+        then pending outputs, so that new output pins start at their level.
+        Each run of consecutive registers to write is one transaction.
+        Return the number of I2C transactions.
+        """
+        current = self._chip_registers if self._chip_registers is not None else [None]*len(registers)
+        writes = 0
+        # Keep BANK=0 and SEQOP=0 so that block reads walk A/B registers sequentially
+        if current[self.IOCONA] != registers[self.IOCONA]:
+            self._smbus.write_byte_data(self._address, self.IOCONA, registers[self.IOCONA])
+            writes += 1
+        if self.write_pending:
+            self.writeOutputs()
+            writes += 1
+        differ = [register != value for register, value in zip(registers, current)]
+        # IOCONB is the same register as IOCONA
+        differ[self.IOCONA] = differ[self.IOCONB] = False
+        start = None
+        for address in range(len(registers) + 1):
+            if address < len(registers) and differ[address]:
+                if start is None:
+                    start = address
+            elif start is not None:
+                if address - start == 1:
+                    self._smbus.write_byte_data(self._address, start, registers[start])
+                else:
+                    self._smbus.write_i2c_block_data(self._address, start, registers[start:address])
+                writes += 1
+                start = None
+        self._chip_registers = list(registers)
+        return writes
+
+    def readRegisters(self):
+        """Read registers IODIRA to OLATB in one transaction, at the first configuration (warm start).
+
+        A chip already configured (Home Assistant restart) or at its power-on
+        values keeps its registers and outputs: only the registers which differ
+        are then written. Return False if the chip is not in sequential mode
+        (unknown content, all registers are written).
+        """
+        data = list(self._smbus.read_i2c_block_data(self._address, self.IODIRA, self.OLATB+1))
+        if data[self.IOCONA] != data[self.IOCONB] or data[self.IOCONA] & self.IOCON_SEQOP:
+            _LOGGER.warning("[%s] Unexpected IOCON value 0x%02x, full configuration"%(self.unique_id,data[self.IOCONA]))
+            return False
+        self._chip_registers = data[:self.GPPUB+1]
+        self._switches_states = data[self.OLATA:self.OLATB+1]
+        with self._outputs_lock:
+            self._new_switches_states[:] = self._switches_states
+        _LOGGER.info("[%s] Warm start, outputs %s"%(self.unique_id,self.toBin(self._switches_states)))
+        return True
+
+    def adoptOutputs(self):
+        """Set the state of new switch entities from the outputs of the chip.
+
+        Pins already outputs keep their level when their switch takes its
+        initial value from the hardware (hw_sync): no glitch across a restart
+        or a reload. Without a live level (chip reset, pin not yet an output)
+        they take the state restored by Home Assistant. The others start off.
+        The live level wins over the restored state, a difference is logged.
+        """
+        live = [0b00000000,0b00000000]
+        restored_on = [0b00000000,0b00000000]
+        for pin, entity in enumerate(self._entities):
+            port, bit = pin // 8, 1 << (pin % 8)
+            if entity is None or not self._adopt_mask[port] & bit:
+                continue
+            if entity._hw_sync:
+                live[port] |= bit
+                if getattr(entity, 'restored_state', None):
+                    restored_on[port] |= bit
+        if self._chip_registers is None:
+            live = [0b00000000,0b00000000]
+        else:
+            live = [live[port] & ~self._chip_registers[self.IODIRA+port] & 0xFF for port in range(2)]
+        with self._outputs_lock:
             for port in range(2):
-                if (
-                        (self._invert[port] & self._io_dir[port] != self._smbus.read_byte_data(self._address, self.IOPOLA+port)) or
-                        (self._io_dir[port] != self._smbus.read_byte_data(self._address, self.IODIRA+port)) or 
-                        (self._pullup[port] != self._smbus.read_byte_data(self._address, self.GPPUA+port))
-                        ):
-                    return False
-        except Exception as err:
-            _LOGGER.warning("Check conf failed reading data")
-            _LOGGER.warning(err)
+                cold = self._adopt_mask[port] & ~live[port]
+                self._new_switches_states[port] = (self._new_switches_states[port] & ~cold) | ((self._invert[port] ^ restored_on[port]) & cold)
+            outputs = list(self._new_switches_states)
+        for pin, entity in enumerate(self._entities):
+            port, bit = pin // 8, 1 << (pin % 8)
+            if entity is None or not self._adopt_mask[port] & bit:
+                continue
+            state = bool(outputs[port] & bit) != entity._invert_logic
+            restored = getattr(entity, 'restored_state', None)
+            if live[port] & bit and restored is not None and restored != state:
+                _LOGGER.warning("[%s] %s (pin %d) restored %s, kept %s as wired"%(self.unique_id,entity.name,pin,"on" if restored else "off","on" if state else "off"))
+            self._pushInput(entity.async_adopt_state, state)
+        self._adopt_mask = [0b00000000,0b00000000]
+
+    def checkConf(self):
+        """Check conf has not changed, reading all configuration registers in one transaction"""
+        self._conf_checks += 1
+        self._verify_pending = False
+        self._next_verify = time.monotonic() + self._verify_interval
+        expected = self.confRegisters()
+        current = self._smbus.read_i2c_block_data(self._address, self.IODIRA, len(expected))
+        if current[self.IOCONA] != self._iocon:
+            # IOCON is back to its power-on value: the chip has been reset
+            _LOGGER.warning("[%s] Unexpected IOCON value 0x%02x"%(self.unique_id,current[self.IOCONA]))
+        if list(current) != expected:
+            self._conf_drifts += 1
+            _LOGGER.warning("[%s] Configuration drift detected (%d/%d checks)"%(self.unique_id,self._conf_drifts,self._conf_checks))
+            # Only the drifted registers are written back, outputs too as the chip may have been reset
+            self._chip_registers = list(current)
+            self._switches_states = [None, None]
+            self._reconfigure = True
+            return False
         return True
-        
-    def confGPIO(self,newConf=True):
-        """Configure GPIO"""
-        if newConf:
-            #                     GPIOIA      GPIOB
+
+    def confGPIO(self):
+        """Configure GPIO: compute the expected registers from the entities and write the ones which differ."""
+        if self._reconfigure:
+            self._reinits += 1
+        # Still set if this pass fails
+        self._reconfigure = True
+        #                     GPIOIA      GPIOB
+        self._io_dir     = [0b00000000,0b00000000]
+        self._invert     = [0b00000000,0b00000000]
+        self._pullup     = [0b00000000,0b00000000]
+        self._hw_follow  = [0b00000000,0b00000000]
+        if self._last_state is None:
             self._last_state = [0b00000000,0b00000000]
-            self._new_state  = [0b00000000,0b00000000]
-            self._io_dir     = [0b00000000,0b00000000]
-            self._invert     = [0b00000000,0b00000000]
-            self._pullup     = [0b00000000,0b00000000]
-            self._hw_sync    = [0b00000000,0b00000000]
-            _LOGGER.info("########################################")
-            _LOGGER.info("##############GPIO CONF#################")
-            _LOGGER.info("## %s"%(self.unique_id))
-            port = 0
-            pin  = 0
-            for entity in self._entities:
-                if entity != None:
-                    _LOGGER.info("%s (%d): %s"%(type(entity).__name__,entity.pin,entity.name))
-                    if  entity.pin < 8:
-                        pin = entity.pin
-                    else:
-                        pin  = entity.pin - 8
-                        port = 1
-                    if type(entity).__name__ == 'MCP23017Switch':
-                        if entity.is_on:
-                            self._new_state[port] =  self._new_state[port] | (1 << pin) 
-                    elif type(entity).__name__ == 'MCP23017BinarySensor':
-                        self._io_dir[port] =  self._io_dir[port] | (1 << pin)     
-                        if entity._pullup == 'UP':
-                            self._pullup[port] =  self._pullup[port] | (1 << pin)
-                    else:
-                        raise ("Try to configure an unsupported object: %s"%(type(entity).__name__ ))    
-                    if entity._invert_logic:
-                        self._invert[port] = self._invert[port] | (1 << pin)
-        for port in range (2):
-            inputs_invert = self._invert[port] & self._io_dir[port]
-            self._smbus.write_byte_data(self._address, self.IOPOLA+port, inputs_invert)
-            # switch invert
-            switches_invert = self._invert[port] & ~ self._io_dir[port]
-            #self._smbus.write_byte_data(self._address, self.OLATA+port, switches_invert)
-            
-            if self._first_init == True:
-                self._switches_states[port] = switches_invert
-                self._new_switches_states[port] = switches_invert
-                if port == 1:
-                    self._first_init = False
-            
-            self._smbus.write_byte_data(self._address,self.OLATA+port,self._new_switches_states[port])
-
-
-            
-            #set selected IO direction 
-            self._smbus.write_byte_data(self._address, self.IODIRA+port, self._io_dir[port])
-            #set pullup 
-            self._smbus.write_byte_data(self._address, self.GPPUA+port, self._pullup[port])
-            # TODO hw_sync
+        _LOGGER.info("########################################")
+        _LOGGER.info("##############GPIO CONF#################")
+        _LOGGER.info("## %s"%(self.unique_id))
+        for entity in self._entities:
+            if entity != None:
+                _LOGGER.info("%s (%d): %s"%(type(entity).__name__,entity.pin,entity.name))
+                port = entity.pin // 8
+                pin  = entity.pin % 8
+                if type(entity).__name__ == 'MCP23017Switch':
+                    if entity._hw_follow:
+                        self._hw_follow[port] = self._hw_follow[port] | (1 << pin)
+                elif type(entity).__name__ in ('MCP23017BinarySensor', 'MCP23017Counter'):
+                    self._io_dir[port] =  self._io_dir[port] | (1 << pin)
+                    if entity._pullup == 'UP':
+                        self._pullup[port] =  self._pullup[port] | (1 << pin)
+                else:
+                    raise ValueError("Try to configure an unsupported object: %s"%(type(entity).__name__ ))
+                if entity._invert_logic:
+                    self._invert[port] = self._invert[port] | (1 << pin)
+        if self._chip_registers is None and not self.readRegisters():
+            # Unknown chip state: write all registers, outputs included
+            self._switches_states = [None, None]
+        if self._adopt_mask != [0, 0]:
+            self.adoptOutputs()
+        writes = self.writeConf(self.confRegisters())
+        _LOGGER.info("## %d I2C writes"%(writes))
         _LOGGER.info("########################################")
         self._to_init = False
+        self._reconfigure = False
+        self._hw_resync = self._hw_follow != NO_PINS
+        self._verify_pending = False
+        self._next_verify = time.monotonic() + self._verify_interval
         self.displayStatus()
 
                 
@@ -1,7 +1,5 @@
 """Platform for mcp23017-based binary_sensor."""
 
-import asyncio
-import functools
 import logging
 
 import voluptuous as vol
@@ -9,19 +7,13 @@ import voluptuous as vol
 from homeassistant.components.binary_sensor import PLATFORM_SCHEMA, BinarySensorEntity
 from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
 
-from . import async_get_or_create
-from homeassistant.config_entries import SOURCE_IMPORT
+from . import async_register_entities, pin_entries
 from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.entity_platform import (
-    AddEntitiesCallback,
-    async_get_current_platform,
-)
 
 from .const import (
     CONF_FLOW_PIN_NAME,
     CONF_FLOW_PIN_NUMBER,
-    CONF_FLOW_PLATFORM,
     CONF_I2C_ADDRESS,
     CONF_INVERT_LOGIC,
     CONF_PINS,
@@ -33,7 +25,34 @@ from .const import (
     MODE_DOWN,
     MODE_UP,
     DEVICE_MANUFACTURER,
+    CONF_SCAN_CLASS,
+    CONF_SCAN_FAST,
+    CONF_SCAN_IDLE,
+    CONF_SCAN_DECAY,
+    DEFAULT_SCAN_CLASS,
+    DEFAULT_SCAN_FAST,
+    DEFAULT_SCAN_IDLE,
+    DEFAULT_SCAN_DECAY,
+    SCAN_CLASSES,
+    CONF_FILTER,
+    CONF_FILTER_TIME,
+    CONF_FILTER_SAMPLES,
+    DEFAULT_FILTER,
+    DEFAULT_FILTER_TIME,
+    DEFAULT_FILTER_SAMPLES,
+    CONF_EDGE_EVENTS,
+    DEFAULT_EDGE_EVENTS,
+    CONF_GESTURES,
+    CONF_DOUBLE_PRESS_TIME,
+    CONF_LONG_PRESS_TIME,
+    CONF_RAW_STATE,
+    DEFAULT_GESTURES,
+    DEFAULT_DOUBLE_PRESS_TIME,
+    DEFAULT_LONG_PRESS_TIME,
+    DEFAULT_RAW_STATE,
 )
+from .filters import create_filter
+from .gestures import GestureDetector
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -51,12 +70,15 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
 )
 
 async def async_setup_entry(hass, entry_infos, async_add_entities):
-    """Set up a MCP23017 binary_sensor entry."""
-    if(entry_infos.data[CONF_FLOW_PLATFORM])=='binary_sensor':
-        entity = MCP23017BinarySensor(hass, entry_infos)
-        async_add_entities([entity], True)
-        platform = async_get_current_platform()
-        await async_get_or_create(hass, entity)
+    """Set up the binary_sensor entities of a MCP23017 entry."""
+    entities = [
+        MCP23017BinarySensor(hass, pin_entry)
+        for pin_entry in pin_entries(entry_infos, 'binary_sensor')
+    ]
+    if entities:
+        # Buttons decoded as gestures may drop their raw state entity
+        async_add_entities([entity for entity in entities if entity.raw_state], True)
+        await async_register_entities(hass, entry_infos, entities)
 
 class MCP23017BinarySensor(BinarySensorEntity):
     """Represent a binary sensor that uses MCP23017."""
@@ -69,6 +91,7 @@ class MCP23017BinarySensor(BinarySensorEntity):
         self._i2c_address = entry_infos.data[CONF_I2C_ADDRESS]
         self._pin_name = entry_infos.data[CONF_FLOW_PIN_NAME]
         self._pin_number = entry_infos.data[CONF_FLOW_PIN_NUMBER]
+        self._device = None
         # Get invert_logic from config flow (options) or import (data)
         self._invert_logic = entry_infos.options.get(
             CONF_INVERT_LOGIC,
@@ -86,11 +109,7 @@ class MCP23017BinarySensor(BinarySensorEntity):
             )
         )
 
-        #Subscribe to updates of config entry options
-        self._unsubscribe_update_listener = entry_infos.add_update_listener(
-           self.async_config_update
-        )
-        
+
     @property
     def icon(self):
         """Return device icon for this entity."""
@@ -126,6 +145,56 @@ class MCP23017BinarySensor(BinarySensorEntity):
         """Return the i2c address of the entity."""
         return self._i2c_address
 
+    @property
+    def scan_rates(self):
+        """Return (scan_fast, scan_idle, scan_decay) of the scan class of this input."""
+        options = self._entry_infos.options
+        scan_class = options.get(CONF_SCAN_CLASS, DEFAULT_SCAN_CLASS)
+        if scan_class in SCAN_CLASSES:
+            return SCAN_CLASSES[scan_class]
+        return (
+            options.get(CONF_SCAN_FAST, DEFAULT_SCAN_FAST),
+            options.get(CONF_SCAN_IDLE, DEFAULT_SCAN_IDLE),
+            options.get(CONF_SCAN_DECAY, DEFAULT_SCAN_DECAY),
+        )
+
+    @property
+    def input_filter(self):
+        """Return a new debounce/glitch filter for this input, None if not filtered."""
+        options = self._entry_infos.options
+        return create_filter(
+            options.get(CONF_FILTER, DEFAULT_FILTER),
+            options.get(CONF_FILTER_TIME, DEFAULT_FILTER_TIME),
+            options.get(CONF_FILTER_SAMPLES, DEFAULT_FILTER_SAMPLES),
+        )
+
+    @property
+    def edge_events(self):
+        """Return True if changes of this input fire mcp23017_edge events."""
+        return self._entry_infos.options.get(CONF_EDGE_EVENTS, DEFAULT_EDGE_EVENTS)
+
+    @property
+    def gesture_detector(self):
+        """Return a new gesture detector for this input, None if gestures are disabled."""
+        options = self._entry_infos.options
+        if not options.get(CONF_GESTURES, DEFAULT_GESTURES):
+            return None
+        return GestureDetector(
+            options.get(CONF_DOUBLE_PRESS_TIME, DEFAULT_DOUBLE_PRESS_TIME),
+            options.get(CONF_LONG_PRESS_TIME, DEFAULT_LONG_PRESS_TIME),
+        )
+
+    @property
+    def raw_state(self):
+        """Return True if the state of this input is published as a binary_sensor."""
+        options = self._entry_infos.options
+        return options.get(CONF_RAW_STATE, DEFAULT_RAW_STATE) or not options.get(CONF_GESTURES, DEFAULT_GESTURES)
+
+    @property
+    def available(self):
+        """Return False while the device does not answer (circuit open)."""
+        return self._device is None or self._device.available
+
     @property
     def device_info(self) -> DeviceInfo:
         """Device info."""
@@ -151,26 +220,12 @@ class MCP23017BinarySensor(BinarySensorEntity):
         self._device = value
 
     @callback
-    async def async_push_update(self, state):
-        """Update the GPIO state."""
+    def async_update_state(self, state):
+        """Update the GPIO state, called from the event loop by the bus scheduler."""
         self._state = state
-        self.async_schedule_update_ha_state()
-
-    @callback
-    async def async_config_update(self, hass, entry_infos):
-        """Handle update from config entry options."""
-        _LOGGER.debug("[%s] async_config_update"%(self.unique_id))
-        old_logic = self._invert_logic 
-        self._invert_logic = entry_infos.options[CONF_INVERT_LOGIC]
-        if old_logic != self._invert_logic:
-            self._state = False
-            _LOGGER.debug("[%s] New invert logic value set: %s"%(self.unique_id,self._invert_logic ))
-        self._pullup = entry_infos.options[CONF_PULL_MODE]
-        self.async_schedule_update_ha_state()
-    
-    def unsubscribe_update_listener(self):
-        """Remove listener from config entry options."""
-        self._unsubscribe_update_listener()
+        # Pushed before the entity is added or after it is removed
+        if self.hass is not None:
+            self.async_write_ha_state()
 
     async def async_unload_entry(hass, config_entry):
         """Unload MCP23017 binary entry corresponding to config_entry."""
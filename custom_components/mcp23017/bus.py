@@ -0,0 +1,411 @@
+"""I2C bus schedulers driving all MCP23017 devices of one bus."""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import selectors
+import threading
+import time
+
+from homeassistant.core import callback
+
+from .const import BUS_BACKEND_ASYNCIO, BUS_BACKEND_THREAD, DEFAULT_SCAN_RATE
+
+_LOGGER = logging.getLogger(__name__)
+
+# Passes over the chips of an INT line still held low after an edge, before waiting for the next edge
+MAX_HELD_PASSES = 8
+
+
+@callback
+def async_apply_pushes(pushes):
+    """Apply a batch of entity updates, in the event loop."""
+    for push, state in pushes:
+        push(state)
+
+
+class BusScheduler:
+    """Devices, SMBus handle and tick statistics shared by bus schedulers."""
+
+    def __init__(self, bus, smbus):
+        self._bus = bus
+        # Handle borrowed from the SMBus pool, or another bus object (benchmarks)
+        self._smbus = smbus
+        self._devices = []
+        self._devices_lock = threading.Lock()
+        self._edge_sources = set()
+
+        # Tick timing (seconds)
+        self._ticks = 0
+        self._tick_duration = 0
+        self._tick_duration_max = 0
+        self._tick_duration_total = 0
+        self._tick_jitter = 0
+        self._tick_jitter_max = 0
+        self._overruns = 0
+
+    @property
+    def unique_id(self):
+        """Return bus unique id."""
+        return f"/dev/i2c-{self._bus}"
+
+    @property
+    def bus(self):
+        """Return I2C bus number"""
+        return self._bus
+
+    @property
+    def smbus(self):
+        """Return the SMBus handle shared by all devices of the bus."""
+        return self._smbus
+
+    @property
+    def devices(self):
+        """Return devices driven by this scheduler."""
+        with self._devices_lock:
+            return list(self._devices)
+
+    @property
+    def timing(self):
+        """Return tick timing statistics (seconds)."""
+        return {
+            "ticks": self._ticks,
+            "tick_duration": self._tick_duration,
+            "tick_duration_max": self._tick_duration_max,
+            "tick_duration_avg": self._tick_duration_total / self._ticks if self._ticks else 0,
+            "tick_jitter": self._tick_jitter,
+            "tick_jitter_max": self._tick_jitter_max,
+            "overruns": self._overruns,
+        }
+
+    @property
+    def budget(self):
+        """Return I2C transactions and bytes per second of the bus, computed from the configuration of its devices."""
+        budget = {}
+        for device in self.devices:
+            for key, value in device.scan_budget.items():
+                budget[key] = budget.get(key, 0) + value
+        return budget
+
+    @property
+    def metrics(self):
+        """Return tick timing, configured budget and transfer counters of the bus."""
+        metrics = {"timing": self.timing, "budget": self.budget}
+        if hasattr(self._smbus, "stats"):
+            metrics.update(self._smbus.stats())
+        return metrics
+
+    def add_device(self, device):
+        """Drive device from this scheduler."""
+        with self._devices_lock:
+            self._devices.append(device)
+        device.smbus = self._smbus
+        device._wake = self.wake
+        self.wake()
+
+    def remove_device(self, device):
+        """Stop driving device."""
+        with self._devices_lock:
+            self._devices.remove(device)
+        device._wake = None
+        self.wake()
+
+    def detach_devices(self):
+        """Stop waking the scheduler up from the devices, once it is stopped."""
+        with self._devices_lock:
+            for device in self._devices:
+                device._wake = None
+
+    def wake(self):
+        """Write switch commands and rescan INT lines without waiting for the next tick."""
+        raise NotImplementedError()
+
+    def poll_devices(self, devices, edges=()):
+        """Poll all devices in one pass, edges are the INT lines which fell."""
+        for device in devices:
+            with device:
+                device.poll(device.edge_source in edges)
+
+    def poll_edges(self, devices, edges):
+        """Poll devices of the INT lines which fell, write pending switch commands of the others."""
+        for device in devices:
+            if device.edge_source in edges:
+                with device:
+                    device.poll(True)
+            elif device.write_pending:
+                with device:
+                    device.flushOutputs()
+
+    def poll_pass(self, devices, edges=()):
+        """Poll devices which are due as one tick, then serve INT lines and switch commands of the others."""
+        now = time.monotonic()
+        due = [device for device in devices if device.next_poll <= now]
+        others = [device for device in devices if device.next_poll > now]
+        if due:
+            self.tick(due, edges, now - min(device.next_poll for device in due))
+        self.poll_edges(others, edges)
+        if edges:
+            self.poll_held(devices, edges)
+
+    def poll_held(self, devices, edges):
+        """Poll again the devices of the INT lines still held low once their edge is served.
+
+        A chip asserting INT while another one holds the shared line low makes no
+        new edge: its changes are read while the line stays low.
+        """
+        for _ in range(MAX_HELD_PASSES):
+            try:
+                held = {edge_source for edge_source in edges if edge_source.active()}
+            except (OSError, ValueError) as error:
+                # An edge source has been closed while serving it
+                _LOGGER.debug("[%s] INT line read failed: %s"%(self.unique_id,error))
+                return
+            if not held:
+                return
+            for edge_source in held:
+                # Asserted after the edge
+                edge_source.edge_time = None
+            self.poll_edges(devices, held)
+            edges = held
+        _LOGGER.debug("[%s] INT line still held low after %d passes"%(self.unique_id,MAX_HELD_PASSES))
+
+    def next_poll(self, devices):
+        """Return the monotonic time of the next tick."""
+        return min((device.next_poll for device in devices), default=time.monotonic() + DEFAULT_SCAN_RATE)
+
+    def tick(self, devices, edges=(), jitter=0):
+        """Poll devices in one pass and record its timing."""
+        start = time.monotonic()
+        self.poll_devices(devices, edges)
+        self.record_tick(time.monotonic() - start, jitter)
+
+    def record_tick(self, duration, jitter):
+        """Update tick statistics."""
+        self._ticks += 1
+        self._tick_duration = duration
+        self._tick_duration_total += duration
+        self._tick_duration_max = max(self._tick_duration_max, duration)
+        self._tick_jitter = jitter
+        self._tick_jitter_max = max(self._tick_jitter_max, jitter)
+        if jitter > DEFAULT_SCAN_RATE:
+            # Devices polled more than a default scan period late
+            self._overruns += 1
+
+
+class MCP23017Bus(BusScheduler, threading.Thread):
+    """Single polling thread and SMBus handle for all MCP23017 of an I2C bus.
+
+    A tick polls all devices which are due in one pass (inputs read and queued
+    output writes), each device choosing its next poll time. Between ticks,
+    devices in interrupt mode are polled as soon as their INT line falls, and
+    switch commands are written as soon as they wake the scheduler up.
+    """
+
+    # Value of the bus_backend option selecting this scheduler
+    backend = BUS_BACKEND_THREAD
+
+    def __init__(self, bus, smbus):
+        BusScheduler.__init__(self, bus, smbus)
+        self._run = False
+
+        # Wake up pipe to interrupt the wait between ticks
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        # Called from the event loop: a full pipe already wakes the thread up
+        os.set_blocking(self._wake_write, False)
+        # Serializes wake() and the close of the pipe
+        self._wake_lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._wake_read, selectors.EVENT_READ)
+
+        threading.Thread.__init__(self, name=self.unique_id)
+        _LOGGER.info("%s bus scheduler created", self.unique_id)
+
+    def wake(self):
+        """Interrupt the wait between ticks, nothing once stopped."""
+        with self._wake_lock:
+            if self._wake_write is not None:
+                try:
+                    os.write(self._wake_write, b"\0")
+                except BlockingIOError:
+                    pass
+
+    def start_polling(self):
+        """Start polling thread."""
+        self._run = True
+        self.start()
+
+    def stop_polling(self):
+        """Stop polling thread, if started."""
+        self._run = False
+        self.wake()
+        if self.ident is not None:
+            self.join()
+        self.detach_devices()
+        self._selector.close()
+        with self._wake_lock:
+            os.close(self._wake_read)
+            os.close(self._wake_write)
+            self._wake_read = self._wake_write = None
+
+    def _update_edge_sources(self, devices):
+        """Watch the INT lines of the devices in interrupt mode."""
+        edge_sources = {device.edge_source for device in devices if device.edge_source is not None}
+        if edge_sources == self._edge_sources:
+            return
+        for edge_source in self._edge_sources - edge_sources:
+            self._selector.unregister(edge_source)
+        for edge_source in edge_sources - self._edge_sources:
+            self._selector.register(edge_source, selectors.EVENT_READ)
+        self._edge_sources = edge_sources
+
+    def run(self):
+        """Run ticks until stop_polling is called."""
+        _LOGGER.info("%s start polling thread", self.unique_id)
+        while self._run:
+            devices = self.devices
+            edges = set()
+            try:
+                self._update_edge_sources(devices)
+                timeout = max(0, self.next_poll(devices) - time.monotonic())
+                for key, _ in self._selector.select(timeout):
+                    if key.fileobj == self._wake_read:
+                        try:
+                            os.read(self._wake_read, 4096)
+                        except BlockingIOError:
+                            pass
+                    elif key.fileobj.read():
+                        edges.add(key.fileobj)
+            except (OSError, ValueError, KeyError) as error:
+                # An edge source has been closed while waiting
+                _LOGGER.debug("[%s] wait failed: %s"%(self.unique_id,error))
+                self._edge_sources = set()
+                self._selector.close()
+                self._selector = selectors.DefaultSelector()
+                self._selector.register(self._wake_read, selectors.EVENT_READ)
+                continue
+
+            self.poll_pass(devices, edges)
+            self.send_pushes(devices)
+
+    def send_pushes(self, devices):
+        """Send the entity updates of all devices to the event loop in a single callback."""
+        batches = {}
+        for device in devices:
+            pushes = device.takePushes()
+            if pushes:
+                batches.setdefault(device.loop, []).extend(pushes)
+        for loop, pushes in batches.items():
+            loop.call_soon_threadsafe(async_apply_pushes, pushes)
+
+
+class MCP23017AsyncBus(BusScheduler):
+    """Bus scheduler running in the event loop, without a dedicated polling thread.
+
+    Ticks are timed with loop.call_at and INT lines are watched with
+    loop.add_reader. I2C transfers run in a single worker executor owned by
+    the bus, which keeps them serialized, and entity updates are applied
+    directly in the event loop when a transfer completes.
+    """
+
+    # Value of the bus_backend option selecting this scheduler
+    backend = BUS_BACKEND_ASYNCIO
+
+    def __init__(self, hass, bus, smbus):
+        BusScheduler.__init__(self, bus, smbus)
+        self._hass = hass
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.unique_id)
+        self._running = False
+        self._timer = None
+        self._busy = False
+        self._pending = False
+        self._edges = set()
+        _LOGGER.info("%s asyncio bus scheduler created", self.unique_id)
+
+    def is_alive(self):
+        """Return True while polling (same API as MCP23017Bus)."""
+        return self._running
+
+    def start_polling(self):
+        """Start polling, from any thread."""
+        self._running = True
+        self.wake()
+
+    def stop_polling(self):
+        """Stop polling, from any thread, and wait for the current I2C transfers."""
+        self._running = False
+        self._hass.loop.call_soon_threadsafe(self._async_stop)
+        self._executor.shutdown(wait=True)
+        self.detach_devices()
+
+    def wake(self):
+        """Write switch commands and rescan devices as soon as possible, from any thread."""
+        self._hass.loop.call_soon_threadsafe(self._async_wake)
+
+    @callback
+    def _async_stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for edge_source in self._edge_sources:
+            self._hass.loop.remove_reader(edge_source.fileno())
+        self._edge_sources = set()
+
+    @callback
+    def _async_schedule(self, devices):
+        """Time the next tick (the loop clock is time.monotonic)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._running:
+            self._timer = self._hass.loop.call_at(self.next_poll(devices), self._async_wake)
+
+    @callback
+    def _async_update_edge_sources(self, devices):
+        """Watch the INT lines of the devices in interrupt mode."""
+        edge_sources = {device.edge_source for device in devices if device.edge_source is not None}
+        if edge_sources == self._edge_sources:
+            return
+        for edge_source in self._edge_sources - edge_sources:
+            self._hass.loop.remove_reader(edge_source.fileno())
+        for edge_source in edge_sources - self._edge_sources:
+            self._hass.loop.add_reader(edge_source.fileno(), self._async_edge, edge_source)
+        self._edge_sources = edge_sources
+
+    @callback
+    def _async_edge(self, edge_source):
+        if edge_source.read():
+            self._edges.add(edge_source)
+            self._async_wake()
+
+    @callback
+    def _async_wake(self):
+        if not self._running:
+            return
+        if self._busy:
+            # Run again when the current pass is over
+            self._pending = True
+            return
+        self._busy = True
+        self._hass.async_create_background_task(self._async_run(), self.unique_id)
+
+    async def _async_run(self):
+        """Run a pass in the executor, then time the next tick."""
+        devices = self.devices
+        try:
+            self._async_update_edge_sources(devices)
+            edges, self._edges = self._edges, set()
+            await self._hass.loop.run_in_executor(self._executor, self.poll_pass, devices, edges)
+            # Already in the event loop: apply entity updates without another hop
+            for device in devices:
+                async_apply_pushes(device.takePushes())
+        except RuntimeError as error:
+            # Executor shut down by stop_polling
+            _LOGGER.debug("[%s] pass cancelled: %s"%(self.unique_id,error))
+        finally:
+            self._busy = False
+        if self._pending:
+            self._pending = False
+            self._async_wake()
+        else:
+            self._async_schedule(devices)
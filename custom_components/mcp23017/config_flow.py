@@ -1,22 +1,17 @@
 """Config flow for MCP23017 component."""
 
 import voluptuous as vol
-import glob
 import logging
 
-import smbus2 
-
 from homeassistant import config_entries
 from homeassistant.core import callback
 
 from .const import (
     DOMAIN,
     CONF_FLOW_PLATFORM,
-    CONF_I2C_BUS,
-    CONF_DEFAULT_I2C_BUS,
-    SKIP_I2C_BUSES,
     DEFAULT_I2C_ADDRESS,
     CONF_I2C_ADDRESS,
+    PLATFORMS,
     CONF_PINS,
     CONF_FLOW_PIN_NUMBER,
     CONF_FLOW_PIN_NAME,
@@ -26,34 +21,65 @@ from .const import (
     DEFAULT_PULL_MODE,
     DEFAULT_HW_SYNC,
     CONF_HW_SYNC,
+    DEFAULT_HW_FOLLOW,
+    CONF_HW_FOLLOW,
     MODE_UP,
     MODE_DOWN,
+    CONF_VERIFY_INTERVAL,
+    DEFAULT_VERIFY_INTERVAL,
+    CONF_INTERRUPT_LINE,
+    CONF_BUS_BACKEND,
+    DEFAULT_BUS_BACKEND,
+    BUS_BACKEND_THREAD,
+    BUS_BACKEND_ASYNCIO,
+    CONF_SCAN_FAST,
+    CONF_SCAN_IDLE,
+    CONF_SCAN_DECAY,
+    DEFAULT_SCAN_FAST,
+    DEFAULT_SCAN_IDLE,
+    DEFAULT_SCAN_DECAY,
+    CONF_SCAN_CLASS,
+    DEFAULT_SCAN_CLASS,
+    SCAN_CLASSES,
+    SCAN_CLASS_CUSTOM,
+    CONF_FILTER,
+    CONF_FILTER_TIME,
+    CONF_FILTER_SAMPLES,
+    DEFAULT_FILTER,
+    DEFAULT_FILTER_TIME,
+    DEFAULT_FILTER_SAMPLES,
+    FILTERS,
+    CONF_COUNT_EDGE,
+    CONF_COUNTER_INTERVAL,
+    COUNT_EDGES,
+    DEFAULT_COUNT_EDGE,
+    DEFAULT_COUNTER_INTERVAL,
+    CONF_EDGE_EVENTS,
+    DEFAULT_EDGE_EVENTS,
+    CONF_GESTURES,
+    CONF_DOUBLE_PRESS_TIME,
+    CONF_LONG_PRESS_TIME,
+    CONF_RAW_STATE,
+    DEFAULT_GESTURES,
+    DEFAULT_DOUBLE_PRESS_TIME,
+    DEFAULT_LONG_PRESS_TIME,
+    DEFAULT_RAW_STATE,
+    CONF_DIAGNOSTIC_SENSORS,
+    DEFAULT_DIAGNOSTIC_SENSORS,
 )
-
-PLATFORMS = ["binary_sensor","switch"]
+from .discovery import async_get_discovery
 
 _LOGGER = logging.getLogger(__name__)
 
 
 class MCP23017ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
-    """MCP23017 config flow."""
+    """MCP23017 config flow: one config entry per chip, holding its pin map."""
 
-    VERSION = 1
+    VERSION = 2
     CONNECTION_CLASS = config_entries.CONN_CLASS_LOCAL_POLL
 
-    def _title(self, user_input):
-        return "%s:pin %d ('%s')" % (
-            user_input[CONF_I2C_ADDRESS],
-            user_input[CONF_FLOW_PIN_NUMBER],
-            user_input[CONF_FLOW_PIN_NAME],
-        )
-
     def _unique_id(self, user_input):
-        return "%s.%s.%d" % (
-            DOMAIN,
-            user_input[CONF_I2C_ADDRESS],
-            user_input[CONF_FLOW_PIN_NUMBER],
-        )
+        return "%s.%s" % (DOMAIN, user_input[CONF_I2C_ADDRESS])
 
     @staticmethod
     @callback
@@ -61,49 +87,52 @@ class MCP23017ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         """Add support for config flow options."""
         return MCP23017OptionsFlowHandler(config_entry)
 
+    async def _async_add_pin(self, user_input, replace):
+        """Add a pin to the entry of its chip, creating the entry if needed."""
+        i2c_address = user_input[CONF_I2C_ADDRESS]
+        pin = str(user_input[CONF_FLOW_PIN_NUMBER])
+        pin_data = {
+            key: value
+            for key, value in user_input.items()
+            if key not in (CONF_I2C_ADDRESS, CONF_FLOW_PIN_NUMBER)
+        }
+        config_entry = await self.async_set_unique_id(self._unique_id(user_input))
+        if config_entry is None:
+            return self.async_create_entry(
+                title=i2c_address,
+                data={CONF_I2C_ADDRESS: i2c_address, CONF_PINS: {pin: pin_data}},
+            )
+        if pin in config_entry.data[CONF_PINS] and not replace:
+            return self.async_abort(reason="already_configured")
+        # The entry update listener reloads the chip with its new pin
+        self.hass.config_entries.async_update_entry(
+            config_entry,
+            data={
+                **config_entry.data,
+                CONF_PINS: {**config_entry.data[CONF_PINS], pin: pin_data},
+            },
+        )
+        return self.async_abort(reason="pin_added")
+
     async def async_step_import(self, user_input=None):
         """Create a new entity from configuration.yaml import."""
-
-        config_entry =  await self.async_set_unique_id(self._unique_id(user_input))
-        # Remove entry (from storage) matching the same unique id
-        if config_entry:
-            self.hass.config_entries.async_remove(config_entry.entry_id)
-
-        return self.async_create_entry(
-            title=self._title(user_input),
-            data=user_input,
-        )
+        # Replace the pin matching the same address and number
+        return await self._async_add_pin(user_input, replace=True)
 
 
     async def async_step_user(self, user_input=None):
         """Create a new entity from UI."""
 
         if user_input is not None:
-            await self.async_set_unique_id(self._unique_id(user_input))
-            self._abort_if_unique_id_configured()
-
             if CONF_FLOW_PIN_NAME not in user_input:
                 user_input[CONF_FLOW_PIN_NAME] = " pin %s:%d" % (
                     user_input[CONF_I2C_ADDRESS],
                     user_input[CONF_FLOW_PIN_NUMBER],
                 )
+            return await self._async_add_pin(user_input, replace=False)
 
-            return self.async_create_entry(
-                title=self._title(user_input),
-                data=user_input,
-            )
-
-        devices_detected=[]
-        i2c_buses=glob.glob('/dev/i2c-?')
-        for sbus in i2c_buses:
-            if sbus not in SKIP_I2C_BUSES:
-                bus = smbus2.SMBus(int(sbus[-1]))
-                for device in range (0x20,0x28):
-                    try:
-                        bus.read_byte(device)
-                        devices_detected+=[sbus+'@'+str(hex(device))]
-                    except:
-                        pass
+        # Cached inventory, refreshed in the background when stale
+        devices_detected = await async_get_discovery(self.hass).async_get_devices()
         if len(devices_detected) == 0:
             _LOGGER.error("No MCP23017 detected")
             return self.async_show_form(
@@ -136,48 +165,206 @@ class MCP23017ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         )
 
 class MCP23017OptionsFlowHandler(config_entries.OptionsFlow):
-    """MCP23017 config flow options."""
+    """MCP23017 config flow options: chip options, then the options of one pin."""
 
     def __init__(self, config_entry):
         """Initialize options flow."""
         self.config_entry = config_entry
+        self._options = dict(config_entry.options)
+        self._options[CONF_PINS] = dict(config_entry.options.get(CONF_PINS, {}))
+        self._pin = None
 
     async def async_step_init(self, user_input=None):
-        """Manage entity options."""
+        """Manage chip options and select the pin to configure."""
+
+        if user_input is not None:
+            self._pin = user_input.pop(CONF_FLOW_PIN_NUMBER, None)
+            self._options.update(user_input)
+            if self._pin is None:
+                return self.async_create_entry(title="", data=self._options)
+            return await self.async_step_pin()
+
+        pins = self.config_entry.data[CONF_PINS]
+        data_schema = vol.Schema(
+            {
+                vol.Optional(
+                    CONF_VERIFY_INTERVAL,
+                    default=self._options.get(
+                        CONF_VERIFY_INTERVAL, DEFAULT_VERIFY_INTERVAL
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+                vol.Optional(
+                    CONF_INTERRUPT_LINE,
+                    default=self._options.get(CONF_INTERRUPT_LINE, ""),
+                ): str,
+                vol.Optional(
+                    CONF_BUS_BACKEND,
+                    default=self._options.get(
+                        CONF_BUS_BACKEND, DEFAULT_BUS_BACKEND
+                    ),
+                ): vol.In([BUS_BACKEND_THREAD, BUS_BACKEND_ASYNCIO]),
+                vol.Optional(
+                    CONF_DIAGNOSTIC_SENSORS,
+                    default=self._options.get(
+                        CONF_DIAGNOSTIC_SENSORS, DEFAULT_DIAGNOSTIC_SENSORS
+                    ),
+                ): bool,
+                vol.Optional(CONF_FLOW_PIN_NUMBER): vol.In(
+                    {
+                        pin: "%s: %s (%s)" % (pin, pins[pin][CONF_FLOW_PIN_NAME], pins[pin][CONF_FLOW_PLATFORM])
+                        for pin in sorted(pins, key=int)
+                    }
+                ),
+            }
+        )
+        return self.async_show_form(step_id="init", data_schema=data_schema)
+
+    async def async_step_pin(self, user_input=None):
+        """Manage the options of the selected pin."""
 
         if user_input is not None:
-            return self.async_create_entry(title="", data=user_input)
+            self._options[CONF_PINS][self._pin] = user_input
+            return self.async_create_entry(title="", data=self._options)
+
+        options = self._options[CONF_PINS].get(self._pin, {})
+        platform = self.config_entry.data[CONF_PINS][self._pin][CONF_FLOW_PLATFORM]
         data_schema = vol.Schema(
             {
                 vol.Optional(
                     CONF_INVERT_LOGIC,
-                    default=self.config_entry.options.get(
+                    default=options.get(
                         CONF_INVERT_LOGIC, DEFAULT_INVERT_LOGIC
                     ),
                 ): bool,
             }
         )
-        if self.config_entry.data[CONF_FLOW_PLATFORM] == "binary_sensor":
+        if platform == "binary_sensor":
+            data_schema = data_schema.extend(
+                {
+                    vol.Optional(
+                        CONF_PULL_MODE,
+                        default=options.get(
+                            CONF_PULL_MODE, DEFAULT_PULL_MODE
+                        ),
+                    ): vol.In([MODE_UP, MODE_DOWN]),
+                    vol.Optional(
+                        CONF_SCAN_CLASS,
+                        default=options.get(
+                            CONF_SCAN_CLASS, DEFAULT_SCAN_CLASS
+                        ),
+                    ): vol.In(list(SCAN_CLASSES) + [SCAN_CLASS_CUSTOM]),
+                    vol.Optional(
+                        CONF_SCAN_FAST,
+                        default=options.get(
+                            CONF_SCAN_FAST, DEFAULT_SCAN_FAST
+                        ),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0.001)),
+                    vol.Optional(
+                        CONF_SCAN_IDLE,
+                        default=options.get(
+                            CONF_SCAN_IDLE, DEFAULT_SCAN_IDLE
+                        ),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0.001)),
+                    vol.Optional(
+                        CONF_SCAN_DECAY,
+                        default=options.get(
+                            CONF_SCAN_DECAY, DEFAULT_SCAN_DECAY
+                        ),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                    vol.Optional(
+                        CONF_FILTER,
+                        default=options.get(
+                            CONF_FILTER, DEFAULT_FILTER
+                        ),
+                    ): vol.In(FILTERS),
+                    vol.Optional(
+                        CONF_FILTER_TIME,
+                        default=options.get(
+                            CONF_FILTER_TIME, DEFAULT_FILTER_TIME
+                        ),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                    vol.Optional(
+                        CONF_FILTER_SAMPLES,
+                        default=options.get(
+                            CONF_FILTER_SAMPLES, DEFAULT_FILTER_SAMPLES
+                        ),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1, max=15)),
+                    vol.Optional(
+                        CONF_EDGE_EVENTS,
+                        default=options.get(
+                            CONF_EDGE_EVENTS, DEFAULT_EDGE_EVENTS
+                        ),
+                    ): bool,
+                    vol.Optional(
+                        CONF_GESTURES,
+                        default=options.get(
+                            CONF_GESTURES, DEFAULT_GESTURES
+                        ),
+                    ): bool,
+                    vol.Optional(
+                        CONF_DOUBLE_PRESS_TIME,
+                        default=options.get(
+                            CONF_DOUBLE_PRESS_TIME, DEFAULT_DOUBLE_PRESS_TIME
+                        ),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                    vol.Optional(
+                        CONF_LONG_PRESS_TIME,
+                        default=options.get(
+                            CONF_LONG_PRESS_TIME, DEFAULT_LONG_PRESS_TIME
+                        ),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0.05)),
+                    vol.Optional(
+                        CONF_RAW_STATE,
+                        default=options.get(
+                            CONF_RAW_STATE, DEFAULT_RAW_STATE
+                        ),
+                    ): bool,
+                }
+            )
+
+        if platform == "sensor":
             data_schema = data_schema.extend(
                 {
                     vol.Optional(
                         CONF_PULL_MODE,
-                        default=self.config_entry.options.get(
+                        default=options.get(
                             CONF_PULL_MODE, DEFAULT_PULL_MODE
                         ),
                     ): vol.In([MODE_UP, MODE_DOWN]),
+                    vol.Optional(
+                        CONF_COUNT_EDGE,
+                        default=options.get(
+                            CONF_COUNT_EDGE, DEFAULT_COUNT_EDGE
+                        ),
+                    ): vol.In(COUNT_EDGES),
+                    vol.Optional(
+                        CONF_COUNTER_INTERVAL,
+                        default=options.get(
+                            CONF_COUNTER_INTERVAL, DEFAULT_COUNTER_INTERVAL
+                        ),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1)),
                 }
             )
 
-        if self.config_entry.data[CONF_FLOW_PLATFORM] == "switch":
+        if platform == "switch":
             data_schema = data_schema.extend(
                 {
                     vol.Optional(
                         CONF_HW_SYNC,
-                        default=self.config_entry.options.get(
+                        default=options.get(
                             CONF_HW_SYNC, DEFAULT_HW_SYNC
                         ),
                     ): bool,
+                    vol.Optional(
+                        CONF_HW_FOLLOW,
+                        default=options.get(
+                            CONF_HW_FOLLOW, DEFAULT_HW_FOLLOW
+                        ),
+                    ): bool,
                 }
             )
-        return self.async_show_form(step_id="init", data_schema=data_schema)
+        return self.async_show_form(
+            step_id="pin",
+            data_schema=data_schema,
+            description_placeholders={"pin": self._pin},
+        )
@@ -6,12 +6,17 @@ DEVICE_MANUFACTURER="MicroChip"
 
 CONF_FLOW_PLATFORM = "platform"
 
-PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.SWITCH]
+# Platforms of the entities of a chip, binary_sensor first: default platform of a new pin
+PLATFORMS: list[Platform] = [Platform.BINARY_SENSOR, Platform.SENSOR, Platform.SWITCH]
 
 CONF_I2C_BUS="i2c_bus"
 CONF_DEFAULT_I2C_BUS='/dev/i2c-1'
 SKIP_I2C_BUSES=['/dev/i2c-0','/dev/i2c-2']
 
+# Discovery: addresses probed on each bus, inventory cache lifetime (seconds)
+DISCOVERY_ADDRESSES = range(0x20, 0x28)
+DISCOVERY_TTL = 300
+
 CONF_I2C_ADDRESS="i2c_address"
 DEFAULT_I2C_ADDRESS=0x20
 
@@ -22,14 +27,149 @@ CONF_FLOW_PIN_NAME = "pin_name"
 CONF_INVERT_LOGIC = "invert_logic"
 CONF_PULL_MODE = "pull_mode"
 CONF_HW_SYNC = "hw_sync"
+CONF_HW_FOLLOW = "hw_follow"
 
 MODE_UP = "UP"
 MODE_DOWN = "NONE"
 
 DEFAULT_HW_SYNC = True
+DEFAULT_HW_FOLLOW = False
 DEFAULT_INVERT_LOGIC = False
 DEFAULT_PULL_MODE = MODE_UP
 
 DEFAULT_SCAN_RATE = .2#.1 #seconds
 
+# Adaptive scan rate (seconds): inputs are scanned every scan_fast seconds during
+# scan_decay seconds after a change, then the interval doubles up to scan_idle
+CONF_SCAN_FAST = "scan_fast"
+CONF_SCAN_IDLE = "scan_idle"
+CONF_SCAN_DECAY = "scan_decay"
+DEFAULT_SCAN_FAST = .01
+DEFAULT_SCAN_IDLE = DEFAULT_SCAN_RATE
+DEFAULT_SCAN_DECAY = 2
+
+# Scan classes of input pins: (scan_fast, scan_idle, scan_decay)
+# The fastest input of a chip sets its scan rates, "custom" uses the scan_* options of the pin
+CONF_SCAN_CLASS = "scan_class"
+SCAN_CLASS_PUSHBUTTON = "pushbutton"
+SCAN_CLASS_CONTACT = "contact"
+SCAN_CLASS_SLOW = "slow_status"
+SCAN_CLASS_CUSTOM = "custom"
+SCAN_CLASS_COUNTER = "counter"
+SCAN_CLASSES = {
+    SCAN_CLASS_PUSHBUTTON: (.01, .05, 2),
+    SCAN_CLASS_CONTACT: (DEFAULT_SCAN_FAST, DEFAULT_SCAN_IDLE, DEFAULT_SCAN_DECAY),
+    SCAN_CLASS_SLOW: (1, 5, 0),
+    # Pulse counters in polling mode: S0 pulses last at least 30 ms
+    SCAN_CLASS_COUNTER: (.01, .01, 0),
+}
+DEFAULT_SCAN_CLASS = SCAN_CLASS_CONTACT
+# Scan rates of a chip without inputs
+NO_INPUT_SCAN_CLASS = SCAN_CLASS_SLOW
+
+# Input filters: debounce (input stable for filter_time), majority of the last
+# filter_samples samples, or glitch filter (pulses shorter than filter_time dropped)
+CONF_FILTER = "filter"
+CONF_FILTER_TIME = "filter_time"
+CONF_FILTER_SAMPLES = "filter_samples"
+FILTER_NONE = "none"
+FILTER_STABLE = "stable"
+FILTER_MAJORITY = "majority"
+FILTER_MIN_PULSE = "min_pulse"
+FILTERS = [FILTER_NONE, FILTER_STABLE, FILTER_MAJORITY, FILTER_MIN_PULSE]
+DEFAULT_FILTER = FILTER_NONE
+DEFAULT_FILTER_TIME = .03
+DEFAULT_FILTER_SAMPLES = 3
+
+# Pulse counters: edges counted by the I2C engine, total and rate published every counter_interval seconds
+CONF_COUNT_EDGE = "count_edge"
+COUNT_EDGE_RISING = "rising"
+COUNT_EDGE_FALLING = "falling"
+COUNT_EDGE_BOTH = "both"
+COUNT_EDGES = [COUNT_EDGE_FALLING, COUNT_EDGE_RISING, COUNT_EDGE_BOTH]
+# S0 outputs pull the input low during a pulse
+DEFAULT_COUNT_EDGE = COUNT_EDGE_FALLING
+CONF_COUNTER_INTERVAL = "counter_interval"
+DEFAULT_COUNTER_INTERVAL = 10
+
+# Edge events: timestamped input changes, kept in a ring buffer of each chip
+# and fired as mcp23017_edge events for the inputs with the edge_events option
+EVENT_EDGE = f"{DOMAIN}_edge"
+CONF_EDGE_EVENTS = "edge_events"
+DEFAULT_EDGE_EVENTS = False
+EDGE_BUFFER_SIZE = 256
+
+# Button gestures: single, double and long presses fired as mcp23017_button events,
+# the binary_sensor entity of the button is optional (raw_state)
+EVENT_BUTTON = f"{DOMAIN}_button"
+CONF_GESTURES = "gestures"
+CONF_DOUBLE_PRESS_TIME = "double_press_time"
+CONF_LONG_PRESS_TIME = "long_press_time"
+CONF_RAW_STATE = "raw_state"
+DEFAULT_GESTURES = False
+DEFAULT_DOUBLE_PRESS_TIME = .4
+DEFAULT_LONG_PRESS_TIME = .8
+DEFAULT_RAW_STATE = True
+
+# Bus scheduler: one polling thread per bus, or asyncio tasks and an executor
+CONF_BUS_BACKEND = "bus_backend"
+BUS_BACKEND_THREAD = "thread"
+BUS_BACKEND_ASYNCIO = "asyncio"
+DEFAULT_BUS_BACKEND = BUS_BACKEND_THREAD
+
+# Read GPIOA/GPIOB in one sequential I2C transaction
+DEFAULT_BLOCK_READ = True
+
 MAX_RETRY = 3
+
+# Chip health: degraded after an I2C error, circuit open after MAX_RETRY more
+# consecutive errors (entities unavailable, the chip is only probed)
+HEALTH_HEALTHY = "healthy"
+HEALTH_DEGRADED = "degraded"
+HEALTH_OPEN = "open"
+# Delay before the next attempt after an error (seconds), doubling at each error
+BACKOFF_MIN = DEFAULT_SCAN_RATE
+BACKOFF_MAX = 60
+
+# Services
+SERVICE_SET_OUTPUTS = "set_outputs"
+ATTR_MASK = "mask"
+ATTR_VALUE = "value"
+SERVICE_START_TRACE = "start_trace"
+SERVICE_STOP_TRACE = "stop_trace"
+SERVICE_DUMP_TRACE = "dump_trace"
+ATTR_SIZE = "size"
+ATTR_FILENAME = "filename"
+ATTR_FORMAT = "format"
+
+# I2C tracer ring buffer size (transactions)
+DEFAULT_TRACE_SIZE = 10000
+MAX_TRACE_SIZE = 1000000
+
+# Configuration registers check interval (seconds)
+CONF_VERIFY_INTERVAL = "verify_interval"
+DEFAULT_VERIFY_INTERVAL = 60
+
+# INT line of the chip ('/dev/gpiochipN:line'), empty for polling mode
+CONF_INTERRUPT_LINE = "interrupt_line"
+# Interrupt mode sanity poll rate (seconds)
+DEFAULT_SANITY_SCAN_RATE = 10
+
+# Diagnostic sensors of the performance metrics of a chip
+CONF_DIAGNOSTIC_SENSORS = "diagnostic_sensors"
+DEFAULT_DIAGNOSTIC_SENSORS = False
+
+
+def merge_bus_backend(first, second):
+    """Merge the bus_backend of two former per pin entries: the default unless they agree."""
+    return first if first == second else DEFAULT_BUS_BACKEND
+
+
+# Options of the chip entry shared by all its pins, with the reducer merging the
+# values of the former per pin entries
+CHIP_OPTIONS = {
+    CONF_VERIFY_INTERVAL: min,
+    CONF_INTERRUPT_LINE: max,
+    CONF_BUS_BACKEND: merge_bus_backend,
+    CONF_DIAGNOSTIC_SENSORS: max,
+}
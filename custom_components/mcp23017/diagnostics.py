@@ -0,0 +1,24 @@
+"""Diagnostics support for MCP23017: configuration and performance metrics of a chip and its bus."""
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from . import DATA_BUSES
+from .const import DOMAIN, CONF_I2C_ADDRESS
+from .smbus_pool import async_get_pool
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict:
+    """Return diagnostics for a chip config entry."""
+    component = hass.data[DOMAIN].get(entry.data[CONF_I2C_ADDRESS])
+    bus = hass.data[DATA_BUSES].get(component.bus) if component is not None else None
+    return {
+        "entry": {
+            "data": dict(entry.data),
+            "options": dict(entry.options),
+        },
+        "device": component.metrics if component is not None else None,
+        "bus": bus.metrics if bus is not None else None,
+        # Users of the open SMBus handles, by bus number
+        "smbus_pool": async_get_pool(hass).buses,
+    }
@@ -0,0 +1,171 @@
+"""Discovery of the MCP23017 chips wired to the I2C buses of the host."""
+
+import asyncio
+import glob
+import logging
+import time
+
+import smbus2
+
+from homeassistant.core import callback
+
+from .smbus_pool import async_get_pool
+
+from .const import (
+    DOMAIN,
+    CONF_I2C_ADDRESS,
+    SKIP_I2C_BUSES,
+    DISCOVERY_ADDRESSES,
+    DISCOVERY_TTL,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# hass.data key of the discovery service
+DATA_DISCOVERY = f"{DOMAIN}_discovery"
+
+# Registers 0x00-0x15 of a MCP23017 in BANK=0 mode, IOCONA (0x0A) and IOCONB (0x0B) are the same register
+REGISTER_COUNT = 0x16
+IOCONA = 0x0A
+# INTFA to GPIOB change with the inputs, reading them clears the interrupts
+VOLATILE_REGISTERS = range(0x0E, 0x14)
+
+
+def i2c_bus_number(i2c_address):
+    """Return the bus number of an address of the form /dev/i2c-N@0xAA."""
+    return int(i2c_address.split('@')[0].rsplit('-', 1)[1])
+
+
+def i2c_buses():
+    """Return the paths of the I2C buses of the host, buses of SKIP_I2C_BUSES excepted."""
+    buses = [
+        path for path in glob.glob('/dev/i2c-*')
+        if path not in SKIP_I2C_BUSES and path.rsplit('-', 1)[1].isdigit()
+    ]
+    return sorted(buses, key=lambda path: int(path.rsplit('-', 1)[1]))
+
+
+def is_mcp23017(data):
+    """Return True if data, read without setting the register pointer, is the register file of a MCP23017.
+
+    The address pointer of a MCP23017 (BANK=0, SEQOP=0) goes through its 22
+    registers and wraps: two register file lengths repeat with a period of 22
+    registers (not 11 as a MCP23008, not 1 as a PCF8574 returning its port),
+    with IOCONA and IOCONB reading the same value, bit 0 clear. Registers
+    INTFA to GPIOB are left out of the comparisons, their inputs may change
+    during the read.
+    """
+    if len(data) != 2 * REGISTER_COUNT:
+        return False
+    for offset in range(REGISTER_COUNT):
+        # data[i] is register (offset + i) % REGISTER_COUNT
+        iocon = data[(IOCONA - offset) % REGISTER_COUNT]
+        if iocon != data[(IOCONA + 1 - offset) % REGISTER_COUNT] or iocon & 0x01:
+            continue
+        stable = [(offset + i) % REGISTER_COUNT not in VOLATILE_REGISTERS for i in range(2 * REGISTER_COUNT)]
+        if any(stable[i] and data[i] != data[i + REGISTER_COUNT] for i in range(REGISTER_COUNT)):
+            continue
+        half = REGISTER_COUNT // 2
+        if all(data[i] == data[i + half] for i in range(REGISTER_COUNT) if stable[i] and stable[i + half]):
+            continue
+        return True
+    return False
+
+
+def scan_bus(pool, path, skip=()):
+    """Return the addresses of the MCP23017 found on an I2C bus (blocking).
+
+    The bus handle is borrowed from the SMBus pool. Chips are only read: a
+    register pointer write would change the outputs of PCF857x expanders
+    sharing the 0x20-0x27 range. Addresses of skip (configured chips) are not
+    read, so that their pending interrupts are not cleared.
+    """
+    devices = []
+    try:
+        with pool.borrow(i2c_bus_number(path)) as bus:
+            for address in DISCOVERY_ADDRESSES:
+                if "%s@%s" % (path, hex(address)) in skip:
+                    continue
+                message = smbus2.i2c_msg.read(address, 2 * REGISTER_COUNT)
+                try:
+                    bus.i2c_rdwr(message)
+                except OSError:
+                    # No ACK
+                    continue
+                if is_mcp23017(list(message)):
+                    devices.append("%s@%s" % (path, hex(address)))
+                else:
+                    _LOGGER.debug("%s@%s is not a MCP23017", path, hex(address))
+    except OSError as error:
+        _LOGGER.warning("Unable to scan I2C bus %s: %s", path, error)
+    return devices
+
+
+class MCP23017Discovery:
+    """Inventory of the MCP23017 of the host, cached ttl seconds.
+
+    Buses are scanned concurrently in the executor. A stale inventory is
+    returned at once while it is refreshed in the background. Configured
+    chips are part of the inventory without being read.
+    """
+
+    def __init__(self, hass, ttl=DISCOVERY_TTL):
+        self._hass = hass
+        self._ttl = ttl
+        self._devices = None
+        self._scan_time = None
+        self._scan_task = None
+
+    @property
+    def devices(self):
+        """Return the last inventory, None before the first scan."""
+        return self._devices
+
+    @property
+    def stale(self):
+        """Return True if the inventory is missing or older than its TTL."""
+        return self._scan_time is None or time.monotonic() - self._scan_time > self._ttl
+
+    async def _async_scan(self):
+        pool = async_get_pool(self._hass)
+        configured = {
+            entry.data[CONF_I2C_ADDRESS]
+            for entry in self._hass.config_entries.async_entries(DOMAIN)
+            if '@' in str(entry.data.get(CONF_I2C_ADDRESS, ''))
+        }
+        buses = await self._hass.async_add_executor_job(i2c_buses)
+        results = await asyncio.gather(
+            *(self._hass.async_add_executor_job(scan_bus, pool, path, configured) for path in buses)
+        )
+        self._devices = sorted(
+            {device for devices in results for device in devices} | configured,
+            key=lambda device: (i2c_bus_number(device), int(device.split('@')[1], 16)),
+        )
+        self._scan_time = time.monotonic()
+        _LOGGER.debug("MCP23017 detected: %s", self._devices)
+        return self._devices
+
+    @callback
+    def async_refresh(self):
+        """Start a scan in the background, unless one is running, and return its task."""
+        if self._scan_task is None or self._scan_task.done():
+            self._scan_task = self._hass.async_create_background_task(
+                self._async_scan(), f"{DOMAIN} discovery"
+            )
+        return self._scan_task
+
+    async def async_get_devices(self):
+        """Return the inventory, waiting for a scan only if none has completed yet."""
+        if self.stale:
+            task = self.async_refresh()
+            if self._devices is None:
+                return await asyncio.shield(task)
+        return self._devices
+
+
+@callback
+def async_get_discovery(hass):
+    """Return the discovery service, created on first use."""
+    if DATA_DISCOVERY not in hass.data:
+        hass.data[DATA_DISCOVERY] = MCP23017Discovery(hass)
+    return hass.data[DATA_DISCOVERY]
@@ -0,0 +1,139 @@
+"""Debounce and glitch filters applied to input samples."""
+
+from collections import deque
+
+from .const import (
+    FILTER_MAJORITY,
+    FILTER_MIN_PULSE,
+    FILTER_STABLE,
+)
+
+
+class InputFilter:
+    """Filter of the samples of one input pin.
+
+    Samples are given with their monotonic time. pending is True while the
+    filter needs more samples to settle, deadline is the time at which its
+    output could change without any new edge (None if unknown).
+    """
+
+    pending = False
+    deadline = None
+
+    def reset(self, level, now):
+        """Set output to level, without filtering."""
+        raise NotImplementedError()
+
+    def sample(self, level, now):
+        """Feed a sample, return the filtered level."""
+        raise NotImplementedError()
+
+
+class StableTimeFilter(InputFilter):
+    """Debounce: follow the input once it has been stable for stable_time seconds."""
+
+    def __init__(self, stable_time):
+        self._stable_time = stable_time
+        self._output = False
+        self._candidate = False
+        self._since = 0
+
+    def reset(self, level, now):
+        self._output = self._candidate = level
+        self._since = now
+
+    def sample(self, level, now):
+        if level != self._candidate:
+            # Bounce: restart the stability timer
+            self._candidate = level
+            self._since = now
+        if self._candidate != self._output and now - self._since >= self._stable_time:
+            self._output = self._candidate
+        return self._output
+
+    @property
+    def pending(self):
+        return self._candidate != self._output
+
+    @property
+    def deadline(self):
+        return self._since + self._stable_time if self.pending else None
+
+
+class MajorityFilter(InputFilter):
+    """Follow the majority of the last samples samples."""
+
+    def __init__(self, samples):
+        self._samples = deque(maxlen=samples)
+        self._output = False
+
+    def reset(self, level, now):
+        self._samples.extend([level] * self._samples.maxlen)
+        self._output = level
+
+    def sample(self, level, now):
+        self._samples.append(level)
+        count = sum(self._samples)
+        # Ties keep the current output
+        if 2 * count > self._samples.maxlen:
+            self._output = True
+        elif 2 * count < self._samples.maxlen:
+            self._output = False
+        return self._output
+
+    @property
+    def pending(self):
+        return any(level != self._output for level in self._samples)
+
+
+class MinPulseFilter(InputFilter):
+    """Glitch filter: drop pulses shorter than min_pulse seconds.
+
+    Time spent at the new level counts up, time spent back at the current
+    output counts down: bounces delay a change without restarting it.
+    """
+
+    def __init__(self, min_pulse):
+        self._min_pulse = min_pulse
+        self._output = False
+        self._level = False
+        self._time = 0
+        self._accumulated = 0
+
+    def reset(self, level, now):
+        self._output = self._level = level
+        self._time = now
+        self._accumulated = 0
+
+    def sample(self, level, now):
+        # Inputs hold their last sampled level between samples
+        elapsed = now - self._time
+        if self._level != self._output:
+            self._accumulated += elapsed
+        else:
+            self._accumulated = max(0, self._accumulated - elapsed)
+        self._level = level
+        self._time = now
+        if level != self._output and self._accumulated >= self._min_pulse:
+            self._output = level
+            self._accumulated = 0
+        return self._output
+
+    @property
+    def pending(self):
+        return self._level != self._output
+
+    @property
+    def deadline(self):
+        return self._time + self._min_pulse - self._accumulated if self.pending else None
+
+
+def create_filter(mode, filter_time, filter_samples):
+    """Return the filter of the given mode, None if inputs are not filtered."""
+    if mode == FILTER_STABLE:
+        return StableTimeFilter(filter_time)
+    if mode == FILTER_MAJORITY:
+        return MajorityFilter(filter_samples)
+    if mode == FILTER_MIN_PULSE:
+        return MinPulseFilter(filter_time)
+    return None
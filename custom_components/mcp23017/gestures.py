@@ -0,0 +1,74 @@
+"""Button gestures (single, double and long press) decoded from input changes."""
+
+GESTURE_SINGLE = "single_press"
+GESTURE_DOUBLE = "double_press"
+GESTURE_LONG = "long_press"
+
+_IDLE = 0
+_PRESSED = 1
+_RELEASED = 2
+_HELD = 3
+
+
+class GestureDetector:
+    """Decode the gestures of one button from its timestamped changes.
+
+    A press is a change to True. The detector waits double_time seconds after
+    a release for a second press (0 reports single presses on release), and
+    reports a long press once the button is held long_time seconds.
+    """
+
+    def __init__(self, double_time, long_time):
+        self._double_time = double_time
+        self._long_time = long_time
+        self._state = _IDLE
+        self._time = 0
+
+    @property
+    def deadline(self):
+        """Return the time at which timeout() may report a gesture, None if no gesture is pending."""
+        if self._state == _PRESSED:
+            return self._time + self._long_time
+        if self._state == _RELEASED:
+            return self._time + self._double_time
+        return None
+
+    def change(self, level, now):
+        """Feed a change of the input, return the gesture it completes or None."""
+        if level:
+            if self._state == _RELEASED:
+                if now - self._time <= self._double_time:
+                    # Second press within the double press window
+                    self._state = _IDLE
+                    return GESTURE_DOUBLE
+                # Window expired before the timeout was checked: single press, then a new press
+                self._state = _PRESSED
+                self._time = now
+                return GESTURE_SINGLE
+            self._state = _PRESSED
+            self._time = now
+            return None
+        if self._state == _PRESSED:
+            if now - self._time >= self._long_time:
+                # Released before the timeout was checked
+                self._state = _IDLE
+                return GESTURE_LONG
+            if self._double_time <= 0:
+                self._state = _IDLE
+                return GESTURE_SINGLE
+            self._state = _RELEASED
+            self._time = now
+            return None
+        # Release of a long press
+        self._state = _IDLE
+        return None
+
+    def timeout(self, now):
+        """Report the gesture whose deadline has passed, if any."""
+        if self._state == _PRESSED and now >= self._time + self._long_time:
+            self._state = _HELD
+            return GESTURE_LONG
+        if self._state == _RELEASED and now >= self._time + self._double_time:
+            self._state = _IDLE
+            return GESTURE_SINGLE
+        return None
@@ -0,0 +1,161 @@
+"""Edge sources watching the INT line of MCP23017 devices."""
+
+import logging
+import os
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Edge sources of the GPIO lines in use, by '/dev/gpiochipN:line' specification
+_SHARED_LOCK = threading.RLock()
+_SHARED_SOURCES = {}
+
+
+def acquire_edge_source(spec):
+    """Return the edge source of an INT line given as '/dev/gpiochipN:line', acquired once for the caller.
+
+    The chips wired to the same line share one edge source: the GPIO line can
+    only be requested once.
+    """
+    path, line = spec.rsplit(":", 1)
+    key = "%s:%d" % (path, int(line))
+    with _SHARED_LOCK:
+        edge_source = _SHARED_SOURCES.get(key)
+        if edge_source is None:
+            edge_source = _SHARED_SOURCES[key] = GpioCdevEdgeSource(path, int(line))
+        return edge_source.acquire()
+
+
+class EdgeSource:
+    """Source of edges on the INT line of a MCP23017.
+
+    fileno() is readable while edges are pending, so that a bus scheduler can
+    wait on several INT lines at once. edge_time is the monotonic time of the
+    first edge consumed by the last read(), None if unknown.
+    """
+
+    edge_time = None
+    # Key of the shared edge sources, chips counted as users
+    key = None
+    _users = 0
+
+    def acquire(self):
+        """Count one more chip watching this line, return the edge source."""
+        with _SHARED_LOCK:
+            self._users += 1
+        return self
+
+    def release(self):
+        """Count one chip less watching this line, close the edge source after the last one."""
+        with _SHARED_LOCK:
+            self._users -= 1
+            if self._users > 0:
+                return
+            if _SHARED_SOURCES.get(self.key) is self:
+                del _SHARED_SOURCES[self.key]
+        self.close()
+
+    def active(self):
+        """Return True while the line is held low: another chip asserting INT then makes no new edge."""
+        return False
+
+    def fileno(self):
+        """Return a file descriptor readable when an edge is pending."""
+        raise NotImplementedError()
+
+    def read(self):
+        """Consume pending edges without blocking, return True if there were any."""
+        raise NotImplementedError()
+
+    def close(self):
+        """Release the underlying resources."""
+
+
+class GpioCdevEdgeSource(EdgeSource):
+    """Falling edges of a GPIO line read through the GPIO character device (libgpiod v2)."""
+
+    def __init__(self, path, line):
+        # Optional dependency, only needed when interrupt mode is enabled
+        import gpiod
+        from gpiod.line import Bias, Edge, Value
+
+        self._path = path
+        self._line = line
+        self.key = "%s:%d" % (path, line)
+        self._low = Value.INACTIVE
+        # INT is configured open-drain, active low: pull the line up on the host side
+        self._request = gpiod.request_lines(
+            path,
+            consumer="mcp23017",
+            config={
+                line: gpiod.LineSettings(
+                    edge_detection=Edge.FALLING,
+                    bias=Bias.PULL_UP,
+                )
+            },
+        )
+        _LOGGER.info("Watching INT line %s:%d", path, line)
+
+    def fileno(self):
+        """Return the line request file descriptor."""
+        return self._request.fd
+
+    def active(self):
+        """Read the level of the line."""
+        return self._request.get_value(self._line) == self._low
+
+    def read(self):
+        """Drain queued edge events, the device registers hold the details."""
+        if not self._request.wait_edge_events(0):
+            return False
+        events = self._request.read_edge_events()
+        # Kernel timestamps use CLOCK_MONOTONIC, as time.monotonic()
+        self.edge_time = events[0].timestamp_ns / 1e9 if events else None
+        return True
+
+    def close(self):
+        """Release the GPIO line."""
+        self._request.release()
+
+
+class SimulatedEdgeSource(EdgeSource):
+    """Edge source triggered by software, for tests and benchmarks."""
+
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        self.edges = 0
+        self._trigger_time = None
+        # Simulated line driving the edge source, which level active() reads
+        self.line = None
+
+    def trigger(self):
+        """Simulate a falling edge on the INT line."""
+        self.edges += 1
+        if self._trigger_time is None:
+            self._trigger_time = time.monotonic()
+        os.write(self._write_fd, b"\0")
+
+    def active(self):
+        """Read the level of the simulated line, if any."""
+        return self.line is not None and self.line.active()
+
+    def fileno(self):
+        """Return the read end of the trigger pipe."""
+        return self._read_fd
+
+    def read(self):
+        """Consume pending simulated edges."""
+        try:
+            if not os.read(self._read_fd, 4096):
+                return False
+        except BlockingIOError:
+            return False
+        self.edge_time, self._trigger_time = self._trigger_time, None
+        return True
+
+    def close(self):
+        """Close the trigger pipe."""
+        os.close(self._read_fd)
+        os.close(self._write_fd)
@@ -0,0 +1,58 @@
+"""Performance metrics of MCP23017 devices."""
+
+import bisect
+
+
+class Histogram:
+    """Histogram of durations (seconds) with fixed logarithmic buckets."""
+
+    BOUNDS = (
+        0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5
+    )
+
+    def __init__(self):
+        self._buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """Record one duration."""
+        self._buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        """Return the mean duration."""
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket holding the given percentile."""
+        if not self.count:
+            return None
+        rank = self.count * percent / 100
+        cumulated = 0
+        for bound, count in zip(self.BOUNDS + (self.max,), self._buckets):
+            cumulated += count
+            if cumulated >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        """Return a summary of the histogram."""
+        return {
+            "count": self.count,
+            "min": self.min,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": dict(zip([str(b) for b in self.BOUNDS] + ["inf"], self._buckets)),
+        }
@@ -0,0 +1,268 @@
+"""Platform for mcp23017-based pulse counter sensor."""
+
+from datetime import timedelta
+import logging
+import time
+
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.const import EntityCategory
+from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.restore_state import RestoreEntity
+from homeassistant.core import callback
+
+from . import async_register_entities, pin_entries
+from .const import (
+    CONF_FLOW_PIN_NAME,
+    CONF_FLOW_PIN_NUMBER,
+    CONF_I2C_ADDRESS,
+    CONF_INVERT_LOGIC,
+    CONF_PULL_MODE,
+    CONF_COUNT_EDGE,
+    CONF_COUNTER_INTERVAL,
+    COUNT_EDGE_BOTH,
+    COUNT_EDGE_FALLING,
+    COUNT_EDGE_RISING,
+    DEFAULT_INVERT_LOGIC,
+    DEFAULT_PULL_MODE,
+    DEFAULT_COUNT_EDGE,
+    DEFAULT_COUNTER_INTERVAL,
+    CONF_DIAGNOSTIC_SENSORS,
+    DEFAULT_DIAGNOSTIC_SENSORS,
+    DOMAIN,
+    DEVICE_MANUFACTURER,
+    SCAN_CLASSES,
+    SCAN_CLASS_COUNTER,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Polling interval of the diagnostic sensors
+SCAN_INTERVAL = timedelta(seconds=30)
+
+# Diagnostic sensors: (key, name, unit, state class), histograms report their 90th percentile in ms
+DIAGNOSTIC_SENSORS = [
+    ("transactions", "I2C transactions", None, SensorStateClass.TOTAL_INCREASING),
+    ("bytes", "I2C bytes", "B", SensorStateClass.TOTAL_INCREASING),
+    ("errors", "I2C errors", None, SensorStateClass.TOTAL_INCREASING),
+    ("reinits", "Reinitializations", None, SensorStateClass.TOTAL_INCREASING),
+    ("conf_drifts", "Configuration drifts", None, SensorStateClass.TOTAL_INCREASING),
+    ("poll_duration", "Poll duration", "ms", SensorStateClass.MEASUREMENT),
+    ("scan_jitter", "Scan jitter", "ms", SensorStateClass.MEASUREMENT),
+    ("push_latency", "Input push latency", "ms", SensorStateClass.MEASUREMENT),
+]
+
+
+async def async_setup_entry(hass, entry_infos, async_add_entities):
+    """Set up the pulse counters and the diagnostic sensors of a MCP23017 entry."""
+    entities = [
+        MCP23017Counter(hass, pin_entry)
+        for pin_entry in pin_entries(entry_infos, 'sensor')
+    ]
+    if entities:
+        async_add_entities(entities, True)
+        await async_register_entities(hass, entry_infos, entities)
+    if entry_infos.options.get(CONF_DIAGNOSTIC_SENSORS, DEFAULT_DIAGNOSTIC_SENSORS):
+        i2c_address = entry_infos.data[CONF_I2C_ADDRESS]
+        component = hass.data[DOMAIN][i2c_address]
+        async_add_entities(
+            [MCP23017DiagnosticSensor(component, i2c_address, *description) for description in DIAGNOSTIC_SENSORS],
+            True,
+        )
+
+
+class MCP23017Counter(SensorEntity, RestoreEntity):
+    """Represent a pulse counter on a MCP23017 input.
+
+    Edges are counted by the I2C engine of the device, the entity publishes
+    the total and the rate every counter_interval seconds.
+    """
+
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_native_unit_of_measurement = "pulses"
+
+    def __init__(self, hass, entry_infos):
+        """Initialize the MCP23017 pulse counter."""
+        self._hass = hass
+        self._entry_infos = entry_infos
+        self._i2c_address = entry_infos.data[CONF_I2C_ADDRESS]
+        self._pin_name = entry_infos.data[CONF_FLOW_PIN_NAME]
+        self._pin_number = entry_infos.data[CONF_FLOW_PIN_NUMBER]
+        self._device = None
+        self._invert_logic = entry_infos.options.get(
+            CONF_INVERT_LOGIC,
+            entry_infos.data.get(CONF_INVERT_LOGIC, DEFAULT_INVERT_LOGIC)
+        )
+        self._pullup = entry_infos.options.get(
+            CONF_PULL_MODE,
+            entry_infos.data.get(CONF_PULL_MODE, DEFAULT_PULL_MODE)
+        )
+        self._count_edge = entry_infos.options.get(CONF_COUNT_EDGE, DEFAULT_COUNT_EDGE)
+        self._interval = entry_infos.options.get(CONF_COUNTER_INTERVAL, DEFAULT_COUNTER_INTERVAL)
+
+        # Published total, device count and time at the last publication
+        self._total = 0
+        self._rate = 0
+        self._last_count = None
+        self._last_time = None
+        self._unsubscribe_timer = None
+
+    @property
+    def icon(self):
+        """Return device icon for this entity."""
+        return "mdi:counter"
+
+    @property
+    def unique_id(self):
+        """Return a unique_id for this entity."""
+        return f"{self._i2c_address}-{self._pin_number:02x}"
+
+    @property
+    def name(self):
+        """Return the name of the entity."""
+        return self._pin_name
+
+    @property
+    def native_value(self):
+        """Return the total number of pulses."""
+        return self._total
+
+    @property
+    def extra_state_attributes(self):
+        """Return the pulse rate (pulses per hour) over the last interval."""
+        return {"rate": self._rate}
+
+    @property
+    def pin(self):
+        """Return the pin number of the entity."""
+        return self._pin_number
+
+    @property
+    def address(self):
+        """Return the i2c address of the entity."""
+        return self._i2c_address
+
+    @property
+    def count_edges(self):
+        """Return (rising, falling): the edges counted on this input."""
+        return (
+            self._count_edge in (COUNT_EDGE_RISING, COUNT_EDGE_BOTH),
+            self._count_edge in (COUNT_EDGE_FALLING, COUNT_EDGE_BOTH),
+        )
+
+    @property
+    def scan_rates(self):
+        """Return (scan_fast, scan_idle, scan_decay) needed not to miss pulses in polling mode."""
+        return SCAN_CLASSES[SCAN_CLASS_COUNTER]
+
+    @property
+    def available(self):
+        """Return False while the device does not answer (circuit open)."""
+        return self._device is None or self._device.available
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Device info."""
+        return DeviceInfo(
+            entry_type=DeviceEntryType.SERVICE,
+            identifiers={(DOMAIN,self.address)},
+            name=self.address,
+            manufacturer=DEVICE_MANUFACTURER,
+            model=DOMAIN,
+        )
+
+    @property
+    def device(self):
+        """Get device property."""
+        return self._device
+
+    @device.setter
+    def device(self, value):
+        """Set device property, edges are counted from now on."""
+        self._device = value
+        self._last_count = value.counterValue(self._pin_number)
+        self._last_time = time.monotonic()
+
+    async def async_added_to_hass(self):
+        """Restore the total and start publishing."""
+        last_state = await self.async_get_last_state()
+        if last_state is not None:
+            try:
+                self._total = int(float(last_state.state))
+            except ValueError:
+                pass
+        self._unsubscribe_timer = async_track_time_interval(
+            self._hass, self.async_publish, timedelta(seconds=self._interval)
+        )
+
+    async def async_will_remove_from_hass(self):
+        """Stop publishing."""
+        if self._unsubscribe_timer is not None:
+            self._unsubscribe_timer()
+            self._unsubscribe_timer = None
+
+    @callback
+    def async_publish(self, now=None):
+        """Add the edges counted by the device since the last publication, one state write per interval."""
+        if self._device is None:
+            return
+        count = self._device.counterValue(self._pin_number)
+        sample_time = time.monotonic()
+        if self._last_count is not None:
+            # Device counts only grow, a new device starts from 0
+            delta = count - self._last_count if count >= self._last_count else count
+            self._total += delta
+            self._rate = round(delta * 3600 / (sample_time - self._last_time), 1)
+        self._last_count = count
+        self._last_time = sample_time
+        self.async_write_ha_state()
+
+
+class MCP23017DiagnosticSensor(SensorEntity):
+    """Represent a performance metric of a MCP23017, polled every SCAN_INTERVAL."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_has_entity_name = True
+
+    def __init__(self, device, i2c_address, key, name, unit, state_class):
+        """Initialize the MCP23017 diagnostic sensor."""
+        self._device = device
+        self._key = key
+        self._i2c_address = i2c_address
+        self._attr_name = name
+        self._attr_unique_id = f"{self._i2c_address}-{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_state_class = state_class
+        self._attr_extra_state_attributes = {}
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Device info."""
+        return DeviceInfo(
+            entry_type=DeviceEntryType.SERVICE,
+            identifiers={(DOMAIN,self._i2c_address)},
+            name=self._i2c_address,
+            manufacturer=DEVICE_MANUFACTURER,
+            model=DOMAIN,
+        )
+
+    def update(self):
+        """Read the metric from the device."""
+        metrics = self._device.metrics
+        if self._key == "errors":
+            self._attr_native_value = metrics.get("read_errors", 0) + metrics.get("write_errors", 0)
+            self._attr_extra_state_attributes = {
+                "poll_errors": metrics["poll_errors"],
+                "last_error": metrics["last_error"],
+            }
+        elif isinstance(metrics.get(self._key), dict):
+            histogram = metrics[self._key]
+            self._attr_native_value = round(histogram["p90"] * 1000, 2) if histogram["count"] else None
+            self._attr_extra_state_attributes = {
+                key: round(histogram[key] * 1000, 2) if histogram[key] is not None else None
+                for key in ("p50", "p99", "max")
+            }
+            self._attr_extra_state_attributes["count"] = histogram["count"]
+        else:
+            self._attr_native_value = metrics.get(self._key)
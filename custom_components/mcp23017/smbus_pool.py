@@ -0,0 +1,195 @@
+"""Pool of the SMBus handles of the I2C buses, shared by all parts of the integration."""
+
+import contextlib
+import logging
+import threading
+
+import smbus2
+
+from homeassistant.core import callback
+
+from .const import DOMAIN
+from .tracer import (
+    OP_RDWR,
+    OP_READ_BLOCK,
+    OP_READ_BYTE,
+    OP_READ_BYTE_DATA,
+    OP_WRITE_BLOCK,
+    OP_WRITE_BYTE_DATA,
+    traced,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# hass.data key of the handle pool
+DATA_SMBUS_POOL = f"{DOMAIN}_smbus_pool"
+
+
+class SharedSMBus:
+    """SMBus handle of one I2C bus, transfers serialized by a per bus lock.
+
+    smbus2 selects the chip address with an ioctl before each transfer: the
+    lock keeps the address and the transfer of a user together. Transactions,
+    wire bytes and errors are counted by chip address, and recorded into
+    tracer when one is set. The tracer records the size of a transfer, not
+    its data: replay_trace sends zeros for the written values.
+    """
+
+    def __init__(self, bus, smbus):
+        self._bus = bus
+        self._smbus = smbus
+        self._lock = threading.Lock()
+        self._refs = 0
+        # [transactions, bytes, read errors, write errors] by chip address
+        self._stats = {}
+        self.tracer = None
+
+    @property
+    def bus(self):
+        """Return I2C bus number"""
+        return self._bus
+
+    @property
+    def refs(self):
+        """Return the number of users of the handle."""
+        return self._refs
+
+    def stats(self, address=None):
+        """Return the transfer counters of a chip address, of the whole bus if address is None."""
+        with self._lock:
+            if address is not None:
+                counters = list(self._stats.get(address, [0, 0, 0, 0]))
+            else:
+                counters = [sum(values) for values in zip([0, 0, 0, 0], *self._stats.values())]
+        return dict(zip(("transactions", "bytes", "read_errors", "write_errors"), counters))
+
+    def _transfer(self, address, op, register, nbytes, write, transfer, *args):
+        """Run one transaction under the bus lock and count it (bytes as on the wire, see FakeSMBus)."""
+        with self._lock:
+            counters = self._stats.get(address)
+            if counters is None:
+                counters = self._stats[address] = [0, 0, 0, 0]
+            counters[0] += 1
+            counters[1] += nbytes
+            tracer = self.tracer
+            try:
+                if tracer is not None:
+                    return traced(tracer, self._bus, address, op, register, nbytes, transfer, address, *args)
+                return transfer(address, *args)
+            except OSError:
+                counters[3 if write else 2] += 1
+                raise
+
+    def read_byte(self, address):
+        """Read a byte at the register pointer of address (SMBus receive byte)."""
+        return self._transfer(address, OP_READ_BYTE, 0, 2, False, self._smbus.read_byte)
+
+    def read_byte_data(self, address, register):
+        """Read register of address."""
+        return self._transfer(
+            address, OP_READ_BYTE_DATA, register, 4, False, self._smbus.read_byte_data, register
+        )
+
+    def write_byte_data(self, address, register, value):
+        """Write value to register of address, traced without value."""
+        return self._transfer(
+            address, OP_WRITE_BYTE_DATA, register, 3, True, self._smbus.write_byte_data, register, value
+        )
+
+    def read_i2c_block_data(self, address, register, length):
+        """Read length bytes from register of address, in one transaction."""
+        return self._transfer(
+            address, OP_READ_BLOCK, register, 3 + length, False, self._smbus.read_i2c_block_data, register, length
+        )
+
+    def write_i2c_block_data(self, address, register, data):
+        """Write data from register of address in one transaction, traced without data."""
+        return self._transfer(
+            address, OP_WRITE_BLOCK, register, 2 + len(data), True, self._smbus.write_i2c_block_data, register, data
+        )
+
+    def i2c_rdwr(self, *messages):
+        """Run combined messages in one transaction, traced without data."""
+        # Counted on the address of the first message, no register
+        return self._transfer(
+            messages[0].addr,
+            OP_RDWR,
+            0,
+            sum(1 + message.len for message in messages),
+            False,
+            lambda address: self._smbus.i2c_rdwr(*messages),
+        )
+
+
+class SMBusPool:
+    """Reference counted SMBus handles, one file descriptor per /dev/i2c-N.
+
+    A handle is opened by its first user and closed when its last user
+    releases it.
+    """
+
+    def __init__(self, factory=smbus2.SMBus):
+        # factory can be given to open another bus object (benchmarks)
+        self._factory = factory
+        self._handles = {}
+        self._tracer = None
+        self._lock = threading.Lock()
+
+    @property
+    def buses(self):
+        """Return {bus number: users} of the open handles."""
+        with self._lock:
+            return {bus: handle.refs for bus, handle in self._handles.items()}
+
+    @property
+    def tracer(self):
+        """Return the tracer of the handles, None when not tracing."""
+        return self._tracer
+
+    def setTracer(self, tracer):
+        """Record the transactions of all handles, current and future, into tracer (None to stop)."""
+        with self._lock:
+            self._tracer = tracer
+            for handle in self._handles.values():
+                handle.tracer = tracer
+
+    def acquire(self, bus):
+        """Return the handle of an I2C bus, opening it if needed (blocking)."""
+        with self._lock:
+            handle = self._handles.get(bus)
+            if handle is None:
+                handle = SharedSMBus(bus, self._factory(bus))
+                handle.tracer = self._tracer
+                self._handles[bus] = handle
+                _LOGGER.debug("/dev/i2c-%d opened", bus)
+            handle._refs += 1
+            return handle
+
+    def release(self, handle):
+        """Give a handle back, closing it when its last user releases it (blocking)."""
+        with self._lock:
+            handle._refs -= 1
+            if handle._refs > 0:
+                return
+            if self._handles.get(handle.bus) is handle:
+                del self._handles[handle.bus]
+            with handle._lock:
+                handle._smbus.close()
+            _LOGGER.debug("/dev/i2c-%d closed", handle.bus)
+
+    @contextlib.contextmanager
+    def borrow(self, bus):
+        """Use the handle of an I2C bus for the duration of a with block (blocking)."""
+        handle = self.acquire(bus)
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+
+@callback
+def async_get_pool(hass):
+    """Return the SMBus handle pool, created on first use."""
+    if DATA_SMBUS_POOL not in hass.data:
+        hass.data[DATA_SMBUS_POOL] = SMBusPool()
+    return hass.data[DATA_SMBUS_POOL]
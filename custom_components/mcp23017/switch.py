@@ -1,33 +1,29 @@
 """Platform for mcp23017-based switch."""
 
-import asyncio
-import functools
 import logging
 
 import voluptuous as vol
 
-from . import async_get_or_create
+from . import async_register_entities, pin_entries
 from homeassistant.components.switch import PLATFORM_SCHEMA, ToggleEntity
 from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
-from homeassistant.config_entries import SOURCE_IMPORT
+from homeassistant.const import STATE_OFF, STATE_ON
 from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.entity_platform import (
-    AddEntitiesCallback,
-    async_get_current_platform,
-)
+from homeassistant.helpers.restore_state import RestoreEntity
 
 from .const import (
     CONF_FLOW_PIN_NAME,
     CONF_FLOW_PIN_NUMBER,
-    CONF_FLOW_PLATFORM,
     CONF_I2C_ADDRESS,
     CONF_INVERT_LOGIC,
     CONF_HW_SYNC,
+    CONF_HW_FOLLOW,
     CONF_PINS,
     DEFAULT_I2C_ADDRESS,
     DEFAULT_INVERT_LOGIC,
     DEFAULT_HW_SYNC,
+    DEFAULT_HW_FOLLOW,
     DOMAIN,
     DEVICE_MANUFACTURER,
 )
@@ -41,21 +37,24 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Required(CONF_PINS): _SWITCHES_SCHEMA,
         vol.Optional(CONF_INVERT_LOGIC, default=DEFAULT_INVERT_LOGIC): cv.boolean,
         vol.Optional(CONF_HW_SYNC, default=DEFAULT_HW_SYNC): cv.boolean,
+        vol.Optional(CONF_HW_FOLLOW, default=DEFAULT_HW_FOLLOW): cv.boolean,
         vol.Optional(CONF_I2C_ADDRESS, default=DEFAULT_I2C_ADDRESS): vol.Coerce(int),
     }
 )
 
 
 async def async_setup_entry(hass, entry_infos, async_add_entities):
-    """Set up a MCP23017 switch entry."""
-    if(entry_infos.data[CONF_FLOW_PLATFORM])=='switch':
-        entity = MCP23017Switch(hass, entry_infos)
-        async_add_entities([entity], True)
-        platform = async_get_current_platform()
-        await async_get_or_create(hass, entity)
+    """Set up the switch entities of a MCP23017 entry."""
+    entities = [
+        MCP23017Switch(hass, pin_entry)
+        for pin_entry in pin_entries(entry_infos, 'switch')
+    ]
+    if entities:
+        async_add_entities(entities, True)
+        await async_register_entities(hass, entry_infos, entities)
 
 
-class MCP23017Switch(ToggleEntity):
+class MCP23017Switch(ToggleEntity, RestoreEntity):
     """Represent a switch that uses MCP23017."""
 
     def __init__(self, hass, entry_infos):
@@ -74,7 +73,11 @@ class MCP23017Switch(ToggleEntity):
             self._gpio =self._pin_number - 8
             self._port = 1
         
-        self._register = None
+        self._device = None
+        # State before the restart, checked against the outputs of the chip
+        self._restored_state = None
+        # Level read back on the output pin when it differs from the command (hw_follow)
+        self._hw_state = None
         
         # Get invert_logic from config flow (options) or import (data)
         self._invert_logic = entry_infos.options.get(
@@ -94,9 +97,13 @@ class MCP23017Switch(ToggleEntity):
             )
         )
 
-        #Subscribe to updates of config entry options
-        self._unsubscribe_update_listener = entry_infos.add_update_listener(
-           self.async_config_update
+        # Get hw_follow from config flow (options) or import (data)
+        self._hw_follow = entry_infos.options.get(
+            CONF_HW_FOLLOW,
+            entry_infos.data.get(
+                CONF_HW_FOLLOW,
+                DEFAULT_HW_FOLLOW
+            )
         )
 
         # Get invert_logic from config flow (options) or import (data)
@@ -124,9 +131,18 @@ class MCP23017Switch(ToggleEntity):
 
     @property
     def is_on(self):
-        """Return true if device is on."""
+        """Return true if device is on, as read back on the pin with hw_follow."""
+        if self._hw_state is not None:
+            return self._hw_state
         return self._state
 
+    @property
+    def extra_state_attributes(self):
+        """Return the commanded state while the pin read back differs from it."""
+        if self._hw_state is None:
+            return None
+        return {"commanded_state": STATE_ON if self._state else STATE_OFF}
+
     @property
     def pin(self):
         """Return the pin number of the entity."""
@@ -137,6 +153,11 @@ class MCP23017Switch(ToggleEntity):
         """Return the i2c address of the entity."""
         return self._i2c_address
 
+    @property
+    def available(self):
+        """Return False while the device does not answer (circuit open)."""
+        return self._device is None or self._device.available
+
     @property
     def device_info(self) -> DeviceInfo:
         """Device info."""
@@ -148,25 +169,55 @@ class MCP23017Switch(ToggleEntity):
             model=DOMAIN,
         )
 
-    async def async_push_update(self, state):
-        LOGGER.debug("async_push_update")
-        if self._hw_sync:
-            if state != self._state:
-                if state:
-                    await self.async_turn_on()
-                else:
-                    await self.async_turn_off()
+    @callback
+    def async_push_update(self, state):
+        """Follow the level read back on the output pin (hw_follow), None when it agrees with the command, from the event loop.
+
+        The command is kept: the output is not written with the level read back.
+        """
+        _LOGGER.debug("%s : read back %s"%(self.unique_id,state))
+        if self._hw_follow and state != self._hw_state:
+            self._hw_state = state
+            if self.hass is not None:
+                self.async_write_ha_state()
     
-    def set_register(self,register):
-        self._register = register
+    async def async_added_to_hass(self):
+        """Get the state restored by Home Assistant."""
+        await super().async_added_to_hass()
+        last_state = await self.async_get_last_state()
+        if last_state is not None and last_state.state in (STATE_ON, STATE_OFF):
+            self._restored_state = last_state.state == STATE_ON
+
+    @property
+    def restored_state(self):
+        """Return the state before the restart, None if unknown."""
+        return self._restored_state
+
+    @callback
+    def async_adopt_state(self, state):
+        """Take the state of the output of the chip, at configuration (from the event loop)."""
+        self._state = state
+        if self.hass is not None:
+            self.async_write_ha_state()
+
+    @property
+    def device(self):
+        """Get device property."""
+        return self._device
+
+    @device.setter
+    def device(self, value):
+        """Set device property."""
+        self._device = value
     
+    def set_state(self,state):
+        self._state = state
+
     def register_cmd(self,state):
         _LOGGER.debug("%s : %s"%(self.unique_id,state))
-        if state:
-            n_state = self._register[self._port] | (1 << self._gpio)
-        else:
-            n_state = self._register[self._port]  & (~ (1 << self._gpio) )
-        self._register[self._port] = n_state
+        # Written by the bus scheduler as soon as possible
+        if self._device is not None:
+            self._device.setOutputs(1 << self._pin_number, (1 << self._pin_number) if state else 0)
     
     async def async_turn_on(self, **kwargs):
         """Turn the device on."""
@@ -182,22 +233,6 @@ class MCP23017Switch(ToggleEntity):
         self.register_cmd(self._state != self._invert_logic)
         self.schedule_update_ha_state()
 
-    @callback
-    async def async_config_update(self, hass, entry_infos):
-        """Handle update from config entry options."""
-        _LOGGER.debug("[%s] async_config_update"%(self.unique_id))
-        old_logic = self._invert_logic 
-        self._invert_logic = entry_infos.options[CONF_INVERT_LOGIC]
-        if old_logic != self._invert_logic:
-            self._state = False
-            _LOGGER.debug("[%s] New invert logic value set: %s"%(self.unique_id,self._invert_logic ))
-        self.async_schedule_update_ha_state()
-
-    
-    def unsubscribe_update_listener(self):
-        """Remove listener from config entry options."""
-        self._unsubscribe_update_listener()
-
     async def async_unload_entry(hass, config_entry):
         """Unload MCP23017 switch entry corresponding to config_entry."""
         _LOGGER.warning("[FIXME] async_unload_entry not implemented")
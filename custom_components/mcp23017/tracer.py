@@ -0,0 +1,128 @@
+"""I2C transaction tracer: fixed size ring buffer of the transfers of the shared SMBus handles."""
+
+import csv
+import struct
+import threading
+import time
+
+# Operations
+OP_READ_BYTE = 1
+OP_READ_BYTE_DATA = 2
+OP_WRITE_BYTE_DATA = 3
+OP_READ_BLOCK = 4
+OP_WRITE_BLOCK = 5
+OP_RDWR = 6
+OP_NAMES = {
+    OP_READ_BYTE: "read_byte",
+    OP_READ_BYTE_DATA: "read_byte_data",
+    OP_WRITE_BYTE_DATA: "write_byte_data",
+    OP_READ_BLOCK: "read_i2c_block_data",
+    OP_WRITE_BLOCK: "write_i2c_block_data",
+    OP_RDWR: "i2c_rdwr",
+}
+OP_CODES = {name: op for op, name in OP_NAMES.items()}
+
+# Record: monotonic start time (s), duration (s), bus, chip address, operation,
+# register, errno (0 if none), wire bytes
+RECORD = struct.Struct("<dfBBBBBH")
+FIELDS = ("timestamp", "duration", "bus", "address", "op", "register", "error", "bytes")
+# Binary capture: magic, version, record count, then the records oldest first
+HEADER = struct.Struct("<4sBI")
+MAGIC = b"MCPT"
+VERSION = 1
+
+TRACE_FORMAT_BINARY = "binary"
+TRACE_FORMAT_CSV = "csv"
+TRACE_FORMATS = [TRACE_FORMAT_BINARY, TRACE_FORMAT_CSV]
+
+
+class I2CTracer:
+    """Record I2C transactions into a preallocated ring buffer, the oldest being overwritten."""
+
+    def __init__(self, size):
+        self._size = size
+        self._buffer = bytearray(size * RECORD.size)
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """Return the capacity of the buffer (records)."""
+        return self._size
+
+    def __len__(self):
+        return self._count
+
+    def record(self, timestamp, duration, bus, address, op, register, error, nbytes):
+        """Record one transaction (called by the bus threads)."""
+        with self._lock:
+            RECORD.pack_into(
+                self._buffer, self._next * RECORD.size,
+                timestamp, duration, bus, address, op, register, min(error, 0xFF), min(nbytes, 0xFFFF),
+            )
+            self._next = (self._next + 1) % self._size
+            if self._count < self._size:
+                self._count += 1
+
+    def records(self):
+        """Return the recorded transactions, oldest first, as tuples ordered as FIELDS."""
+        with self._lock:
+            buffer = bytes(self._buffer)
+            first, count = (self._next - self._count) % self._size, self._count
+        return [
+            RECORD.unpack_from(buffer, ((first + i) % self._size) * RECORD.size)
+            for i in range(count)
+        ]
+
+    def dump(self, path, trace_format=TRACE_FORMAT_BINARY):
+        """Write the recorded transactions to a file (blocking), return their number."""
+        records = self.records()
+        if trace_format == TRACE_FORMAT_CSV:
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(FIELDS)
+                for record in records:
+                    timestamp, duration, bus, address, op, register, error, nbytes = record
+                    writer.writerow(
+                        ("%.6f" % timestamp, "%.6f" % duration, bus, "0x%02x" % address,
+                         OP_NAMES.get(op, op), "0x%02x" % register, error, nbytes)
+                    )
+        else:
+            with open(path, "wb") as file:
+                file.write(HEADER.pack(MAGIC, VERSION, len(records)))
+                for record in records:
+                    file.write(RECORD.pack(*record))
+        return len(records)
+
+
+def load_trace(path):
+    """Read a capture written by I2CTracer.dump (binary or CSV), return its records."""
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:len(MAGIC)] == MAGIC:
+        _, version, count = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError("Unsupported trace version %d" % version)
+        return [RECORD.unpack_from(data, HEADER.size + i * RECORD.size) for i in range(count)]
+    rows = csv.DictReader(data.decode().splitlines())
+    return [
+        (
+            float(row["timestamp"]), float(row["duration"]), int(row["bus"]), int(row["address"], 16),
+            OP_CODES.get(row["op"]) or int(row["op"]), int(row["register"], 16), int(row["error"]), int(row["bytes"]),
+        )
+        for row in rows
+    ]
+
+
+def traced(tracer, bus, address, op, register, nbytes, transfer, *args):
+    """Run a transfer and record it into tracer."""
+    start = time.monotonic()
+    error = 0
+    try:
+        return transfer(*args)
+    except OSError as exception:
+        error = exception.errno or 0xFF
+        raise
+    finally:
+        tracer.record(start, time.monotonic() - start, bus, address, op, register, error, nbytes)
@@ -0,0 +1 @@
+"""Tests for the mcp23017 integration."""
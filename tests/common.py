@@ -0,0 +1,172 @@
+"""Entity stand-ins and helpers shared by the tests.
+
+The chip dispatches on the class name of its entities: the stand-ins carry
+the class names and the attributes it reads from the entities of the
+platforms, and record what the chip pushes to them.
+"""
+
+from custom_components.mcp23017.const import (
+    CONF_I2C_ADDRESS,
+    DEFAULT_SCAN_CLASS,
+    SCAN_CLASS_COUNTER,
+    SCAN_CLASSES,
+)
+
+from benchmarks.mcp23017_sim import SimulatedSMBus
+
+
+class ClosingSMBus(SimulatedSMBus):
+    """Simulated bus with a chip at 0x20, recording its close."""
+
+    def __init__(self, bus=1):
+        SimulatedSMBus.__init__(self, bus)
+        self.closed = False
+        self.addChip(0x20)
+
+    def close(self):
+        self.closed = True
+
+
+class EntryInfos:
+    """Pin entry of a stand-in entity."""
+
+    def __init__(self, options=None):
+        self.options = dict(options or {})
+
+
+class Entity:
+    """Attributes common to the stand-ins."""
+
+    hass = None
+
+    def __init__(self, pin, options=None, invert_logic=False, pullup="UP"):
+        self.pin = pin
+        self.name = "%s %d" % (type(self).__name__, pin)
+        self.device = None
+        self._entry_infos = EntryInfos(options)
+        self._invert_logic = invert_logic
+        self._pullup = pullup
+
+    def async_write_ha_state(self):
+        pass
+
+
+class MCP23017BinarySensor(Entity):
+    """Input entity stand-in, recording the states pushed by the chip."""
+
+    raw_state = True
+    edge_events = False
+
+    def __init__(self, pin, options=None, invert_logic=False, pullup="UP", input_filter=None,
+                 gesture_detector=None, scan_rates=SCAN_CLASSES[DEFAULT_SCAN_CLASS]):
+        Entity.__init__(self, pin, options, invert_logic, pullup)
+        self.input_filter = input_filter
+        self.gesture_detector = gesture_detector
+        self.scan_rates = scan_rates
+        self.states = []
+
+    @property
+    def state(self):
+        """Return the last state pushed, None if none."""
+        return self.states[-1] if self.states else None
+
+    def async_update_state(self, state):
+        self.states.append(state)
+
+
+class MCP23017Switch(Entity):
+    """Switch entity stand-in."""
+
+    def __init__(self, pin, options=None, invert_logic=False, hw_sync=True, hw_follow=False, restored_state=None):
+        Entity.__init__(self, pin, options, invert_logic)
+        self._hw_sync = hw_sync
+        self._hw_follow = hw_follow
+        self.restored_state = restored_state
+        self.state = None
+        self.hw_state = None
+
+    def set_state(self, state):
+        self.state = state
+
+    def turn(self, state):
+        """Switch on or off, as async_turn_on/async_turn_off."""
+        self.state = state
+        self.device.setOutputs(1 << self.pin, (1 << self.pin) if state != self._invert_logic else 0)
+
+    def async_adopt_state(self, state):
+        self.state = state
+
+    def async_push_update(self, state):
+        if self._hw_follow:
+            self.hw_state = state
+
+
+class MCP23017Counter(Entity):
+    """Pulse counter entity stand-in."""
+
+    scan_rates = SCAN_CLASSES[SCAN_CLASS_COUNTER]
+
+    def __init__(self, pin, count_edges=(False, True), options=None):
+        Entity.__init__(self, pin, options)
+        self.count_edges = count_edges
+
+
+class FakeEventBus:
+    """Event bus of FakeHass, recording the events fired."""
+
+    def __init__(self):
+        self.events = []
+
+    def async_fire(self, event_type, data):
+        self.events.append((event_type, data))
+
+
+class FakeHass:
+    """Home Assistant stand-in for the device: event bus only."""
+
+    loop = None
+
+    def __init__(self):
+        self.bus = FakeEventBus()
+
+
+def apply_pushes(chip):
+    """Apply the entity updates queued by chip, as the bus scheduler does in the event loop."""
+    for push, state in chip.takePushes():
+        push(state)
+
+
+class FakeConfigEntries:
+    """Config entries of LoopHass."""
+
+    def __init__(self):
+        self.entries = []
+
+    def async_entries(self, domain):
+        return list(self.entries)
+
+
+class LoopHass(FakeHass):
+    """Home Assistant stand-in running in an asyncio event loop: data, config entries, executor jobs and background tasks."""
+
+    is_running = False
+
+    def __init__(self, loop):
+        FakeHass.__init__(self)
+        self.loop = loop
+        self.data = {}
+        self.config_entries = FakeConfigEntries()
+
+    async def async_add_executor_job(self, target, *args):
+        return await self.loop.run_in_executor(None, target, *args)
+
+    def async_create_background_task(self, target, name):
+        return self.loop.create_task(target, name=name)
+
+
+class ConfigEntry:
+    """Chip config entry stand-in."""
+
+    def __init__(self, i2c_address, options=None):
+        self.data = {CONF_I2C_ADDRESS: i2c_address}
+        self.options = dict(options or {})
@@ -0,0 +1,58 @@
+"""Fixtures of the mcp23017 tests."""
+
+import pytest
+
+from custom_components.mcp23017 import MCP23017
+from custom_components.mcp23017.smbus_pool import SMBusPool
+
+from benchmarks.mcp23017_sim import SimulatedSMBus
+
+from .common import ClosingSMBus, FakeHass
+
+
+@pytest.fixture
+def fake_hass():
+    """Return a Home Assistant stand-in recording the events fired."""
+    return FakeHass()
+
+
+@pytest.fixture
+def sim_bus():
+    """Return a simulated I2C bus, without chips."""
+    return SimulatedSMBus()
+
+
+@pytest.fixture
+def make_chip(fake_hass, sim_bus):
+    """Return a factory of devices driving a simulated chip of sim_bus, with the given entities."""
+    devices = []
+
+    def make(entities=(), address=0x20):
+        if address not in sim_bus.chips:
+            sim_bus.addChip(address)
+        device = MCP23017(fake_hass, "/dev/i2c-1@0x%02x" % address, sim_bus)
+        if entities:
+            device.register_entities(list(entities))
+        devices.append(device)
+        return device
+
+    yield make
+    for device in devices:
+        device.setEdgeSource(None)
+
+
+@pytest.fixture
+def opened():
+    """Return the buses opened by the pool fixture, in order."""
+    return []
+
+
+@pytest.fixture
+def pool(opened):
+    """Return an SMBus pool opening simulated buses."""
+    def factory(bus):
+        smbus = ClosingSMBus(bus)
+        opened.append(smbus)
+        return smbus
+
+    return SMBusPool(factory)
@@ -0,0 +1,113 @@
+"""Bus schedulers."""
+
+import asyncio
+import time
+
+from custom_components.mcp23017 import (
+    DATA_BUS_BACKENDS,
+    DATA_BUSES,
+    async_get_or_create_bus,
+)
+from custom_components.mcp23017.bus import MCP23017AsyncBus, MCP23017Bus
+from custom_components.mcp23017.const import (
+    BUS_BACKEND_ASYNCIO,
+    BUS_BACKEND_THREAD,
+    CONF_BUS_BACKEND,
+    CHIP_OPTIONS,
+)
+from custom_components.mcp23017.smbus_pool import DATA_SMBUS_POOL, SMBusPool
+
+from benchmarks.fake_smbus import FakeSMBus
+
+from .common import ConfigEntry, LoopHass, MCP23017BinarySensor, MCP23017Switch
+
+
+def test_wake_does_not_block():
+    """wake() is called from the event loop: it returns even when the thread does not empty the pipe."""
+    scheduler = MCP23017Bus(1, FakeSMBus())
+    try:
+        # Far more than a pipe buffer
+        for _ in range(100000):
+            scheduler.wake()
+    finally:
+        scheduler.stop_polling()
+    # Ignored once stopped
+    scheduler.wake()
+
+
+async def wait_for(condition, timeout=2):
+    """Let the event loop run until condition() is true."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.005)
+
+
+def test_async_bus(make_chip, sim_bus):
+    switch = MCP23017Switch(0)
+    sensor = MCP23017BinarySensor(8)
+    chip = make_chip([switch, sensor])
+    sim_chip = sim_bus.chips[0x20]
+
+    async def run():
+        hass = LoopHass(asyncio.get_running_loop())
+        scheduler = MCP23017AsyncBus(hass, 1, sim_bus)
+        scheduler.add_device(chip)
+        scheduler.start_polling()
+        try:
+            # Initial push, applied in the event loop
+            await wait_for(lambda: sensor.states)
+            assert sensor.state is True
+            sim_chip.setInput(8, False)
+            await wait_for(lambda: sensor.state is False)
+            # Switch commands wake the scheduler up
+            switch.turn(True)
+            await wait_for(lambda: sim_chip.outputs(0) == 0x01)
+            assert scheduler.is_alive()
+        finally:
+            await hass.async_add_executor_job(scheduler.stop_polling)
+        assert not scheduler.is_alive()
+        assert chip._wake is None
+
+    asyncio.run(run())
+
+
+def test_backend_change_recreates_the_scheduler(make_chip, sim_bus, caplog):
+    first = make_chip(address=0x20)
+    second = make_chip(address=0x21)
+
+    async def run():
+        hass = LoopHass(asyncio.get_running_loop())
+        pool = SMBusPool(lambda bus: sim_bus)
+        hass.data = {DATA_SMBUS_POOL: pool, DATA_BUSES: {}, DATA_BUS_BACKENDS: {}}
+
+        bus = await async_get_or_create_bus(hass, ConfigEntry("/dev/i2c-1@0x20"), 1)
+        assert bus.backend == BUS_BACKEND_THREAD
+        bus.add_device(first)
+        same = await async_get_or_create_bus(hass, ConfigEntry("/dev/i2c-1@0x21"), 1)
+        assert same is bus
+        same.add_device(second)
+        assert "wins" not in caplog.text
+
+        # Options change of the second chip: the bus switches, with both chips
+        entry = ConfigEntry("/dev/i2c-1@0x21", {CONF_BUS_BACKEND: BUS_BACKEND_ASYNCIO})
+        switched = await async_get_or_create_bus(hass, entry, 1)
+        assert isinstance(switched, MCP23017AsyncBus)
+        assert hass.data[DATA_BUSES][1] is switched
+        assert switched.devices == [first, second]
+        assert first._wake == switched.wake
+        assert "/dev/i2c-1@0x20" in caplog.text
+        # One handle, held by the new scheduler
+        assert pool.buses == {1: 1}
+        assert switched.smbus is bus.smbus
+        await hass.async_add_executor_job(switched.stop_polling)
+
+    asyncio.run(run())
+
+
+def test_migrated_backend():
+    merge = CHIP_OPTIONS[CONF_BUS_BACKEND]
+    assert merge(BUS_BACKEND_ASYNCIO, BUS_BACKEND_ASYNCIO) == BUS_BACKEND_ASYNCIO
+    # Disagreeing per pin entries keep the default
+    assert merge(BUS_BACKEND_ASYNCIO, BUS_BACKEND_THREAD) == BUS_BACKEND_THREAD
+    assert merge(BUS_BACKEND_THREAD, BUS_BACKEND_ASYNCIO) == BUS_BACKEND_THREAD
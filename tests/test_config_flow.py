@@ -0,0 +1,176 @@
+"""Config flow of the chips and their pins, and options flow of the chips and pins."""
+
+from unittest.mock import patch
+
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.mcp23017 import config_flow
+from custom_components.mcp23017.const import (
+    CONF_FLOW_PIN_NAME,
+    CONF_FLOW_PIN_NUMBER,
+    CONF_FLOW_PLATFORM,
+    CONF_HW_SYNC,
+    CONF_I2C_ADDRESS,
+    CONF_INVERT_LOGIC,
+    CONF_PINS,
+    CONF_PULL_MODE,
+    CONF_SCAN_CLASS,
+    CONF_VERIFY_INTERVAL,
+    DEFAULT_INVERT_LOGIC,
+    DOMAIN,
+    SCAN_CLASS_PUSHBUTTON,
+)
+
+I2C_ADDRESS = "/dev/i2c-1@0x20"
+
+
+class FakeDiscovery:
+    """Inventory of the I2C buses, with a fixed list of chips."""
+
+    def __init__(self, devices):
+        self.devices = devices
+
+    async def async_get_devices(self):
+        return list(self.devices)
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    yield
+
+
+@pytest.fixture(autouse=True)
+def no_setup():
+    """Create the entries without setting up the chips."""
+    with patch("custom_components.mcp23017.async_setup", return_value=True), patch(
+        "custom_components.mcp23017.async_setup_entry", return_value=True
+    ):
+        yield
+
+
+@pytest.fixture
+def devices(monkeypatch):
+    """Return the chips detected by the config flow, initially one at I2C_ADDRESS."""
+    discovery = FakeDiscovery([I2C_ADDRESS])
+    monkeypatch.setattr(config_flow, "async_get_discovery", lambda hass: discovery)
+    return discovery.devices
+
+
+def chip_entry():
+    return MockConfigEntry(
+        domain=DOMAIN,
+        version=2,
+        title=I2C_ADDRESS,
+        unique_id="%s.%s" % (DOMAIN, I2C_ADDRESS),
+        data={
+            CONF_I2C_ADDRESS: I2C_ADDRESS,
+            CONF_PINS: {
+                "0": {CONF_FLOW_PIN_NAME: "relay", CONF_FLOW_PLATFORM: "switch"},
+                "8": {CONF_FLOW_PIN_NAME: "button", CONF_FLOW_PLATFORM: "binary_sensor"},
+            },
+        },
+    )
+
+
+async def add_pin(hass, pin, platform="switch", name=None):
+    result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": "user"})
+    assert result["type"] == "form"
+    user_input = {CONF_I2C_ADDRESS: I2C_ADDRESS, CONF_FLOW_PLATFORM: platform, CONF_FLOW_PIN_NUMBER: pin}
+    if name is not None:
+        user_input[CONF_FLOW_PIN_NAME] = name
+    return await hass.config_entries.flow.async_configure(result["flow_id"], user_input)
+
+
+async def test_user_flow(hass, devices):
+    result = await add_pin(hass, 0, name="relay")
+    assert result["type"] == "create_entry"
+    assert result["title"] == I2C_ADDRESS
+    assert result["data"] == {
+        CONF_I2C_ADDRESS: I2C_ADDRESS,
+        CONF_PINS: {"0": {CONF_FLOW_PLATFORM: "switch", CONF_FLOW_PIN_NAME: "relay"}},
+    }
+
+    # Next pins merged into the entry of the chip
+    result = await add_pin(hass, 8, platform="binary_sensor")
+    assert result["type"] == "abort"
+    assert result["reason"] == "pin_added"
+    [entry] = hass.config_entries.async_entries(DOMAIN)
+    assert entry.unique_id == "%s.%s" % (DOMAIN, I2C_ADDRESS)
+    assert list(entry.data[CONF_PINS]) == ["0", "8"]
+    assert entry.data[CONF_PINS]["8"] == {
+        CONF_FLOW_PLATFORM: "binary_sensor",
+        CONF_FLOW_PIN_NAME: " pin %s:8" % I2C_ADDRESS,
+    }
+
+    result = await add_pin(hass, 0, platform="binary_sensor")
+    assert result["type"] == "abort"
+    assert result["reason"] == "already_configured"
+    assert entry.data[CONF_PINS]["0"][CONF_FLOW_PLATFORM] == "switch"
+
+
+async def test_user_flow_without_devices(hass, devices):
+    devices.clear()
+    result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": "user"})
+    assert result["type"] == "form"
+    assert result["step_id"] == "user"
+    assert list(result["data_schema"].schema) == [CONF_I2C_ADDRESS]
+
+
+async def test_import_replaces_pin(hass):
+    entry = chip_entry()
+    entry.add_to_hass(hass)
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN,
+        context={"source": "import"},
+        data={
+            CONF_I2C_ADDRESS: I2C_ADDRESS,
+            CONF_FLOW_PIN_NUMBER: 0,
+            CONF_FLOW_PIN_NAME: "pump",
+            CONF_FLOW_PLATFORM: "switch",
+        },
+    )
+    assert result["type"] == "abort"
+    assert result["reason"] == "pin_added"
+    assert entry.data[CONF_PINS]["0"] == {CONF_FLOW_PIN_NAME: "pump", CONF_FLOW_PLATFORM: "switch"}
+    assert entry.data[CONF_PINS]["8"][CONF_FLOW_PLATFORM] == "binary_sensor"
+
+
+async def test_options_flow_chip(hass):
+    entry = chip_entry()
+    entry.add_to_hass(hass)
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["type"] == "form"
+    assert result["step_id"] == "init"
+
+    result = await hass.config_entries.options.async_configure(result["flow_id"], {CONF_VERIFY_INTERVAL: 30})
+    assert result["type"] == "create_entry"
+    assert entry.options[CONF_VERIFY_INTERVAL] == 30
+    assert entry.options[CONF_PINS] == {}
+
+
+@pytest.mark.parametrize(
+    "pin, pin_input, platform_option",
+    [
+        ("0", {CONF_HW_SYNC: False}, CONF_HW_SYNC),
+        ("8", {CONF_SCAN_CLASS: SCAN_CLASS_PUSHBUTTON}, CONF_PULL_MODE),
+    ],
+)
+async def test_options_flow_pin(hass, pin, pin_input, platform_option):
+    entry = chip_entry()
+    entry.add_to_hass(hass)
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    result = await hass.config_entries.options.async_configure(result["flow_id"], {CONF_FLOW_PIN_NUMBER: pin})
+    assert result["type"] == "form"
+    assert result["step_id"] == "pin"
+    # Options of the platform of the pin only
+    options = [str(key) for key in result["data_schema"].schema]
+    assert platform_option in options
+    assert ({CONF_HW_SYNC, CONF_PULL_MODE} - {platform_option}).isdisjoint(options)
+
+    result = await hass.config_entries.options.async_configure(result["flow_id"], pin_input)
+    assert result["type"] == "create_entry"
+    assert list(entry.options[CONF_PINS]) == [pin]
+    pin_options = entry.options[CONF_PINS][pin]
+    assert pin_options.items() >= pin_input.items()
+    assert pin_options[CONF_INVERT_LOGIC] == DEFAULT_INVERT_LOGIC
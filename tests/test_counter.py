@@ -0,0 +1,115 @@
+"""Pulse counters: edges counted by the chip, totals published and restored by the sensor."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.mcp23017 import sensor
+from custom_components.mcp23017.const import (
+    CONF_COUNT_EDGE,
+    CONF_FLOW_PIN_NAME,
+    CONF_FLOW_PIN_NUMBER,
+    CONF_I2C_ADDRESS,
+    COUNT_EDGE_BOTH,
+    COUNT_EDGE_RISING,
+)
+
+from .common import MCP23017BinarySensor, MCP23017Counter
+
+
+def pulse(chip, sim_chip, pin, count):
+    """Pull pin low then release it count times, with a poll at each level."""
+    for _ in range(count):
+        sim_chip.setInput(pin, False)
+        chip.poll()
+        sim_chip.releaseInput(pin)
+        chip.poll()
+
+
+@pytest.mark.parametrize(
+    "count_edges, expected",
+    [((False, True), 3), ((True, False), 3), ((True, True), 6)],
+)
+def test_count_edges(make_chip, sim_bus, count_edges, expected):
+    chip = make_chip([MCP23017Counter(4, count_edges)])
+    chip.poll()
+    pulse(chip, sim_bus.chips[0x20], 4, 3)
+    assert chip.counterValue(4) == expected
+    # Counted, not pushed
+    assert not [push for push, state in chip.takePushes() if push != chip.async_record_push]
+
+
+def test_counts_kept_across_reload(make_chip, sim_bus):
+    chip = make_chip([MCP23017Counter(4), MCP23017BinarySensor(8)])
+    chip.poll()
+    pulse(chip, sim_bus.chips[0x20], 4, 2)
+    chip.unregister_entities()
+    chip.register_entities([MCP23017Counter(4), MCP23017BinarySensor(8)])
+    pulse(chip, sim_bus.chips[0x20], 4, 1)
+    assert chip.counterValue(4) == 3
+
+
+class CountingDevice:
+    """Device of a counter entity, with a settable count."""
+
+    available = True
+
+    def __init__(self, count=0):
+        self.count = count
+
+    def counterValue(self, pin):
+        return self.count
+
+
+def make_counter(monkeypatch, count_edge=COUNT_EDGE_RISING):
+    entry_infos = SimpleNamespace(
+        data={CONF_I2C_ADDRESS: "/dev/i2c-1@0x20", CONF_FLOW_PIN_NAME: "meter", CONF_FLOW_PIN_NUMBER: 4},
+        options={CONF_COUNT_EDGE: count_edge},
+    )
+    counter = sensor.MCP23017Counter(None, entry_infos)
+    states = []
+    monkeypatch.setattr(counter, "async_write_ha_state", lambda: states.append(counter.native_value), raising=False)
+    return counter, states
+
+
+def test_counter_entity(monkeypatch):
+    counter, states = make_counter(monkeypatch, COUNT_EDGE_BOTH)
+    assert counter.count_edges == (True, True)
+    device = CountingDevice(5)
+    # Edges counted before the entity was linked are not its own
+    counter.device = device
+    counter.async_publish()
+    assert states == [0]
+    device.count = 12
+    counter.async_publish()
+    assert states == [0, 7]
+    assert counter.extra_state_attributes["rate"] > 0
+
+    # New device (component set up again): its count starts from 0
+    device.count = 3
+    counter.async_publish()
+    assert states[-1] == 10
+
+
+@pytest.mark.parametrize("last_state, total", [("41", 41), ("41.0", 41), ("unknown", 0)])
+def test_counter_restore(monkeypatch, last_state, total):
+    counter, states = make_counter(monkeypatch)
+    timers = []
+
+    async def get_last_state():
+        return SimpleNamespace(state=last_state)
+
+    monkeypatch.setattr(counter, "async_get_last_state", get_last_state, raising=False)
+    monkeypatch.setattr(sensor, "async_track_time_interval", lambda hass, action, interval: timers.append(interval) or (lambda: timers.clear()))
+    asyncio.run(counter.async_added_to_hass())
+    assert counter.native_value == total
+    assert len(timers) == 1
+
+    counter.device = CountingDevice(2)
+    counter.device.count = 4
+    counter.async_publish()
+    assert states == [total + 2]
+
+    asyncio.run(counter.async_will_remove_from_hass())
+    assert not timers
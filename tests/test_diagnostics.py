@@ -0,0 +1,100 @@
+"""Performance metrics of the chips and buses: diagnostics and diagnostic sensors."""
+
+import asyncio
+import json
+
+import pytest
+
+from custom_components.mcp23017 import DATA_BUSES, MCP23017
+from custom_components.mcp23017.bus import MCP23017Bus
+from custom_components.mcp23017.const import CONF_I2C_ADDRESS, DOMAIN, HEALTH_DEGRADED, HEALTH_HEALTHY
+from custom_components.mcp23017.diagnostics import async_get_config_entry_diagnostics
+from custom_components.mcp23017.sensor import DIAGNOSTIC_SENSORS, MCP23017DiagnosticSensor
+from custom_components.mcp23017.smbus_pool import DATA_SMBUS_POOL
+
+from .common import ConfigEntry, LoopHass, MCP23017BinarySensor, MCP23017Switch
+
+I2C_ADDRESS = "/dev/i2c-1@0x20"
+
+
+@pytest.fixture
+def pooled_chip(pool, fake_hass):
+    """Return a chip polled through a handle of the pool, counting its transfers."""
+    handle = pool.acquire(1)
+    chip = MCP23017(fake_hass, I2C_ADDRESS, handle)
+    chip.register_entities([MCP23017Switch(0), MCP23017BinarySensor(8)])
+    chip.poll()
+    chip.takePushes()
+    return chip
+
+
+def test_device_metrics(pooled_chip):
+    metrics = pooled_chip.metrics
+    assert metrics["health"] == HEALTH_HEALTHY
+    assert metrics["transactions"] > 0
+    assert metrics["bytes"] > metrics["transactions"]
+    assert metrics["read_errors"] == metrics["write_errors"] == metrics["poll_errors"] == 0
+    assert metrics["poll_duration"]["count"] == 1
+    assert metrics["scan_budget"]["idle_transactions"] > 0
+
+
+def test_errors_counted(pooled_chip, opened):
+    del opened[0].chips[0x20]
+    pooled_chip.poll()
+    metrics = pooled_chip.metrics
+    assert metrics["health"] == HEALTH_DEGRADED
+    assert metrics["poll_errors"] == 1
+    assert metrics["read_errors"] + metrics["write_errors"] == 1
+    assert metrics["last_error"]
+
+
+def test_write_latency(pooled_chip):
+    pooled_chip._entities[0].turn(True)
+    pooled_chip.poll()
+    assert pooled_chip.metrics["write_latency"]["count"] == 1
+
+
+def test_config_entry_diagnostics(pooled_chip, pool):
+    scheduler = MCP23017Bus(1, pooled_chip.smbus)
+    scheduler.add_device(pooled_chip)
+    scheduler.tick(scheduler.devices)
+
+    async def run():
+        hass = LoopHass(asyncio.get_running_loop())
+        hass.data = {DOMAIN: {I2C_ADDRESS: pooled_chip}, DATA_BUSES: {1: scheduler}, DATA_SMBUS_POOL: pool}
+        return await async_get_config_entry_diagnostics(hass, ConfigEntry(I2C_ADDRESS))
+
+    try:
+        diagnostics = asyncio.run(run())
+    finally:
+        scheduler.stop_polling()
+    assert diagnostics["entry"]["data"] == {CONF_I2C_ADDRESS: I2C_ADDRESS}
+    assert diagnostics["device"]["transactions"] > 0
+    assert diagnostics["bus"]["timing"]["ticks"] == 1
+    assert diagnostics["bus"]["transactions"] == diagnostics["device"]["transactions"]
+    assert diagnostics["bus"]["budget"] == pooled_chip.scan_budget
+    assert diagnostics["smbus_pool"] == {1: 1}
+    json.dumps(diagnostics)
+
+
+def diagnostic_sensor(chip, key):
+    description = next(description for description in DIAGNOSTIC_SENSORS if description[0] == key)
+    sensor = MCP23017DiagnosticSensor(chip, I2C_ADDRESS, *description)
+    sensor.update()
+    return sensor
+
+
+def test_diagnostic_sensors(pooled_chip):
+    assert diagnostic_sensor(pooled_chip, "transactions")._attr_native_value == pooled_chip.metrics["transactions"]
+
+    errors = diagnostic_sensor(pooled_chip, "errors")
+    assert errors._attr_native_value == 0
+    assert errors._attr_extra_state_attributes == {"poll_errors": 0, "last_error": None}
+
+    # Histograms in ms: 90th percentile, with p50, p99, max and count attributes
+    poll_duration = diagnostic_sensor(pooled_chip, "poll_duration")
+    histogram = pooled_chip.metrics["poll_duration"]
+    assert poll_duration._attr_native_value == round(histogram["p90"] * 1000, 2)
+    assert poll_duration._attr_extra_state_attributes["count"] == 1
+    # No sample yet
+    assert diagnostic_sensor(pooled_chip, "push_latency")._attr_native_value is None
@@ -0,0 +1,131 @@
+"""Detection of MCP23017 chips from their register file, and the inventory of the I2C buses."""
+
+import asyncio
+import errno
+
+import pytest
+
+from custom_components.mcp23017 import discovery
+from custom_components.mcp23017.discovery import REGISTER_COUNT, MCP23017Discovery, is_mcp23017, scan_bus
+from custom_components.mcp23017.smbus_pool import DATA_SMBUS_POOL, SMBusPool
+
+from benchmarks.mcp23017_sim import SimulatedMCP23017, SimulatedSMBus
+
+from .common import ConfigEntry, LoopHass
+
+
+def read_chip(pointer=0x00):
+    """Return two register file lengths read from a simulated chip, starting at pointer."""
+    chip = SimulatedMCP23017(0x20)
+    chip.write_register(0x00, 0x0F)
+    chip.write_register(0x0C, 0xF0)
+    chip._pointer = pointer
+    return list(chip.read(2 * REGISTER_COUNT))
+
+
+@pytest.mark.parametrize("pointer", range(REGISTER_COUNT))
+def test_detects_mcp23017_at_any_pointer(pointer):
+    assert is_mcp23017(read_chip(pointer))
+
+
+def test_detects_mcp23017_with_changing_inputs():
+    data = read_chip()
+    # GPIOA changed between both register file lengths
+    data[0x12 + REGISTER_COUNT] ^= 0x01
+    assert is_mcp23017(data)
+
+
+def test_rejects_other_chips():
+    # PCF8574 returning its port
+    assert not is_mcp23017([0xFF] * 2 * REGISTER_COUNT)
+    # MCP23008: 11 registers, IOCON at 0x05
+    mcp23008 = [0xFF, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+    assert not is_mcp23017(mcp23008 * 4)
+
+
+def test_rejects_unstable_registers():
+    data = read_chip()
+    # Registers too far apart to both be inputs, whatever the pointer
+    data[0x00 + REGISTER_COUNT] ^= 0x01
+    data[0x08 + REGISTER_COUNT] ^= 0x01
+    assert not is_mcp23017(data)
+
+
+def test_rejects_short_read():
+    assert not is_mcp23017(read_chip()[:REGISTER_COUNT])
+
+
+class PCF8574:
+    """I2C expander at a MCP23017 address, reading its port whatever the length."""
+
+    def read(self, length):
+        return [0xF0] * length
+
+
+@pytest.fixture
+def sim_buses():
+    """Return simulated buses 1 and 3: chips at 0x20 and 0x23 on bus 1, a PCF8574 at 0x21."""
+    buses = {1: SimulatedSMBus(1), 3: SimulatedSMBus(3)}
+    buses[1].addChip(0x20)
+    buses[1].addChip(0x23)
+    buses[1].chips[0x21] = PCF8574()
+    return buses
+
+
+@pytest.fixture
+def discovery_pool(sim_buses):
+    """Return an SMBus pool opening the simulated buses, other buses failing to open."""
+    def factory(bus):
+        if bus not in sim_buses:
+            raise OSError(errno.ENOENT, "No such file or directory")
+        return sim_buses[bus]
+
+    return SMBusPool(factory)
+
+
+def test_scan_bus(discovery_pool):
+    assert scan_bus(discovery_pool, "/dev/i2c-1") == ["/dev/i2c-1@0x20", "/dev/i2c-1@0x23"]
+    assert scan_bus(discovery_pool, "/dev/i2c-3") == []
+    # Handles given back to the pool
+    assert discovery_pool.buses == {}
+
+
+def test_scan_bus_skips_configured_chips(discovery_pool, sim_buses):
+    configured = sim_buses[1].chips[0x20]
+    reads = []
+    configured.read = lambda length: reads.append(length)
+    assert scan_bus(discovery_pool, "/dev/i2c-1", skip={"/dev/i2c-1@0x20"}) == ["/dev/i2c-1@0x23"]
+    assert reads == []
+
+
+def test_scan_missing_bus(discovery_pool):
+    assert scan_bus(discovery_pool, "/dev/i2c-5") == []
+
+
+def test_inventory_cached(monkeypatch, discovery_pool, sim_buses):
+    monkeypatch.setattr(discovery, "i2c_buses", lambda: ["/dev/i2c-1", "/dev/i2c-3"])
+
+    async def run():
+        hass = LoopHass(asyncio.get_running_loop())
+        hass.data[DATA_SMBUS_POOL] = discovery_pool
+        # Configured chip, listed without being read
+        hass.config_entries.entries.append(ConfigEntry("/dev/i2c-3@0x27"))
+        inventory = MCP23017Discovery(hass, ttl=60)
+        assert inventory.stale
+        devices = await inventory.async_get_devices()
+        assert devices == ["/dev/i2c-1@0x20", "/dev/i2c-1@0x23", "/dev/i2c-3@0x27"]
+        assert not inventory.stale
+
+        # Within its TTL: no scan
+        sim_buses[1].reset_counters()
+        assert await inventory.async_get_devices() == devices
+        assert sim_buses[1].transactions == 0
+
+        # Stale: returned at once, refreshed in the background
+        inventory._ttl = 0
+        sim_buses[1].addChip(0x24)
+        assert await inventory.async_get_devices() == devices
+        await inventory.async_refresh()
+        assert "/dev/i2c-1@0x24" in inventory.devices
+
+    asyncio.run(run())
@@ -0,0 +1,88 @@
+"""Timestamped input changes: edge events and the buffer of recent edges."""
+
+import time
+
+from custom_components.mcp23017.const import CONF_I2C_ADDRESS, EDGE_BUFFER_SIZE, EVENT_EDGE
+from custom_components.mcp23017.interrupt import SimulatedEdgeSource
+
+from benchmarks.mcp23017_sim import SimulatedIntLine
+
+from .common import MCP23017BinarySensor, apply_pushes
+
+
+def edge_sensor(pin):
+    sensor = MCP23017BinarySensor(pin)
+    sensor.edge_events = True
+    return sensor
+
+
+def test_edge_events(make_chip, sim_bus, fake_hass):
+    chip = make_chip([edge_sensor(8)])
+    chip.poll()
+    apply_pushes(chip)
+    # Initial states are not edges
+    assert fake_hass.bus.events == []
+
+    before = time.monotonic()
+    sim_bus.chips[0x20].setInput(8, False)
+    chip.poll()
+    apply_pushes(chip)
+    assert len(fake_hass.bus.events) == 1
+    event_type, data = fake_hass.bus.events[0]
+    assert event_type == EVENT_EDGE
+    assert data[CONF_I2C_ADDRESS] == "/dev/i2c-1@0x20"
+    assert (data["pin"], data["level"]) == (8, False)
+    assert before <= data["sample_time"] <= time.monotonic()
+    assert abs(data["timestamp"] - time.time()) < 1
+    assert chip.recentEdges() == [(data["sample_time"], 8, False)]
+
+
+def test_edges_recorded_without_events(make_chip, sim_bus, fake_hass):
+    chip = make_chip([MCP23017BinarySensor(8), MCP23017BinarySensor(9)])
+    sim_chip = sim_bus.chips[0x20]
+    chip.poll()
+    sim_chip.setInput(8, False)
+    chip.poll()
+    since = chip.recentEdges()[-1][0]
+    sim_chip.setInput(9, False)
+    chip.poll()
+    apply_pushes(chip)
+    assert fake_hass.bus.events == []
+    assert [edge[1:] for edge in chip.recentEdges()] == [(8, False), (9, False)]
+    assert [edge[1:] for edge in chip.recentEdges(since)] == [(9, False)]
+
+
+def test_edge_buffer_bounded(make_chip, sim_bus):
+    chip = make_chip([MCP23017BinarySensor(8)])
+    sim_chip = sim_bus.chips[0x20]
+    chip.poll()
+    for index in range(EDGE_BUFFER_SIZE + 10):
+        sim_chip.setInput(8, index % 2 == 1)
+        chip.poll()
+    edges = chip.recentEdges()
+    assert len(edges) == EDGE_BUFFER_SIZE
+    # Newest kept
+    assert edges[-1][2] is True
+
+
+def test_pulse_shorter_than_read(make_chip, sim_bus, fake_hass):
+    """In interrupt mode, the level captured by the chip is replayed at the time of the INT edge."""
+    edge_source = SimulatedEdgeSource()
+    int_line = SimulatedIntLine(edge_source)
+    chip = make_chip([edge_sensor(8)])
+    sim_chip = sim_bus.chips[0x20]
+    int_line.connect(sim_chip)
+    chip.setEdgeSource(edge_source)
+    chip.poll()
+    apply_pushes(chip)
+
+    # Released before the chip is read
+    sim_chip.setInput(8, False)
+    sim_chip.setInput(8, True)
+    assert edge_source.read()
+    chip.poll(edge=True)
+    apply_pushes(chip)
+    assert [(data["pin"], data["level"]) for _, data in fake_hass.bus.events] == [(8, False), (8, True)]
+    falling, rising = (data["sample_time"] for _, data in fake_hass.bus.events)
+    assert falling == edge_source.edge_time
+    assert falling <= rising
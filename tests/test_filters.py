@@ -0,0 +1,87 @@
+"""Input filters."""
+
+import pytest
+
+from custom_components.mcp23017.const import (
+    FILTER_MAJORITY,
+    FILTER_MIN_PULSE,
+    FILTER_NONE,
+    FILTER_STABLE,
+)
+from custom_components.mcp23017.filters import (
+    MajorityFilter,
+    MinPulseFilter,
+    StableTimeFilter,
+    create_filter,
+)
+
+
+def test_create_filter():
+    assert isinstance(create_filter(FILTER_STABLE, 0.03, 3), StableTimeFilter)
+    assert isinstance(create_filter(FILTER_MAJORITY, 0.03, 3), MajorityFilter)
+    assert isinstance(create_filter(FILTER_MIN_PULSE, 0.03, 3), MinPulseFilter)
+    assert create_filter(FILTER_NONE, 0.03, 3) is None
+
+
+def test_stable_time_filter():
+    input_filter = StableTimeFilter(0.03)
+    input_filter.reset(False, 0)
+    assert not input_filter.pending
+    assert input_filter.deadline is None
+
+    assert input_filter.sample(True, 1.0) is False
+    assert input_filter.pending
+    assert input_filter.deadline == pytest.approx(1.03)
+    # Bounce: the stability timer restarts
+    assert input_filter.sample(False, 1.01) is False
+    assert input_filter.sample(True, 1.02) is False
+    assert input_filter.deadline == pytest.approx(1.05)
+    assert input_filter.sample(True, 1.04) is False
+    assert input_filter.sample(True, 1.05) is True
+    assert not input_filter.pending
+
+
+def test_majority_filter():
+    input_filter = MajorityFilter(3)
+    input_filter.reset(False, 0)
+    assert input_filter.sample(True, 0) is False
+    assert input_filter.pending
+    assert input_filter.sample(True, 0) is True
+    # Glitch
+    assert input_filter.sample(False, 0) is True
+    assert input_filter.sample(True, 0) is True
+    assert input_filter.sample(True, 0) is True
+    assert input_filter.pending
+    assert input_filter.sample(True, 0) is True
+    assert not input_filter.pending
+
+
+def test_majority_filter_tie_keeps_output():
+    input_filter = MajorityFilter(2)
+    input_filter.reset(True, 0)
+    assert input_filter.sample(False, 0) is True
+    assert input_filter.sample(False, 0) is False
+    assert input_filter.sample(True, 0) is False
+
+
+def test_min_pulse_filter_drops_glitches():
+    input_filter = MinPulseFilter(0.03)
+    input_filter.reset(False, 0)
+    assert input_filter.sample(True, 1.0) is False
+    assert input_filter.deadline == pytest.approx(1.03)
+    # 10 ms pulse
+    assert input_filter.sample(False, 1.01) is False
+    assert not input_filter.pending
+    assert input_filter.sample(False, 2.0) is False
+
+
+def test_min_pulse_filter_bounces_delay_the_change():
+    input_filter = MinPulseFilter(0.03)
+    input_filter.reset(False, 0)
+    input_filter.sample(True, 1.0)
+    # 20 ms high, then a 5 ms bounce: 15 ms still accumulated
+    assert input_filter.sample(False, 1.02) is False
+    assert input_filter.sample(True, 1.025) is False
+    assert input_filter.deadline == pytest.approx(1.04)
+    assert input_filter.sample(True, 1.04) is True
+    assert not input_filter.pending
@@ -0,0 +1,62 @@
+"""Button gestures."""
+
+from custom_components.mcp23017.gestures import (
+    GESTURE_DOUBLE,
+    GESTURE_LONG,
+    GESTURE_SINGLE,
+    GestureDetector,
+)
+
+
+def test_single_press():
+    detector = GestureDetector(0.4, 0.8)
+    assert detector.change(True, 0) is None
+    assert detector.deadline == 0.8
+    assert detector.change(False, 0.1) is None
+    assert detector.deadline == 0.5
+    assert detector.timeout(0.4) is None
+    assert detector.timeout(0.5) == GESTURE_SINGLE
+    assert detector.deadline is None
+
+
+def test_double_press():
+    detector = GestureDetector(0.4, 0.8)
+    detector.change(True, 0)
+    detector.change(False, 0.1)
+    assert detector.change(True, 0.3) == GESTURE_DOUBLE
+    assert detector.change(False, 0.4) is None
+    assert detector.timeout(2) is None
+
+
+def test_second_press_after_window():
+    """A press after the double press window, before its timeout was checked, is a single press then a new press."""
+    detector = GestureDetector(0.4, 0.8)
+    detector.change(True, 0)
+    detector.change(False, 0.1)
+    assert detector.change(True, 0.6) == GESTURE_SINGLE
+    assert detector.change(False, 0.7) is None
+    assert detector.timeout(1.1) == GESTURE_SINGLE
+
+
+def test_long_press():
+    detector = GestureDetector(0.4, 0.8)
+    detector.change(True, 0)
+    assert detector.timeout(0.8) == GESTURE_LONG
+    assert detector.deadline is None
+    # Release of the long press
+    assert detector.change(False, 1.5) is None
+    assert detector.timeout(3) is None
+
+
+def test_long_press_released_before_timeout():
+    detector = GestureDetector(0.4, 0.8)
+    detector.change(True, 0)
+    assert detector.change(False, 1.0) == GESTURE_LONG
+    assert detector.timeout(3) is None
+
+
+def test_single_press_on_release_without_double_press():
+    detector = GestureDetector(0, 0.8)
+    detector.change(True, 0)
+    assert detector.change(False, 0.1) == GESTURE_SINGLE
+    assert detector.deadline is None
@@ -0,0 +1,150 @@
+"""Health state machine of a chip: backoff, open circuit, probe and recovery."""
+
+from custom_components.mcp23017 import MCP23017
+from custom_components.mcp23017.const import (
+    BACKOFF_MAX,
+    BACKOFF_MIN,
+    HEALTH_DEGRADED,
+    HEALTH_HEALTHY,
+    HEALTH_OPEN,
+    MAX_RETRY,
+)
+
+from benchmarks.mcp23017_sim import IODIR, OLAT
+
+from .common import MCP23017BinarySensor, MCP23017Switch, apply_pushes
+
+
+def poll_now(chip):
+    """Poll without waiting for the backoff."""
+    chip._retry_at = 0
+    chip.poll()
+
+
+def configured_chip(make_chip):
+    switch = MCP23017Switch(0)
+    chip = make_chip([switch, MCP23017BinarySensor(8)])
+    chip.poll()
+    apply_pushes(chip)
+    switch.turn(True)
+    chip.poll()
+    return chip, switch
+
+
+def test_backoff_then_open(make_chip, sim_bus):
+    chip, _ = configured_chip(make_chip)
+    unavailable = []
+    chip.async_update_availability = unavailable.append
+    del sim_bus.chips[0x20]
+
+    chip.poll()
+    assert chip.health == HEALTH_DEGRADED
+    assert chip.available
+    assert chip.next_poll >= chip._retry_at
+    delays = []
+    for _ in range(MAX_RETRY):
+        assert chip.health == HEALTH_DEGRADED
+        before = chip._error_cpt
+        poll_now(chip)
+        assert chip._error_cpt == before + 1
+        delays.append(chip._retry_at)
+    assert chip.health == HEALTH_OPEN
+    assert not chip.available
+    assert chip.metrics["circuit_opens"] == 1
+    apply_pushes(chip)
+    assert unavailable == [False]
+    # The backoff doubles, up to BACKOFF_MAX
+    assert min(BACKOFF_MIN * 2 ** MAX_RETRY, BACKOFF_MAX) >= delays[-1] - delays[-2] > 0
+
+
+def test_switch_commands_wait_while_failing(make_chip, sim_bus):
+    chip, switch = configured_chip(make_chip)
+    sim_chip = sim_bus.chips.pop(0x20)
+    chip.poll()
+    switch.turn(False)
+    # Not written while degraded, the next poll writes it
+    chip.flushOutputs()
+    assert chip.write_pending
+    sim_bus.chips[0x20] = sim_chip
+    poll_now(chip)
+    assert chip.health == HEALTH_HEALTHY
+    assert sim_chip.outputs(0) & 0x01 == 0
+
+
+def test_probe_closes_circuit(make_chip, sim_bus):
+    chip, _ = configured_chip(make_chip)
+    sim_chip = sim_bus.chips.pop(0x20)
+    for _ in range(MAX_RETRY + 1):
+        poll_now(chip)
+    assert chip.health == HEALTH_OPEN
+    apply_pushes(chip)
+    transactions = sim_bus.transactions
+    # Only one probe per backoff
+    chip.poll()
+    assert sim_bus.transactions == transactions
+
+    sim_bus.chips[0x20] = sim_chip
+    availability = []
+    chip.async_update_availability = availability.append
+    poll_now(chip)
+    assert chip.health == HEALTH_HEALTHY
+    apply_pushes(chip)
+    assert availability == [True]
+    # Configuration checked by the next poll: nothing to rewrite
+    writes = sim_bus.transactions
+    chip.poll()
+    assert chip.metrics["conf_drifts"] == 0
+    assert sim_bus.transactions == writes + 2
+
+
+def expect_configured(sim_chip):
+    """Assert the configuration of configured_chip: pin 8 input, the others outputs, pin 0 on."""
+    assert sim_chip._regs[IODIR] == [0x00, 0x01]
+    assert sim_chip._regs[OLAT][0] & 0x01
+
+
+def test_power_cycle_while_open(make_chip, sim_bus):
+    """A chip reset while its circuit is open is fully configured again, outputs included."""
+    chip, _ = configured_chip(make_chip)
+    del sim_bus.chips[0x20]
+    for _ in range(MAX_RETRY + 1):
+        poll_now(chip)
+    assert chip.health == HEALTH_OPEN
+    # Back with its power-on registers
+    sim_chip = sim_bus.addChip(0x20)
+    poll_now(chip)
+    chip.poll()
+    expect_configured(sim_chip)
+    assert chip.metrics["conf_drifts"] == 1
+
+
+def test_power_cycle_while_reinitialising(make_chip, sim_bus):
+    """A chip reset while a reinitialisation is pending is not configured from the stale register image."""
+    chip, _ = configured_chip(make_chip)
+    del sim_bus.chips[0x20]
+    # New input: the reinitialisation fails writing IODIRB
+    chip.register_entities([MCP23017BinarySensor(9)])
+    chip.poll()
+    assert chip.health == HEALTH_DEGRADED
+    assert chip._to_init
+    sim_chip = sim_bus.addChip(0x20)
+    poll_now(chip)
+    assert chip.health == HEALTH_HEALTHY
+    assert sim_chip._regs[IODIR] == [0x00, 0x03]
+    assert sim_chip._regs[OLAT][0] & 0x01
+
+
+def test_unsupported_entity():
+    class MCP23017Light:
+        pin = 0
+        name = "light"
+        _invert_logic = False
+
+    chip = MCP23017(None, "/dev/i2c-1@0x20")
+    chip._entities[0] = MCP23017Light()
+    try:
+        chip.confGPIO()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError not raised")
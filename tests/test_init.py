@@ -0,0 +1,180 @@
+"""MCP23017 configuration writes, services and config entry migration."""
+
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import entity_registry
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.mcp23017 import MCP23017, async_migrate_entry, async_setup
+from custom_components.mcp23017.const import (
+    ATTR_MASK,
+    ATTR_VALUE,
+    CONF_FLOW_PIN_NAME,
+    CONF_FLOW_PIN_NUMBER,
+    CONF_FLOW_PLATFORM,
+    CONF_I2C_ADDRESS,
+    CONF_INTERRUPT_LINE,
+    CONF_INVERT_LOGIC,
+    CONF_PINS,
+    CONF_VERIFY_INTERVAL,
+    DOMAIN,
+    SERVICE_SET_OUTPUTS,
+)
+
+from benchmarks.fake_smbus import FakeSMBus
+
+from .common import MCP23017Switch
+
+I2C_ADDRESS = "/dev/i2c-1@0x20"
+
+
+class RecordingSMBus(FakeSMBus):
+    """Fake SMBus keeping the writes: (register, values)."""
+
+    def __init__(self):
+        FakeSMBus.__init__(self)
+        self.writes = []
+
+    def write_byte_data(self, i2c_addr, register, value, force=None):
+        self.writes.append((register, [value]))
+        FakeSMBus.write_byte_data(self, i2c_addr, register, value, force)
+
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        self.writes.append((register, list(data)))
+        FakeSMBus.write_i2c_block_data(self, i2c_addr, register, data, force)
+
+
+def test_write_conf_splits_runs():
+    """Only the registers which differ are written, one transaction per run of consecutive registers."""
+    bus = RecordingSMBus()
+    chip = MCP23017(None, I2C_ADDRESS, bus)
+    current = [0xFF, 0xFF] + [0x00] * (MCP23017.GPPUB - 1)
+    chip._chip_registers = list(current)
+    registers = list(current)
+    registers[MCP23017.IODIRA] = 0x0F
+    registers[MCP23017.IODIRA + 1] = 0xF0
+    registers[MCP23017.GPINTENA] = 0x0F
+    registers[MCP23017.IOCONA] = registers[MCP23017.IOCONB] = MCP23017.IOCON_MIRROR
+    registers[MCP23017.GPPUB] = 0xFF
+
+    assert chip.writeConf(registers) == 4
+    assert bus.writes == [
+        # IOCON first, once
+        (MCP23017.IOCONA, [MCP23017.IOCON_MIRROR]),
+        (MCP23017.IODIRA, [0x0F, 0xF0]),
+        (MCP23017.GPINTENA, [0x0F]),
+        (MCP23017.GPPUB, [0xFF]),
+    ]
+    assert chip._chip_registers == registers
+
+    bus.writes.clear()
+    assert chip.writeConf(registers) == 0
+    assert bus.writes == []
+
+
+def test_write_conf_unknown_content():
+    """Without known content, all registers are written in one run after IOCON."""
+    bus = RecordingSMBus()
+    chip = MCP23017(None, I2C_ADDRESS, bus)
+    registers = [0xFF, 0xFF] + [0x00] * (MCP23017.GPPUB - 1)
+
+    assert chip.writeConf(registers) == 3
+    assert bus.writes == [
+        (MCP23017.IOCONA, [0x00]),
+        (MCP23017.IODIRA, registers[:MCP23017.IOCONA]),
+        (MCP23017.GPPUA, registers[MCP23017.GPPUA:]),
+    ]
+
+
+async def test_set_outputs_service(hass):
+    """set_outputs sets the switches of a device, written in one transaction."""
+    assert await async_setup(hass, {})
+    bus = RecordingSMBus()
+    chip = MCP23017(hass, I2C_ADDRESS, bus)
+    switches = [MCP23017Switch(0), MCP23017Switch(1, invert_logic=True)]
+    chip.register_entities(switches)
+    hass.data[DOMAIN][I2C_ADDRESS] = chip
+
+    await hass.services.async_call(
+        DOMAIN, SERVICE_SET_OUTPUTS, {CONF_I2C_ADDRESS: I2C_ADDRESS, ATTR_MASK: 0b11, ATTR_VALUE: 0b01}, blocking=True
+    )
+    assert [switch.state for switch in switches] == [True, False]
+    chip.writeOutputs()
+    assert bus.writes == [(MCP23017.OLATA, [0x03])]
+
+    with pytest.raises(HomeAssistantError):
+        await hass.services.async_call(
+            DOMAIN, SERVICE_SET_OUTPUTS, {CONF_I2C_ADDRESS: "/dev/i2c-1@0x27", ATTR_MASK: 1, ATTR_VALUE: 1}, blocking=True
+        )
+
+
+def pin_entry(pin, platform, options=None):
+    return MockConfigEntry(
+        domain=DOMAIN,
+        version=1,
+        title="pin %d" % pin,
+        unique_id="%s.%s.%d" % (DOMAIN, I2C_ADDRESS, pin),
+        data={
+            CONF_I2C_ADDRESS: I2C_ADDRESS,
+            CONF_FLOW_PIN_NUMBER: pin,
+            CONF_FLOW_PIN_NAME: "pin %d" % pin,
+            CONF_FLOW_PLATFORM: platform,
+        },
+        options=options or {},
+    )
+
+
+async def test_migrate_pin_entries(hass):
+    """Version 1 entries of the pins of a chip are merged into one version 2 entry."""
+    switch = pin_entry(0, "switch", {CONF_INVERT_LOGIC: True, CONF_VERIFY_INTERVAL: 30})
+    sensor = pin_entry(8, "binary_sensor", {CONF_VERIFY_INTERVAL: 10, CONF_INTERRUPT_LINE: "/dev/gpiochip0:17"})
+    switch.add_to_hass(hass)
+    sensor.add_to_hass(hass)
+    entities = entity_registry.async_get(hass)
+    sensor_entity = entities.async_get_or_create("binary_sensor", DOMAIN, "pin_8", config_entry=sensor)
+
+    assert await async_migrate_entry(hass, switch)
+    await hass.async_block_till_done()
+
+    assert switch.version == 2
+    assert switch.unique_id == "%s.%s" % (DOMAIN, I2C_ADDRESS)
+    assert switch.data == {
+        CONF_I2C_ADDRESS: I2C_ADDRESS,
+        CONF_PINS: {
+            "0": {CONF_FLOW_PIN_NAME: "pin 0", CONF_FLOW_PLATFORM: "switch"},
+            "8": {CONF_FLOW_PIN_NAME: "pin 8", CONF_FLOW_PLATFORM: "binary_sensor"},
+        },
+    }
+    # Chip options reduced over the pins
+    assert switch.options == {
+        CONF_VERIFY_INTERVAL: 10,
+        CONF_INTERRUPT_LINE: "/dev/gpiochip0:17",
+        CONF_PINS: {"0": {CONF_INVERT_LOGIC: True}, "8": {}},
+    }
+    assert hass.config_entries.async_entries(DOMAIN) == [switch]
+    assert entities.async_get(sensor_entity.entity_id).config_entry_id == switch.entry_id
+
+
+async def test_migrate_merged_pin_entry(hass):
+    """A version 1 entry already merged into its chip entry is removed."""
+    chip = MockConfigEntry(
+        domain=DOMAIN,
+        version=2,
+        title=I2C_ADDRESS,
+        unique_id="%s.%s" % (DOMAIN, I2C_ADDRESS),
+        data={CONF_I2C_ADDRESS: I2C_ADDRESS, CONF_PINS: {}},
+    )
+    chip.add_to_hass(hass)
+    pin = pin_entry(1, "switch")
+    pin.add_to_hass(hass)
+
+    assert not await async_migrate_entry(hass, pin)
+    await hass.async_block_till_done()
+    assert hass.config_entries.async_entries(DOMAIN) == [chip]
+
+
+async def test_migrate_current_entry(hass):
+    chip = MockConfigEntry(domain=DOMAIN, version=2, data={CONF_I2C_ADDRESS: I2C_ADDRESS, CONF_PINS: {}})
+    chip.add_to_hass(hass)
+    assert await async_migrate_entry(hass, chip)
+    assert chip.version == 2
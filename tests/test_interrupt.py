@@ -0,0 +1,184 @@
+"""Interrupt mode against simulated chips sharing one INT line."""
+
+import os
+import random
+
+import pytest
+
+from custom_components.mcp23017 import MCP23017
+from custom_components.mcp23017.bus import MCP23017Bus, async_apply_pushes
+from custom_components.mcp23017 import interrupt
+from custom_components.mcp23017.interrupt import SimulatedEdgeSource, acquire_edge_source
+
+from benchmarks.mcp23017_sim import SimulatedIntLine, SimulatedSMBus
+
+from .common import MCP23017BinarySensor, MCP23017Switch
+
+
+class SharedLine:
+    """Chips with 8 switches and 8 inputs wired to one simulated INT line, served pass by pass."""
+
+    def __init__(self, count):
+        self.sim_bus = SimulatedSMBus()
+        self.edge_source = SimulatedEdgeSource()
+        self.int_line = SimulatedIntLine(self.edge_source)
+        self.scheduler = MCP23017Bus(1, self.sim_bus)
+        # Last state reported by each input, by (chip index, pin)
+        self.reported = {}
+        self.chips = []
+        for index in range(count):
+            address = 0x20 + index
+            sim_chip = self.sim_bus.addChip(address)
+            # Inputs driven high, as pulled up
+            sim_chip.setInputs(1, 0xFF)
+            self.int_line.connect(sim_chip)
+            chip = MCP23017(None, "/dev/i2c-1@0x%02x" % address, self.sim_bus)
+            chip.register_entities(
+                [MCP23017Switch(pin) for pin in range(8)]
+                + [MCP23017BinarySensor(pin) for pin in range(8, 16)]
+            )
+            chip.setEdgeSource(self.edge_source)
+            self.scheduler.add_device(chip)
+            self.chips.append((chip, sim_chip))
+        # Configuration and initial states
+        self.scheduler.poll_pass(self.scheduler.devices)
+        self.apply_pushes()
+
+    def apply_pushes(self):
+        for index, (chip, _) in enumerate(self.chips):
+            async_apply_pushes(chip.takePushes())
+            for pin in range(8, 16):
+                self.reported[(index, pin)] = chip._entities[pin].state
+
+    def serve(self):
+        """Serve the pending edge as the scheduler does after its wait."""
+        edges = {self.edge_source} if self.edge_source.read() else set()
+        self.scheduler.poll_pass(self.scheduler.devices, edges)
+        self.apply_pushes()
+
+    def levels(self):
+        """Return the levels driven on the inputs, by (chip index, pin)."""
+        return {
+            (index, pin): bool(sim_chip._levels[1] & (1 << (pin - 8)))
+            for index, (_, sim_chip) in enumerate(self.chips)
+            for pin in range(8, 16)
+        }
+
+    def close(self):
+        self.scheduler.stop_polling()
+        for chip, _ in self.chips:
+            chip.setEdgeSource(None)
+
+
+@pytest.fixture
+def shared_line(request):
+    line = SharedLine(request.param)
+    yield line
+    line.close()
+
+
+@pytest.mark.parametrize("shared_line", [2], indirect=True)
+def test_edge_polls_all_chips(shared_line):
+    """One edge serves every chip asserting the line."""
+    assert shared_line.reported == shared_line.levels()
+    shared_line.chips[0][1].setInput(8, False)
+    shared_line.chips[1][1].setInput(15, False)
+    assert shared_line.edge_source.edges == 1
+
+    shared_line.serve()
+    assert shared_line.reported == shared_line.levels()
+    assert not shared_line.int_line.active()
+
+
+@pytest.mark.parametrize("shared_line", [2], indirect=True)
+def test_change_while_line_held(shared_line):
+    """A chip asserting INT while another one holds the line low makes no edge, its change is still read."""
+    first, second = shared_line.chips
+    read_interrupts = second[0].readInterrupts
+
+    def assert_first():
+        # The first chip, already served, asserts INT before the second one releases the line
+        first[1].setInput(9, False)
+        return read_interrupts()
+
+    second[0].readInterrupts = assert_first
+    second[1].setInput(8, False)
+    shared_line.serve()
+    second[0].readInterrupts = read_interrupts
+
+    assert shared_line.edge_source.edges == 1
+    assert shared_line.reported[(0, 9)] is False
+    assert shared_line.reported == shared_line.levels()
+    assert not shared_line.int_line.active()
+
+
+@pytest.mark.parametrize("shared_line", [64], indirect=True)
+def test_no_change_lost(shared_line):
+    """Random changes of 64 chips on one line, some made while the line is served, are all reported."""
+    rand = random.Random(3)
+    # Changes left to make while the line is served, per pass
+    budget = [0]
+
+    def flip():
+        _, sim_chip = rand.choice(shared_line.chips)
+        pin = rand.randrange(8, 16)
+        sim_chip.setInput(pin, not sim_chip._levels[1] & (1 << (pin - 8)))
+
+    for chip, _ in shared_line.chips:
+        read_interrupts = chip.readInterrupts
+
+        def read_and_flip(read_interrupts=read_interrupts):
+            if budget[0] and rand.random() < 0.1:
+                budget[0] -= 1
+                flip()
+            return read_interrupts()
+
+        chip.readInterrupts = read_and_flip
+
+    for _ in range(200):
+        for _ in range(rand.randrange(1, 4)):
+            flip()
+        budget[0] = 3
+        shared_line.serve()
+        assert shared_line.reported == shared_line.levels()
+        assert not shared_line.int_line.active()
+
+
+@pytest.mark.parametrize("shared_line", [2], indirect=True)
+def test_shared_edge_source_released(shared_line):
+    """The edge source is closed when the last chip stops watching the line."""
+    edge_source = shared_line.edge_source
+    (first, _), (second, _) = shared_line.chips
+    first.setEdgeSource(None)
+    os.fstat(edge_source.fileno())
+    second.setEdgeSource(None)
+    with pytest.raises(OSError):
+        os.fstat(edge_source.fileno())
+
+
+class LineEdgeSource(SimulatedEdgeSource):
+    """Simulated edge source standing for the GPIO line of a chip."""
+
+    def __init__(self, path, line):
+        SimulatedEdgeSource.__init__(self)
+        self.key = "%s:%d" % (path, line)
+
+
+def test_one_edge_source_per_line(monkeypatch):
+    """Chips wired to the same GPIO line share one edge source, closed with the last one."""
+    monkeypatch.setattr(interrupt, "GpioCdevEdgeSource", LineEdgeSource)
+    first = acquire_edge_source("/dev/gpiochip0:17")
+    assert acquire_edge_source("/dev/gpiochip0:017") is first
+    other = acquire_edge_source("/dev/gpiochip0:18")
+    assert other is not first
+
+    first.release()
+    os.fstat(first.fileno())
+    first.release()
+    with pytest.raises(OSError):
+        os.fstat(first.fileno())
+    # A new request of the line after the last release
+    again = acquire_edge_source("/dev/gpiochip0:17")
+    assert again is not first
+    again.release()
+    other.release()
@@ -0,0 +1,161 @@
+"""Outputs of a chip: switch commands, hardware sync and follow."""
+
+from benchmarks.mcp23017_sim import IODIR, OLAT
+
+from .common import MCP23017BinarySensor, MCP23017Switch, apply_pushes
+
+
+def record_writes(sim_chip):
+    """Record the (function, port, value) of the registers written to sim_chip."""
+    writes = []
+    write_register = sim_chip.write_register
+
+    def write(register, value):
+        writes.append(sim_chip._decode(register) + (value,))
+        write_register(register, value)
+
+    sim_chip.write_register = write
+    return writes
+
+
+def short_pin(sim_chip, pin, level):
+    """Force the level read on pin, as a shorted or overloaded output; return the function releasing it."""
+    port, bit = pin // 8, 1 << (pin % 8)
+    read_pins = sim_chip._read_pins
+
+    def read(p):
+        value = read_pins(p)
+        if p != port:
+            return value
+        return value | bit if level else value & ~bit
+
+    sim_chip._read_pins = read
+    return lambda: setattr(sim_chip, "_read_pins", read_pins)
+
+
+def test_set_switches(make_chip, sim_bus):
+    switches = [MCP23017Switch(0), MCP23017Switch(1, invert_logic=True), MCP23017Switch(9)]
+    sensor = MCP23017BinarySensor(8)
+    chip = make_chip(switches + [sensor])
+    sim_chip = sim_bus.chips[0x20]
+    chip.poll()
+    apply_pushes(chip)
+
+    # Pin 8 is not a switch: ignored
+    chip.setSwitches(0b1000000011, 0b1100000001)
+    assert [switch.state for switch in switches] == [True, False, True]
+    sim_bus.reset_counters()
+    chip.writeOutputs()
+    # Both ports in one transaction, invert logic applied per switch
+    assert sim_bus.transactions == 1
+    assert sim_chip.outputs(0) == 0x03
+    assert sim_chip.outputs(1) == 0x02
+    assert sensor.states == [True]
+
+    # Pins out of the mask are kept
+    chip.setSwitches(0b10, 0b10)
+    chip.writeOutputs()
+    assert [switch.state for switch in switches] == [True, True, True]
+    assert sim_chip.outputs(0) == 0x01
+
+
+def test_warm_start_adopts_live_outputs(make_chip, sim_bus):
+    sim_chip = sim_bus.addChip(0x20)
+    # Left configured by the previous run: pins 0 and 1 outputs, pin 0 on
+    sim_chip._regs[IODIR] = [0xFC, 0xFF]
+    sim_chip._regs[OLAT] = [0x01, 0x00]
+    writes = record_writes(sim_chip)
+    on = MCP23017Switch(0, restored_state=False)
+    off = MCP23017Switch(1, restored_state=True)
+    chip = make_chip([on, off])
+    chip.poll()
+    apply_pushes(chip)
+    # The live level wins over the restored state, without an OLAT write
+    assert on.state is True
+    assert off.state is False
+    assert not [write for write in writes if write[0] == OLAT]
+    assert sim_chip.outputs(0) == 0x01
+
+
+def test_reset_chip_restores_outputs(make_chip, sim_bus):
+    sim_chip = sim_bus.addChip(0x20)
+    restored = MCP23017Switch(0, restored_state=True)
+    inverted = MCP23017Switch(1, invert_logic=True)
+    unknown = MCP23017Switch(2)
+    no_sync = MCP23017Switch(3, hw_sync=False, restored_state=True)
+    chip = make_chip([restored, inverted, unknown, no_sync])
+    chip.poll()
+    apply_pushes(chip)
+    # Power-on values: no live output, restored state or off
+    assert restored.state is True
+    assert inverted.state is False
+    assert unknown.state is False
+    assert no_sync.state is False
+    assert sim_chip.outputs(0) == 0x03
+
+
+def test_hw_follow_keeps_the_command(make_chip, sim_bus):
+    switch = MCP23017Switch(0, hw_follow=True)
+    chip = make_chip([switch, MCP23017BinarySensor(8)])
+    sim_chip = sim_bus.chips[0x20]
+    chip.poll()
+    apply_pushes(chip)
+    switch.turn(True)
+    chip.poll()
+    apply_pushes(chip)
+    assert switch.hw_state is None
+    assert sim_chip.outputs(0) == 0x01
+
+    release = short_pin(sim_chip, 0, False)
+    writes = record_writes(sim_chip)
+    chip.poll()
+    apply_pushes(chip)
+    # The level read back is followed, the command and the output are kept
+    assert switch.hw_state is False
+    assert switch.state is True
+    chip.poll()
+    apply_pushes(chip)
+    assert not [write for write in writes if write[0] == OLAT]
+    assert sim_chip._regs[OLAT][0] == 0x01
+
+    release()
+    chip.poll()
+    apply_pushes(chip)
+    assert switch.hw_state is None
+    assert switch.state is True
+
+
+def test_hw_follow_new_command(make_chip, sim_bus):
+    switch = MCP23017Switch(0, hw_follow=True)
+    chip = make_chip([switch, MCP23017BinarySensor(8)])
+    sim_chip = sim_bus.chips[0x20]
+    chip.poll()
+    apply_pushes(chip)
+    short_pin(sim_chip, 0, False)
+    switch.turn(True)
+    # The outputs are written after the inputs are read
+    chip.poll()
+    chip.poll()
+    apply_pushes(chip)
+    assert switch.hw_state is False
+
+    # Commanded off: the pin agrees with the output written again
+    switch.turn(False)
+    chip.poll()
+    chip.poll()
+    apply_pushes(chip)
+    assert switch.hw_state is None
+    assert sim_chip._regs[OLAT][0] == 0x00
+
+
+def test_without_hw_follow(make_chip, sim_bus):
+    switch = MCP23017Switch(0)
+    chip = make_chip([switch, MCP23017BinarySensor(8)])
+    sim_chip = sim_bus.chips[0x20]
+    chip.poll()
+    switch.turn(True)
+    chip.poll()
+    apply_pushes(chip)
+    short_pin(sim_chip, 0, False)
+    chip.poll()
+    assert not chip.takePushes()
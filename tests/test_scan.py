@@ -0,0 +1,131 @@
+"""Scan rate of a chip in polling mode: fast after an input change, then backing off to the idle rate.
+
+The rates come from the scan classes of the inputs of the chip.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.mcp23017.binary_sensor import MCP23017BinarySensor as BinarySensorEntity
+from custom_components.mcp23017.const import (
+    CONF_FLOW_PIN_NAME,
+    CONF_FLOW_PIN_NUMBER,
+    CONF_I2C_ADDRESS,
+    CONF_SCAN_CLASS,
+    CONF_SCAN_FAST,
+    CONF_SCAN_IDLE,
+    DEFAULT_SCAN_DECAY,
+    DEFAULT_SCAN_FAST,
+    DEFAULT_SCAN_IDLE,
+    NO_INPUT_SCAN_CLASS,
+    SCAN_CLASS_COUNTER,
+    SCAN_CLASS_CUSTOM,
+    SCAN_CLASS_PUSHBUTTON,
+    SCAN_CLASS_SLOW,
+    SCAN_CLASSES,
+)
+
+from .common import MCP23017BinarySensor, MCP23017Counter, MCP23017Switch
+
+
+def intervals(chip, start, count):
+    """Return the scan intervals of count polls from start, each one at the time set by the previous."""
+    now = start
+    result = []
+    for _ in range(count):
+        interval = chip.scanInterval(now)
+        result.append(interval)
+        now += interval
+    return result
+
+
+def test_fast_after_change_then_backoff(make_chip, sim_bus):
+    chip = make_chip([MCP23017BinarySensor(8)])
+    chip.poll()
+    sim_bus.chips[0x20].setInput(8, False)
+    chip.poll()
+    change = chip._last_change
+    assert change is not None
+
+    # Fast during the decay, then doubling up to the idle rate
+    assert chip.scanInterval(change) == DEFAULT_SCAN_FAST
+    assert chip.scanInterval(change + DEFAULT_SCAN_DECAY - 0.01) == DEFAULT_SCAN_FAST
+    backoff = intervals(chip, change + DEFAULT_SCAN_DECAY, 6)
+    assert backoff[0] == 2 * DEFAULT_SCAN_FAST
+    assert backoff == sorted(backoff)
+    assert backoff[-1] == DEFAULT_SCAN_IDLE
+
+
+def test_next_poll_follows_activity(make_chip, sim_bus):
+    chip = make_chip([MCP23017BinarySensor(8)])
+    chip.poll()
+    sim_bus.chips[0x20].setInput(8, False)
+    chip.poll()
+    assert chip.next_poll - chip._last_change == pytest.approx(DEFAULT_SCAN_FAST)
+
+
+def test_outputs_do_not_speed_up(make_chip):
+    switch = MCP23017Switch(0)
+    chip = make_chip([switch, MCP23017BinarySensor(8)])
+    chip.poll()
+    chip.poll()
+    last_change = chip._last_change
+    switch.turn(True)
+    chip.poll()
+    # The output read back with the inputs is not an input change
+    chip.poll()
+    assert chip._last_change == last_change
+
+
+def chip_rates(chip):
+    return chip._scan_fast, chip._scan_idle, chip._scan_decay
+
+
+def test_fastest_input_sets_the_pace(make_chip):
+    chip = make_chip([
+        MCP23017BinarySensor(8, scan_rates=SCAN_CLASSES[SCAN_CLASS_SLOW]),
+        MCP23017BinarySensor(9, scan_rates=SCAN_CLASSES[SCAN_CLASS_PUSHBUTTON]),
+    ])
+    pushbutton = SCAN_CLASSES[SCAN_CLASS_PUSHBUTTON]
+    slow = SCAN_CLASSES[SCAN_CLASS_SLOW]
+    # Fastest scans, longest decay
+    assert chip_rates(chip) == (pushbutton[0], pushbutton[1], max(pushbutton[2], slow[2]))
+
+    # Reload without the push button
+    chip.unregister_entities()
+    chip.register_entities([MCP23017BinarySensor(8, scan_rates=slow)])
+    assert chip_rates(chip) == slow
+
+
+def test_rates_without_inputs(make_chip):
+    chip = make_chip([MCP23017Switch(0)])
+    assert chip_rates(chip) == SCAN_CLASSES[NO_INPUT_SCAN_CLASS]
+
+
+def test_counter_rates(make_chip):
+    chip = make_chip([MCP23017Counter(8), MCP23017BinarySensor(9)])
+    assert chip._scan_idle == SCAN_CLASSES[SCAN_CLASS_COUNTER][1]
+    budget = chip.scan_budget
+    # Idle as fast as active, not to miss pulses
+    assert budget["idle_transactions"] == budget["active_transactions"]
+
+
+def binary_sensor_entity(options):
+    entry_infos = SimpleNamespace(
+        data={CONF_I2C_ADDRESS: "/dev/i2c-1@0x20", CONF_FLOW_PIN_NAME: "input", CONF_FLOW_PIN_NUMBER: 8},
+        options=options,
+    )
+    return BinarySensorEntity(None, entry_infos)
+
+
+@pytest.mark.parametrize(
+    "options, rates",
+    [
+        ({}, (DEFAULT_SCAN_FAST, DEFAULT_SCAN_IDLE, DEFAULT_SCAN_DECAY)),
+        ({CONF_SCAN_CLASS: SCAN_CLASS_PUSHBUTTON}, SCAN_CLASSES[SCAN_CLASS_PUSHBUTTON]),
+        ({CONF_SCAN_CLASS: SCAN_CLASS_CUSTOM, CONF_SCAN_FAST: .05, CONF_SCAN_IDLE: 1}, (.05, 1, DEFAULT_SCAN_DECAY)),
+    ],
+)
+def test_scan_class_option(options, rates):
+    assert binary_sensor_entity(options).scan_rates == rates
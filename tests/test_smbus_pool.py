@@ -0,0 +1,72 @@
+"""Reference counted pool of SMBus handles."""
+
+import pytest
+
+from custom_components.mcp23017.tracer import OP_READ_BYTE_DATA, OP_WRITE_BYTE_DATA, I2CTracer
+
+
+def test_one_handle_per_bus(pool, opened):
+    first = pool.acquire(1)
+    second = pool.acquire(1)
+    other = pool.acquire(2)
+    assert first is second
+    assert other is not first
+    assert pool.buses == {1: 2, 2: 1}
+    assert [smbus.bus for smbus in opened] == [1, 2]
+
+    pool.release(first)
+    assert not opened[0].closed
+    pool.release(second)
+    # Closed by its last user
+    assert opened[0].closed
+    assert pool.buses == {2: 1}
+
+    # Opened again by the next user
+    assert pool.acquire(1) is not first
+    assert len(opened) == 3
+
+
+def test_borrow(pool, opened):
+    holder = pool.acquire(1)
+    with pool.borrow(1) as handle:
+        assert handle is holder
+        assert pool.buses == {1: 2}
+    assert pool.buses == {1: 1}
+
+    with pytest.raises(OSError):
+        with pool.borrow(3) as handle:
+            handle.read_byte_data(0x20, 0x00)
+            raise OSError("transfer failed")
+    # Released on error too
+    assert opened[-1].bus == 3
+    assert opened[-1].closed
+    assert pool.buses == {1: 1}
+
+
+def test_stats_by_address(pool):
+    handle = pool.acquire(1)
+    handle.read_byte_data(0x20, 0x00)
+    handle.read_i2c_block_data(0x20, 0x12, 2)
+    with pytest.raises(OSError):
+        handle.write_byte_data(0x21, 0x00, 0xFF)
+    with pytest.raises(OSError):
+        handle.read_byte_data(0x21, 0x00)
+
+    assert handle.stats(0x20) == {"transactions": 2, "bytes": 9, "read_errors": 0, "write_errors": 0}
+    assert handle.stats(0x21) == {"transactions": 2, "bytes": 7, "read_errors": 1, "write_errors": 1}
+    assert handle.stats() == {"transactions": 4, "bytes": 16, "read_errors": 1, "write_errors": 1}
+    assert handle.stats(0x22)["transactions"] == 0
+
+
+def test_tracer_of_all_handles(pool):
+    before = pool.acquire(1)
+    tracer = I2CTracer(16)
+    pool.setTracer(tracer)
+    after = pool.acquire(2)
+    before.read_byte_data(0x20, 0x00)
+    after.write_byte_data(0x20, 0x14, 0x01)
+    assert [(record[2], record[4]) for record in tracer.records()] == [(1, OP_READ_BYTE_DATA), (2, OP_WRITE_BYTE_DATA)]
+
+    pool.setTracer(None)
+    before.read_byte_data(0x20, 0x00)
+    assert len(tracer) == 2
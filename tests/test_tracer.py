@@ -0,0 +1,67 @@
+"""I2C transaction tracer."""
+
+import pytest
+
+from custom_components.mcp23017.tracer import (
+    OP_READ_BLOCK,
+    OP_WRITE_BYTE_DATA,
+    TRACE_FORMAT_BINARY,
+    TRACE_FORMAT_CSV,
+    I2CTracer,
+    load_trace,
+    traced,
+)
+
+
+def fill(tracer, count):
+    for i in range(count):
+        tracer.record(100.0 + i, 0.0005, 1, 0x20 + i, OP_READ_BLOCK if i % 2 else OP_WRITE_BYTE_DATA, 0x12, 0, 5)
+
+
+def test_ring_keeps_newest():
+    tracer = I2CTracer(4)
+    fill(tracer, 6)
+    assert len(tracer) == 4
+    assert [record[3] for record in tracer.records()] == [0x22, 0x23, 0x24, 0x25]
+
+
+@pytest.mark.parametrize("trace_format", [TRACE_FORMAT_BINARY, TRACE_FORMAT_CSV])
+def test_dump_load_round_trip(tmp_path, trace_format):
+    tracer = I2CTracer(8)
+    fill(tracer, 10)
+    path = tmp_path / "trace"
+    assert tracer.dump(path, trace_format) == 8
+
+    loaded = load_trace(path)
+    records = tracer.records()
+    assert len(loaded) == len(records)
+    for record, expected in zip(loaded, records):
+        assert record[0] == pytest.approx(expected[0], abs=1e-6)
+        assert record[1] == pytest.approx(expected[1], abs=1e-6)
+        assert record[2:] == expected[2:]
+
+
+def test_load_unsupported_version(tmp_path):
+    tracer = I2CTracer(2)
+    fill(tracer, 1)
+    path = tmp_path / "trace.bin"
+    tracer.dump(path)
+    data = bytearray(path.read_bytes())
+    data[4] = 99
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        load_trace(path)
+
+
+def test_traced_records_errors():
+    tracer = I2CTracer(2)
+
+    def fail():
+        raise OSError(121, "Remote I/O error")
+
+    with pytest.raises(OSError):
+        traced(tracer, 1, 0x20, OP_READ_BLOCK, 0x12, 5, fail)
+    assert traced(tracer, 1, 0x21, OP_READ_BLOCK, 0x12, 5, lambda value: value, 7) == 7
+    (first, second) = tracer.records()
+    assert first[3:7] == (0x20, OP_READ_BLOCK, 0x12, 121)
+    assert second[3:7] == (0x21, OP_READ_BLOCK, 0x12, 0)